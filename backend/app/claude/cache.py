@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+
+# Campos que cambian entre peticiones sin que cambie el diseño (p. ej. URLs firmadas)
+VOLATILE_FRAME_FIELDS = frozenset({"image_url", "image_proxy_url", "image_status"})
+
+
+def _normalize(value: Any) -> Any:
+    # Quitar campos volátiles a cualquier profundidad para que el hash sólo dependa del diseño
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if k not in VOLATILE_FRAME_FIELDS}
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    return value
+
+
+def generation_cache_key(frame_data: Dict[str, Any], model: str, system_prompt: str, template_version: str) -> str:
+    """Hash estable del frame normalizado, el modelo y la versión de los prompts"""
+    payload = json.dumps(
+        {
+            "frame": _normalize(frame_data),
+            "model": model,
+            "template_version": template_version,
+            "system_prompt": hashlib.sha256(system_prompt.encode("utf-8")).hexdigest(),
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationCache:
+    """Caché persistente (SQLite) de componentes generados por Claude
+
+    Cada entrada guarda el resultado de `generate_component_code` bajo el hash
+    de su entrada. Las entradas caducan a los `ttl_seconds` y, si el total supera
+    `max_bytes`, se expulsan primero las usadas hace más tiempo.
+
+    Las operaciones son bloqueantes: llamar con asyncio.to_thread.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_bytes: int, enabled: bool = True):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "bypassed": 0,
+            "expired": 0,
+            "evictions": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "GenerationCache":
+        return cls(
+            path=os.getenv("CLAUDE_CACHE_PATH", os.path.join(".cache", "claude", "generations.sqlite3")),
+            ttl_seconds=float(os.getenv("CLAUDE_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+            max_bytes=int(float(os.getenv("CLAUDE_CACHE_MAX_MB", "256")) * 1024 * 1024),
+            enabled=os.getenv("CLAUDE_CACHE_ENABLED", "1") not in ("0", "false", "False"),
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS generations (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_generations_accessed ON generations (accessed_at)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Resultado guardado para `key`, o None si no existe o ha caducado"""
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute("SELECT result, created_at FROM generations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            if now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+                conn.commit()
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            conn.execute("UPDATE generations SET accessed_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+            conn.commit()
+            self.stats["hits"] += 1
+        try:
+            return json.loads(row[0])
+        except ValueError:
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """Guardar un resultado y aplicar el presupuesto de tamaño"""
+        if not self.enabled:
+            return
+        raw = json.dumps(result, ensure_ascii=False)
+        size = len(raw.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO generations (key, result, size, created_at, accessed_at, hits) VALUES (?, ?, ?, ?, ?, 0)",
+                (key, raw, size, now, now),
+            )
+            self.stats["stores"] += 1
+            self._enforce_budget(conn, now)
+            conn.commit()
+
+    def record_bypass(self):
+        self.stats["bypassed"] += 1
+
+    def _enforce_budget(self, conn: sqlite3.Connection, now: float):
+        expired = conn.execute("DELETE FROM generations WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        self.stats["expired"] += max(expired, 0)
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Expulsar primero las menos usadas recientemente
+        for key, size in conn.execute("SELECT key, size FROM generations ORDER BY accessed_at ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM generations WHERE key = ?", (key,))
+            total -= size
+            self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM generations")
+            conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos/fallos y ocupación de la caché"""
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["enabled"] = self.enabled
+        stats["path"] = self.path
+        stats["ttl_seconds"] = self.ttl_seconds
+        stats["max_bytes"] = self.max_bytes
+        if self.enabled:
+            with self._lock:
+                entries, total = self._connection().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations"
+                ).fetchone()
+            stats["entries"] = entries
+            stats["bytes"] = total
+        return stats
+
+
+# Caché única por proceso
+generation_cache = GenerationCache.from_env()
@@ -1,14 +1,53 @@
-﻿import anthropic
-from typing import Dict, List, Any
+﻿from typing import Dict, List, Any
 import json
 import os
 
+from app.claude.distiller import estimate_tokens
+from app.claude.pool import claude_pool, error_headers, is_rate_limit_error, usage_from_response
+from app.claude.scheduler import claude_scheduler
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+MODEL = "claude-3-haiku-20240307"
+# Reintentos tras un 429 (el cliente compartido no reintenta por su cuenta)
+MAX_RETRIES = 3
+
 class ClaudeClient:
     def __init__(self, api_key: str):
         if not api_key or api_key == "your_claude_api_key_here":
             raise ValueError("❌ Claude API key requerido")
         
-        self.client = anthropic.Anthropic(api_key=api_key)
+        # Cliente asíncrono compartido: las llamadas no bloquean el event loop
+        self.client = claude_pool.get_client(api_key)
+    
+    async def _create_message(self, prompt: str, max_tokens: int):
+        """Llamada al modelo con el mismo control de límites que ClaudeAIService
+
+        Las cabeceras anthropic-ratelimit-* alimentan al planificador compartido y
+        un 429 bloquea las admisiones durante retry-after antes de reintentar.
+        """
+        attempt = 0
+        while True:
+            try:
+                async with claude_pool.slot(input_tokens=estimate_tokens(prompt), output_tokens=max_tokens, model=MODEL):
+                    raw_response = await self.client.messages.with_raw_response.create(
+                        model=MODEL,
+                        max_tokens=max_tokens,
+                        messages=[
+                            {"role": "user", "content": prompt}
+                        ]
+                    )
+                claude_scheduler.observe(raw_response.headers)
+                return raw_response.parse()
+            except Exception as api_error:
+                headers = error_headers(api_error)
+                claude_scheduler.observe(headers)
+                if not is_rate_limit_error(api_error) or attempt >= MAX_RETRIES:
+                    raise
+                wait_time = claude_scheduler.record_rate_limited(headers, attempt)
+                attempt += 1
+                logger.warning("⏳ Límite de tasa alcanzado. Reintentando en %.1f segundos (retry-after)...", wait_time)
         
     async def generate_stencil_component(self, component_data: Dict[str, Any], design_tokens: Dict[str, Any]) -> Dict[str, Any]:
         """Generar componente Stencil usando Claude"""
@@ -43,13 +82,8 @@ Genera SOLO el JSON, sin texto adicional.
 """
 
         try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=4000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            response = await self._create_message(prompt, 4000)
+            claude_pool.record_usage(usage_from_response(response), MODEL)
             
             # Extraer contenido
             content = response.content[0].text
@@ -102,13 +136,8 @@ RESPUESTA EN FORMATO JSON:
 """
 
         try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=2000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
+            response = await self._create_message(prompt, 2000)
+            claude_pool.record_usage(usage_from_response(response), MODEL)
             
             content = response.content[0].text
             
@@ -136,18 +165,12 @@ RESPUESTA EN FORMATO JSON:
     async def test_connection(self) -> Dict[str, Any]:
         """Probar conexión con Claude"""
         try:
-            response = self.client.messages.create(
-                model="claude-3-haiku-20240307",
-                max_tokens=100,
-                messages=[
-                    {"role": "user", "content": "Responde solo con: 'Conexión exitosa con Claude'"}
-                ]
-            )
+            response = await self._create_message("Responde solo con: 'Conexión exitosa con Claude'", 100)
             
             return {
                 "success": True,
                 "message": response.content[0].text,
-                "model": "claude-3-haiku-20240307"
+                "model": MODEL
             }
         except Exception as e:
             return {
@@ -0,0 +1,232 @@
+import json
+import math
+import os
+from typing import Dict, List, Any, Optional, Tuple
+
+from app.models.nodes import NodeTree
+
+# Presupuesto aproximado de tokens para el árbol del frame dentro del prompt
+DEFAULT_TOKEN_BUDGET = int(os.getenv("CLAUDE_PROMPT_TOKEN_BUDGET", "6000"))
+
+# Estimación local (sin llamar a la API): ~4 caracteres por token en JSON compacto
+CHARS_PER_TOKEN = 4
+
+FLOAT_DECIMALS = 2
+
+# Nodos cuya geometría no aporta al código: se conservan tipo, nombre y tamaño
+_SHAPE_TYPES = {"VECTOR", "BOOLEAN_OPERATION", "STAR", "LINE", "ELLIPSE", "REGULAR_POLYGON"}
+
+# Propiedades que se copian tal cual (redondeando números)
+_PLAIN_FIELDS = (
+    "characters", "layoutMode", "layoutWrap", "itemSpacing", "counterAxisSpacing",
+    "paddingLeft", "paddingRight", "paddingTop", "paddingBottom",
+    "primaryAxisAlignItems", "counterAxisAlignItems", "primaryAxisSizingMode", "counterAxisSizingMode",
+    "layoutAlign", "layoutGrow", "layoutPositioning", "layoutSizingHorizontal", "layoutSizingVertical",
+    "cornerRadius", "rectangleCornerRadii", "strokeWeight", "strokeAlign", "clipsContent",
+    "componentId", "componentProperties", "componentPropertyDefinitions",
+)
+
+_TEXT_STYLE_FIELDS = (
+    "fontFamily", "fontWeight", "fontSize", "lineHeightPx", "letterSpacing",
+    "textAlignHorizontal", "textAlignVertical", "textCase", "textDecoration", "italic",
+)
+
+
+def estimate_tokens(value: Any) -> int:
+    """Tokens aproximados de un valor serializado (o de un texto)"""
+    text = value if isinstance(value, str) else json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str)
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _round(value: Any) -> Any:
+    if isinstance(value, float):
+        rounded = round(value, FLOAT_DECIMALS)
+        return int(rounded) if rounded.is_integer() else rounded
+    if isinstance(value, dict):
+        return {k: _round(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_round(v) for v in value]
+    return value
+
+
+def _hex_color(color: Dict[str, Any], opacity: float = 1.0) -> str:
+    # Color de Figma (r, g, b, a en 0..1) a #RRGGBB o #RRGGBBAA
+    r, g, b = (max(0, min(255, round(color.get(ch, 0) * 255))) for ch in ("r", "g", "b"))
+    alpha = color.get("a", 1) * opacity
+    if alpha >= 0.999:
+        return f"#{r:02x}{g:02x}{b:02x}"
+    return f"#{r:02x}{g:02x}{b:02x}{max(0, min(255, round(alpha * 255))):02x}"
+
+
+def _paints(paints: List[Dict[str, Any]]) -> List[Any]:
+    result = []
+    for paint in paints or []:
+        if paint.get("visible") is False:
+            continue
+        paint_type = paint.get("type")
+        if paint_type == "SOLID" and paint.get("color"):
+            result.append(_hex_color(paint["color"], paint.get("opacity", 1)))
+        elif paint_type and paint_type.startswith("GRADIENT"):
+            result.append({
+                "type": paint_type,
+                "stops": [[_round(stop.get("position")), _hex_color(stop.get("color", {}))] for stop in paint.get("gradientStops", [])],
+            })
+        elif paint_type:
+            result.append(paint_type)
+    return result
+
+
+def _effects(effects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    result = []
+    for effect in effects or []:
+        if effect.get("visible") is False:
+            continue
+        compact = {"type": effect.get("type"), "radius": effect.get("radius")}
+        if effect.get("offset"):
+            compact["offset"] = [effect["offset"].get("x"), effect["offset"].get("y")]
+        if effect.get("spread"):
+            compact["spread"] = effect["spread"]
+        if effect.get("color"):
+            compact["color"] = _hex_color(effect["color"])
+        result.append(_round(compact))
+    return result
+
+
+def _size(tree: NodeTree, index: int) -> Optional[List[Any]]:
+    width, height = tree.boxes[index * 4 + 2], tree.boxes[index * 4 + 3]
+    if math.isnan(width) and math.isnan(height):
+        return None
+    return _round([None if math.isnan(width) else width, None if math.isnan(height) else height])
+
+
+def _compact_fields(tree: NodeTree, index: int) -> Dict[str, Any]:
+    """Propiedades de un nodo que influyen en el marcado y los estilos (sin hijos)"""
+    props = tree.props[index] or {}
+    node_type = tree.type_of(index)
+    compact: Dict[str, Any] = {"type": node_type, "name": tree.names[index]}
+    size = _size(tree, index)
+    if size:
+        compact["size"] = size
+
+    if node_type in _SHAPE_TYPES:
+        fills = _paints(props.get("fills"))
+        if fills:
+            compact["fills"] = fills
+        return compact
+
+    for field in _PLAIN_FIELDS:
+        value = props.get(field)
+        if value not in (None, "", [], {}):
+            compact[field] = _round(value)
+    if props.get("opacity") is not None and props["opacity"] < 1:
+        compact["opacity"] = _round(props["opacity"])
+
+    style = props.get("style")
+    if style:
+        compact["text"] = _round({k: style[k] for k in _TEXT_STYLE_FIELDS if style.get(k) not in (None, "")})
+    fills = _paints(props.get("fills"))
+    if fills:
+        compact["fills"] = fills
+    strokes = _paints(props.get("strokes"))
+    if strokes:
+        compact["strokes"] = strokes
+    effects = _effects(props.get("effects"))
+    if effects:
+        compact["effects"] = effects
+    if props.get("styles"):
+        compact["styleRefs"] = props["styles"]
+    return compact
+
+
+def _compact_node(
+    tree: NodeTree,
+    index: int,
+    depth: int,
+    max_depth: Optional[int],
+    fields: List[Optional[Dict[str, Any]]]
+) -> Optional[Dict[str, Any]]:
+    """Nodo de Figma reducido con sus hijos hasta `max_depth`
+
+    `fields` guarda por índice las propiedades ya reducidas, así los reintentos
+    con menos profundidad no vuelven a procesar cada nodo.
+    """
+    if tree.hidden[index]:
+        return None
+
+    own = fields[index]
+    if own is None:
+        own = fields[index] = _compact_fields(tree, index)
+    compact = dict(own)
+
+    if tree.type_of(index) in _SHAPE_TYPES or not tree.has_children(index):
+        return compact
+    if max_depth is not None and depth >= max_depth:
+        # Subárbol recortado por presupuesto: se indica cuánto se omitió
+        compact["omitted_descendants"] = tree.subtree_size(index) - 1
+        return compact
+
+    compact_children = []
+    for child in tree.children(index):
+        compact_child = _compact_node(tree, child, depth + 1, max_depth, fields)
+        if compact_child is None:
+            continue
+        # Hermanos idénticos consecutivos (listas, iconos repetidos) se agrupan
+        previous = compact_children[-1] if compact_children else None
+        if previous is not None and {k: v for k, v in previous.items() if k != "repeat"} == compact_child:
+            previous["repeat"] = previous.get("repeat", 1) + 1
+            continue
+        compact_children.append(compact_child)
+    if compact_children:
+        compact["children"] = compact_children
+    return compact
+
+
+def distill_frame(frame_data: Dict[str, Any], token_budget: Optional[int] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Representación compacta de un frame para el prompt y estadísticas de la reducción
+
+    Usa `raw_data` (nodo completo de Figma) como única fuente del árbol, así los
+    hijos no se envían dos veces. Elimina geometría (transformaciones, paths,
+    datos de plugins), convierte colores a hex y redondea decimales. Si el
+    resultado supera `token_budget`, recorta primero los niveles más profundos.
+    El árbol se recorre como NodeTree: recuentos y profundidades salen de sus
+    columnas en lugar de recorrer el JSON en cada intento.
+    """
+    token_budget = DEFAULT_TOKEN_BUDGET if token_budget is None else token_budget
+    node = frame_data.get("raw_data") or {
+        "type": frame_data.get("type"),
+        "name": frame_data.get("name"),
+        "absoluteBoundingBox": {"width": frame_data.get("width"), "height": frame_data.get("height")},
+        "children": frame_data.get("children", []),
+        "layoutMode": frame_data.get("layout"),
+        "effects": frame_data.get("effects", []),
+    }
+    tree = NodeTree.of(node)
+
+    fields: List[Optional[Dict[str, Any]]] = [None] * len(tree)
+
+    tree_depth = tree.max_depth()
+    max_depth: Optional[int] = None
+    distilled = _compact_node(tree, 0, 0, max_depth, fields) or {}
+    tokens_after = estimate_tokens(distilled)
+    # Recortar niveles desde el fondo hasta entrar en el presupuesto (siempre queda el primer nivel)
+    while token_budget and tokens_after > token_budget and (max_depth is None or max_depth > 1):
+        max_depth = (tree_depth if max_depth is None else max_depth) - 1
+        distilled = _compact_node(tree, 0, 0, max_depth, fields) or {}
+        tokens_after = estimate_tokens(distilled)
+
+    if frame_data.get("background_color") and "fills" not in distilled:
+        distilled["background"] = _hex_color(frame_data["background_color"])
+
+    stats = {
+        # Lo que ocupaba antes el frame completo (children y raw_data); se estima con el
+        # volcado compacto: con indent json.dumps usa el codificador en Python puro
+        "tokens_before": estimate_tokens(frame_data),
+        "tokens_after": tokens_after,
+        "token_budget": token_budget,
+        "nodes": len(tree),
+        "depth": tree_depth,
+        "depth_kept": max_depth or tree_depth,
+        "truncated": max_depth is not None,
+        "estimated": True,
+    }
+    return distilled, stats
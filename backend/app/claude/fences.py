@@ -0,0 +1,72 @@
+import re
+from typing import List, Optional, Tuple
+
+# Primera línea de un bloque tsx que indica que es el archivo de Storybook
+_STORY_HEADER = re.compile(r"^//\s*(.*\.stories\.tsx|Storybook)\s*$")
+
+
+class FenceParser:
+    """Extrae bloques de código ``` de un texto que llega por fragmentos
+
+    Emite cada bloque en cuanto se cierra su fence, clasificado igual que
+    `ClaudeAIService._extract_code_blocks`: html, css, tsx (primer bloque
+    tsx/typescript) y story (bloque marcado como Storybook o segundo tsx).
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._lang: Optional[str] = None
+        self._lines: List[str] = []
+        self.emitted: List[str] = []
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """Procesar un fragmento; devuelve los bloques (tipo, código) completados"""
+        self._pending += text
+        blocks = []
+        # Sólo se procesan líneas completas; el resto espera al siguiente fragmento
+        while "\n" in self._pending:
+            line, self._pending = self._pending.split("\n", 1)
+            block = self._feed_line(line)
+            if block is not None:
+                blocks.append(block)
+        return blocks
+
+    def finish(self) -> List[Tuple[str, str]]:
+        """Procesar la última línea (sin salto final) al terminar el stream"""
+        if not self._pending:
+            return []
+        line, self._pending = self._pending, ""
+        block = self._feed_line(line)
+        return [block] if block is not None else []
+
+    def _feed_line(self, line: str) -> Optional[Tuple[str, str]]:
+        stripped = line.strip()
+        if self._lang is None:
+            if stripped.startswith("```") and len(stripped) > 3:
+                self._lang = stripped[3:].strip().lower()
+                self._lines = []
+            return None
+        if stripped == "```":
+            lang, lines = self._lang, self._lines
+            self._lang, self._lines = None, []
+            kind = self._classify(lang, lines)
+            if kind is None or kind in self.emitted:
+                return None
+            if kind == "story" and lines and _STORY_HEADER.match(lines[0].strip()):
+                # Como en _extract_code_blocks, la línea de cabecera no forma parte del código
+                lines = lines[1:]
+            self.emitted.append(kind)
+            return kind, "\n".join(lines)
+        self._lines.append(line)
+        return None
+
+    def _classify(self, lang: str, lines: List[str]) -> Optional[str]:
+        if lang in ("html", "css"):
+            return lang
+        if lang == "storybook":
+            return "story"
+        if lang in ("tsx", "typescript"):
+            if lines and _STORY_HEADER.match(lines[0].strip()):
+                return "story"
+            return "tsx" if "tsx" not in self.emitted else "story"
+        return None
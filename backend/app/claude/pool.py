@@ -0,0 +1,159 @@
+import anthropic
+import asyncio
+import httpx
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+from app.claude.scheduler import claude_scheduler
+from app.metrics import claude_calls, claude_in_flight, claude_latency, claude_tokens
+
+
+def error_headers(error: Exception) -> Optional[Any]:
+    """Cabeceras HTTP de un error de la API (APIStatusError lleva la respuesta)"""
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Si un error de la API es un límite de tasa (429)"""
+    # Sólo el tipo o el status HTTP: un "429" en el texto de otro error no es un límite de tasa
+    return isinstance(error, anthropic.RateLimitError) or getattr(error, "status_code", None) == 429
+
+
+def usage_from_response(response: Any) -> Dict[str, int]:
+    """Tokens de entrada/salida y de caché (lectura/escritura) de una respuesta"""
+    usage = getattr(response, "usage", None)
+    return {
+        field: int(getattr(usage, field, 0) or 0)
+        for field in ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+    }
+
+
+class ClaudeClientPool:
+    """Cliente asíncrono de Anthropic compartido por todo el proceso
+
+    Un único `AsyncAnthropic` por API key reutiliza el pool de conexiones httpx,
+    así las llamadas al modelo no bloquean el event loop ni consumen un hilo
+    cada una. Un semáforo limita cuántas llamadas pueden estar en vuelo a la vez.
+    """
+
+    def __init__(self):
+        self.settings = self._load_settings()
+        self._clients: Dict[str, anthropic.AsyncAnthropic] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.stats = {
+            "calls_started": 0,
+            "calls_finished": 0,
+            "calls_failed": 0,
+            "in_flight": 0,
+            "waiting": 0,
+            "max_wait_ms": 0.0,
+        }
+        # Tokens acumulados (incluye lectura/escritura del prompt caching)
+        self.usage = {
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0,
+        }
+
+    @staticmethod
+    def _load_settings() -> Dict[str, Any]:
+        # Configuración (sobrescribible desde variables de entorno)
+        return {
+            "max_in_flight": int(os.getenv("CLAUDE_MAX_IN_FLIGHT", "8")),
+            "max_connections": int(os.getenv("CLAUDE_MAX_CONNECTIONS", "20")),
+            "max_keepalive_connections": int(os.getenv("CLAUDE_MAX_KEEPALIVE", "10")),
+            "timeout": float(os.getenv("CLAUDE_TIMEOUT", "120")),
+        }
+
+    def get_client(self, api_key: str) -> anthropic.AsyncAnthropic:
+        """Cliente compartido para una API key (se crea la primera vez)"""
+        client = self._clients.get(api_key)
+        if client is None:
+            settings = self.settings
+            client = anthropic.AsyncAnthropic(
+                api_key=api_key,
+                # Los reintentos los gestiona ClaudeAIService según el tipo de error
+                max_retries=0,
+                timeout=settings["timeout"],
+                http_client=anthropic.DefaultAsyncHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=settings["max_connections"],
+                        max_keepalive_connections=settings["max_keepalive_connections"],
+                    ),
+                    timeout=settings["timeout"],
+                ),
+            )
+            self._clients[api_key] = client
+        return client
+
+    @asynccontextmanager
+    async def slot(self, input_tokens: int = 0, output_tokens: int = 0, model: str = "unknown"):
+        """Reservar un hueco de llamada en vuelo (espera si se alcanzó el límite)
+
+        Después de obtener el hueco, el planificador de límites de la API decide
+        cuándo puede salir la llamada según los tokens estimados. La duración y
+        el resultado de la llamada se registran en las métricas de `model`.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.settings["max_in_flight"])
+        queued = time.perf_counter()
+        self.stats["waiting"] += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.stats["waiting"] -= 1
+        try:
+            await claude_scheduler.admit(input_tokens, output_tokens)
+        except BaseException:
+            self._semaphore.release()
+            raise
+        wait_ms = (time.perf_counter() - queued) * 1000
+        self.stats["max_wait_ms"] = round(max(self.stats["max_wait_ms"], wait_ms), 1)
+        self.stats["calls_started"] += 1
+        self.stats["in_flight"] += 1
+        claude_in_flight.inc()
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            yield
+            self.stats["calls_finished"] += 1
+        except BaseException as error:
+            self.stats["calls_failed"] += 1
+            status = str(getattr(error, "status_code", None) or type(error).__name__)
+            raise
+        finally:
+            self.stats["in_flight"] -= 1
+            self._semaphore.release()
+            claude_in_flight.dec()
+            claude_latency.observe(time.perf_counter() - started, model)
+            claude_calls.inc(model, status)
+
+    def record_usage(self, usage: Dict[str, int], model: str = "unknown"):
+        """Sumar el uso de tokens de una respuesta a los totales del proceso"""
+        for field in self.usage:
+            tokens = usage.get(field, 0) or 0
+            self.usage[field] += tokens
+            if tokens:
+                claude_tokens.inc(model, field.replace("_input_tokens", "").replace("_tokens", ""), amount=tokens)
+
+    async def close(self):
+        """Cerrar las conexiones de todos los clientes"""
+        for client in self._clients.values():
+            await client.close()
+        self._clients = {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._clients),
+            "settings": dict(self.settings),
+            "stats": dict(self.stats),
+            "usage": dict(self.usage),
+        }
+
+
+# Pool único por proceso
+claude_pool = ClaudeClientPool()
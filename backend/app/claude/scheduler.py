@@ -0,0 +1,215 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, Tuple
+
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+# Presupuestos que Anthropic informa en las cabeceras anthropic-ratelimit-{nombre}-{limit,remaining,reset}
+_BUDGETS = ("requests", "tokens", "input-tokens", "output-tokens")
+
+
+def _parse_reset(value: Optional[str]) -> Optional[float]:
+    # Fecha RFC 3339 de la cabecera -> instante en time.monotonic()
+    if not value:
+        return None
+    try:
+        reset = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if reset.tzinfo is None:
+        reset = reset.replace(tzinfo=timezone.utc)
+    return time.monotonic() + max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class RateLimitScheduler:
+    """Planificador compartido de llamadas a Claude según los límites de la API
+
+    Lleva la cuenta de peticiones y tokens restantes a partir de las cabeceras
+    de cada respuesta y descuenta localmente lo que reserva cada llamada admitida.
+    Como en la API, cada presupuesto se repone de forma continua (`limit` por
+    `window_seconds`) y está completo en el instante `reset` de la cabecera.
+    Las llamadas se admiten de una en una en orden de llegada (FIFO): si el
+    presupuesto no alcanza, la primera de la cola espera hasta el reset que
+    indica la API y las demás esperan detrás. Tras un 429 se respeta
+    `retry-after` para todo el proceso, no sólo para la petición que lo recibió.
+    """
+
+    def __init__(self, reserve_fraction: float, max_wait_seconds: float, fallback_delay: float, window_seconds: float = 60.0):
+        self.reserve_fraction = reserve_fraction
+        self.window_seconds = window_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.fallback_delay = fallback_delay
+        # nombre -> {"limit", "remaining", "observed_at", "reset_at"}
+        self._budgets: Dict[str, Dict[str, Optional[float]]] = {}
+        self._blocked_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.stats = {
+            "admitted": 0,
+            "queue_depth": 0,
+            "max_queue_depth": 0,
+            "waited": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+            "rate_limited": 0,
+            "last_retry_after_s": None,
+            "wait_reasons": {},
+        }
+
+    @classmethod
+    def from_env(cls) -> "RateLimitScheduler":
+        return cls(
+            reserve_fraction=float(os.getenv("CLAUDE_RATE_RESERVE_FRACTION", "0.05")),
+            max_wait_seconds=float(os.getenv("CLAUDE_RATE_MAX_WAIT_SECONDS", "60")),
+            fallback_delay=float(os.getenv("CLAUDE_RETRY_BASE_DELAY", "5")),
+            window_seconds=float(os.getenv("CLAUDE_RATE_WINDOW_SECONDS", "60")),
+        )
+
+    # --- Admisión ------------------------------------------------------------
+
+    def _needs(self, input_tokens: int, output_tokens: int) -> Dict[str, int]:
+        return {
+            "requests": 1,
+            "tokens": input_tokens + output_tokens,
+            "input-tokens": input_tokens,
+            "output-tokens": output_tokens,
+        }
+
+    def _available(self, budget: Dict[str, Optional[float]], now: float) -> Optional[float]:
+        # Presupuesto disponible ahora, contando la reposición desde la última observación
+        remaining, limit = budget.get("remaining"), budget.get("limit")
+        if remaining is None:
+            return None
+        reset_at = budget.get("reset_at")
+        if limit and reset_at is not None and reset_at <= now:
+            return float(limit)
+        if not limit:
+            return remaining
+        refill = (now - budget["observed_at"]) * limit / self.window_seconds
+        return min(float(limit), remaining + refill)
+
+    def _required_wait(self, needs: Dict[str, int]) -> Tuple[float, Optional[str]]:
+        now = time.monotonic()
+        if self._blocked_until > now:
+            return self._blocked_until - now, "retry_after"
+        wait, reason = 0.0, None
+        for name, budget in self._budgets.items():
+            available = self._available(budget, now)
+            if available is None:
+                continue
+            limit = budget.get("limit")
+            need = min(needs.get(name, 0), limit) if limit else needs.get(name, 0)
+            reserve = (limit or 0) * self.reserve_fraction
+            deficit = need + reserve - available
+            if deficit <= 0:
+                continue
+            reset_at = budget.get("reset_at")
+            candidates = []
+            if limit:
+                candidates.append(deficit * self.window_seconds / limit)
+            if reset_at is not None and reset_at > now:
+                candidates.append(reset_at - now)
+            if candidates and min(candidates) > wait:
+                wait, reason = min(candidates), name
+        return wait, reason
+
+    async def admit(self, input_tokens: int = 0, output_tokens: int = 0) -> float:
+        """Esperar turno hasta que haya presupuesto; devuelve los ms esperados"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        needs = self._needs(input_tokens, output_tokens)
+        queued = time.perf_counter()
+        self.stats["queue_depth"] += 1
+        self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.stats["queue_depth"])
+        try:
+            # asyncio.Lock despierta a los que esperan en orden de llegada
+            async with self._lock:
+                while True:
+                    wait, reason = self._required_wait(needs)
+                    if wait <= 0:
+                        break
+                    reasons = self.stats["wait_reasons"]
+                    reasons[reason] = reasons.get(reason, 0) + 1
+                    logger.warning("⏳ Esperando %.1fs por el límite de la API de Claude (%s)", wait, reason)
+                    await asyncio.sleep(min(wait, self.max_wait_seconds))
+                now = time.monotonic()
+                for name, budget in self._budgets.items():
+                    available = self._available(budget, now)
+                    if available is not None:
+                        budget["remaining"] = available - needs.get(name, 0)
+                        budget["observed_at"] = now
+                        if budget.get("reset_at") is not None and budget["reset_at"] <= now:
+                            # Reset ya pasado: a partir de aquí sólo cuenta la reposición continua
+                            budget["reset_at"] = None
+        finally:
+            self.stats["queue_depth"] -= 1
+        waited_ms = (time.perf_counter() - queued) * 1000
+        self.stats["admitted"] += 1
+        if waited_ms >= 1:
+            self.stats["waited"] += 1
+        self.stats["total_wait_ms"] = round(self.stats["total_wait_ms"] + waited_ms, 1)
+        self.stats["max_wait_ms"] = round(max(self.stats["max_wait_ms"], waited_ms), 1)
+        return waited_ms
+
+    # --- Información de la API -----------------------------------------------
+
+    def observe(self, headers: Any):
+        """Actualizar los presupuestos con las cabeceras de una respuesta (o de un error)"""
+        if headers is None:
+            return
+        for name in _BUDGETS:
+            prefix = f"anthropic-ratelimit-{name}-"
+            remaining = _parse_int(headers.get(prefix + "remaining"))
+            if remaining is None:
+                continue
+            self._budgets[name] = {
+                "limit": _parse_int(headers.get(prefix + "limit")),
+                "remaining": float(remaining),
+                "observed_at": time.monotonic(),
+                "reset_at": _parse_reset(headers.get(prefix + "reset")),
+            }
+
+    def record_rate_limited(self, headers: Any = None, attempt: int = 0) -> float:
+        """Registrar un 429: bloquear nuevas admisiones durante `retry-after` (o un retroceso exponencial)"""
+        self.observe(headers)
+        self.stats["rate_limited"] += 1
+        retry_after = None
+        if headers is not None:
+            try:
+                retry_after = float(headers.get("retry-after"))
+            except (TypeError, ValueError):
+                retry_after = None
+        if retry_after is None:
+            retry_after = self.fallback_delay * (2 ** attempt)
+        self.stats["last_retry_after_s"] = retry_after
+        self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        return retry_after
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        budgets = {
+            name: {
+                "limit": budget.get("limit"),
+                "available": round(self._available(budget, now), 1) if budget.get("remaining") is not None else None,
+                "reset_in_s": round(max(0.0, budget["reset_at"] - now), 1) if budget.get("reset_at") else None,
+            }
+            for name, budget in self._budgets.items()
+        }
+        stats = dict(self.stats, wait_reasons=dict(self.stats["wait_reasons"]))
+        stats["blocked_for_s"] = round(max(0.0, self._blocked_until - now), 1)
+        stats["budgets"] = budgets
+        return stats
+
+
+# Planificador único por proceso
+claude_scheduler = RateLimitScheduler.from_env()
@@ -1,45 +1,27 @@
 import os
-from typing import Dict, Any
+from typing import Dict, List, Any, AsyncIterator, Optional, Tuple
 import json
-import anthropic
 import asyncio
 import re
 import time
 
-class ClaudeAIService:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        # Corregir la inicialización del cliente Anthropic (eliminar argumentos no soportados)
-        self.client = anthropic.Anthropic(api_key=api_key)
-        self.model = "claude-3-sonnet-20240229"  # Modelo más estable y disponible para análisis de diseño
-    
-    async def generate_component_code(self, frame_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Generar código de componente basado en datos del frame de Figma"""
-        try:
-            print(f"🤖 Generando código para componente: {frame_data.get('name')}")
-            
-            # Crear un prompt bien estructurado
-            prompt = self._create_component_prompt(frame_data)
-            
-            # Configuración de reintentos
-            max_retries = 3
-            retry_count = 0
-            base_delay = 5  # segundos
-            
-            while retry_count <= max_retries:
-                try:
-                    print(f"🔄 Intento {retry_count + 1}/{max_retries + 1} de llamada a Claude API...")
-                    
-                    # Registrar el modelo que se va a usar
-                    print(f"🤖 Utilizando modelo: {self.model}")
-                    
-                    # Usar el método correcto de la API más reciente de Anthropic
-                    response = await asyncio.to_thread(
-                        self.client.messages.create,
-                        model=self.model,
-                        max_tokens=4000,
-                        temperature=0,
-                        system="""# System Prompt: Conversión de Figma a Web Components con StencilJS (apps bancarias)
+from app.claude.cache import generation_cache, generation_cache_key
+from app.claude.distiller import DEFAULT_TOKEN_BUDGET, distill_frame, estimate_tokens
+from app.claude.fences import FenceParser
+from app.claude.pool import claude_pool, error_headers, is_rate_limit_error, usage_from_response
+from app.claude.scheduler import claude_scheduler
+from app.figma.tokens import tokens_to_css
+from app.generators.stencil import GENERATOR_VERSION
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+# Versión de la plantilla del prompt de usuario; incrementarla invalida la caché de generaciones
+PROMPT_TEMPLATE_VERSION = "3"
+# Versión de la sección del esqueleto (modo "skeleton"); sólo invalida esas generaciones
+SKELETON_PROMPT_VERSION = "2"
+
+SYSTEM_PROMPT = """# System Prompt: Conversión de Figma a Web Components con StencilJS (apps bancarias)
 
 Rol
 Actúas como Senior Frontend Engineer especializado/a en StencilJS, HTML5, CSS y Storybook. Tu objetivo es transformar componentes del sistema de diseño en Figma en Web Components listos para producción para aplicaciones bancarias.
@@ -110,46 +92,228 @@ Notas opcionales (ajusta según tu contexto)
 - Navegadores objetivo: define versiones mínimas (ej.: Chrome 109+, Safari 16+, iOS 16+, Firefox ESR, Edge 109+).
 - Naming de tokens: alias (--ds-color-bg), ref (--ds-ref-gray-100); documenta sobreescrituras por tema.
 - SemVer y deprecación: comunica breaking changes en CHANGELOG y periodo de deprecación.
-- CI: build, test, e2e, a11y, revisión de tamaño de bundle y lint (ESLint/Prettier/Stylelint).""",
-                        messages=[
-                            {"role": "user", "content": prompt}
-                        ]
-                    )
+- CI: build, test, e2e, a11y, revisión de tamaño de bundle y lint (ESLint/Prettier/Stylelint)."""
+
+# Instrucciones fijas de la tarea; van en el prompt de sistema para formar parte del prefijo cacheable
+COMPONENT_TASK_INSTRUCTIONS = """# Tarea: Convertir diseños de Figma a componentes Stencil
+
+Para cada componente de Figma que se te envíe, proporciona el código para implementar el diseño como un componente web utilizando Stencil.js, con los siguientes entregables:
+
+1. **HTML Base**: El HTML básico que representa la estructura del componente
+2. **CSS**: Los estilos CSS completos y detallados
+3. **Componente Stencil**: El código TypeScript completo para el componente Stencil
+4. **Storybook**: Un archivo de Storybook para mostrar el componente con sus diferentes estados/propiedades
+
+Asegúrate de:
+- Usar nomenclatura BEM para las clases CSS
+- Crear un componente reutilizable y con propiedades configurables
+- Implementar estados (normal, hover, focus, disabled) cuando sea apropiado
+- Hacer el componente responsive y accesible
+- Incluir comentarios explicativos en el código
+
+Proporciona cada bloque de código con sus marcadores de lenguaje correspondientes. Por ejemplo:
+
+```html
+<!-- Código HTML aquí -->
+```
+
+```css
+/* Estilos CSS aquí */
+```
+
+```tsx
+// Componente Stencil aquí
+```
+
+```tsx
+// Archivo Storybook aquí
+```
+"""
+
+# Máximo de tokens de salida por generación (también es lo que se reserva del límite de salida)
+MAX_OUTPUT_TOKENS = 4000
+
+# Prompt caching de Anthropic para los bloques estáticos (desactivar con CLAUDE_PROMPT_CACHING=0)
+PROMPT_CACHING_ENABLED = os.getenv("CLAUDE_PROMPT_CACHING", "1") not in ("0", "false", "False")
+
+# Límite de estilos/componentes del archivo que se incluyen en el preámbulo del sistema de diseño
+DESIGN_PREAMBLE_MAX_ITEMS = int(os.getenv("CLAUDE_DESIGN_PREAMBLE_MAX_ITEMS", "200"))
+
+
+def build_design_system_preamble(comp_styles: Optional[Dict[str, Any]]) -> Optional[str]:
+    """Resumen estable (ordenado) de design tokens, estilos y componentes publicados de un archivo
+
+    Acepta el resultado de `FigmaClient.get_design_tokens` (tokens + listado)
+    o el de `get_file_components_and_styles` (sólo listado). Es igual para
+    todas las generaciones del mismo archivo, así que se envía como bloque
+    cacheable justo después de las instrucciones fijas.
+    """
+    if not comp_styles or not comp_styles.get("success"):
+        return None
+    tokens = comp_styles.get("tokens") or {}
+    styles = sorted(
+        comp_styles.get("styles") or [],
+        key=lambda style: (style.get("style_type") or "", style.get("name") or "")
+    )[:DESIGN_PREAMBLE_MAX_ITEMS]
+    components = sorted(
+        comp_styles.get("components") or [],
+        key=lambda component: component.get("name") or ""
+    )[:DESIGN_PREAMBLE_MAX_ITEMS]
+    has_tokens = any(tokens.get(category) for category in tokens)
+    if not styles and not components and not has_tokens:
+        return None
+    lines = ["# Sistema de diseño del archivo", "", "Reutiliza estos estilos y componentes publicados cuando el frame los use.", ""]
+    if has_tokens:
+        lines.append("## Design tokens")
+        lines.append("Usa estas variables CSS en lugar de valores literales cuando un valor del frame coincida:")
+        lines.append("```css")
+        lines.append(tokens_to_css(tokens, DESIGN_PREAMBLE_MAX_ITEMS))
+        lines.append("```")
+        lines.append("")
+    if styles:
+        lines.append("## Estilos")
+        for style in styles:
+            description = f" — {style['description']}" if style.get("description") else ""
+            lines.append(f"- [{style.get('style_type')}] {style.get('name')}{description}")
+        lines.append("")
+    if components:
+        lines.append("## Componentes")
+        for component in components:
+            description = f" — {component['description']}" if component.get("description") else ""
+            lines.append(f"- {component.get('name')}{description}")
+    return "\n".join(lines).strip()
+
+
+def build_system_blocks(design_preamble: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Bloques del prompt de sistema, de más estático a menos
+
+    1. Prompt de sistema + instrucciones de la tarea (iguales en todas las llamadas)
+    2. Preámbulo del sistema de diseño del archivo (igual para todo un lote)
+    Cada bloque marca el final de un prefijo cacheable; el frame va después, en el mensaje.
+    """
+    cache_control = {"cache_control": {"type": "ephemeral"}} if PROMPT_CACHING_ENABLED else {}
+    blocks = [
+        {"type": "text", "text": SYSTEM_PROMPT},
+        {"type": "text", "text": COMPONENT_TASK_INSTRUCTIONS, **cache_control},
+    ]
+    if design_preamble:
+        blocks.append({"type": "text", "text": design_preamble, **cache_control})
+    return blocks
+
+
+class ClaudeAIService:
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        # Cliente asíncrono compartido (pool de conexiones y límite de llamadas en vuelo)
+        self.client = claude_pool.get_client(api_key)
+        self.model = "claude-3-sonnet-20240229"  # Modelo más estable y disponible para análisis de diseño
+        # Presupuesto aproximado de tokens del frame dentro del prompt (CLAUDE_PROMPT_TOKEN_BUDGET)
+        self.token_budget = DEFAULT_TOKEN_BUDGET
+    
+    async def generate_component_code(
+        self,
+        frame_data: Dict[str, Any],
+        force_regenerate: bool = False,
+        design_preamble: Optional[str] = None,
+        skeleton: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Generar código de componente basado en datos del frame de Figma
+
+        Si el mismo frame (sin campos volátiles como `image_url`) ya se generó con
+        el mismo modelo y prompts, se devuelve el resultado guardado salvo que se
+        pida `force_regenerate`. `design_preamble` (ver build_design_system_preamble)
+        se envía como bloque de sistema cacheable.
+
+        `skeleton` (bloques html/css/tsx/story del generador por reglas) se envía
+        como base a completar. El modelo devuelve siempre TSX, HTML y Storybook (deben
+        coincidir con las props y slots del TSX); sólo el CSS se toma del esqueleto si
+        no lo devuelve.
+        """
+        try:
+            system_blocks = build_system_blocks(design_preamble)
+            system_text = "\n\n".join(block["text"] for block in system_blocks)
+            model_requested = self.model
+            template_version = self._template_version(skeleton)
+            cache_key = generation_cache_key(frame_data, model_requested, system_text, template_version)
+            cached = await self._cached_result(cache_key, frame_data, force_regenerate)
+            if cached is not None:
+                return cached
+            
+            logger.info("🤖 Generando código para componente: %s", frame_data.get('name'))
+            
+            # Crear un prompt bien estructurado (con el frame en formato compacto)
+            # Fuera del event loop: destilar un frame grande tarda en proporción a su tamaño
+            prompt, prompt_stats = await asyncio.to_thread(self._create_component_prompt, frame_data, skeleton)
+            logger.info("✂️ Frame reducido para el prompt: ~%s -> ~%s tokens%s",
+                        prompt_stats['tokens_before'], prompt_stats['tokens_after'],
+                        ' (recortado por presupuesto)' if prompt_stats['truncated'] else '')
+            
+            # Configuración de reintentos (las esperas tras un 429 las decide el planificador compartido)
+            max_retries = 3
+            retry_count = 0
+            estimated_input = estimate_tokens(system_text) + estimate_tokens(prompt)
+            
+            while retry_count <= max_retries:
+                try:
+                    logger.info("🔄 Intento %s/%s de llamada a Claude API...", retry_count + 1, max_retries + 1)
+                    
+                    # Registrar el modelo que se va a usar
+                    logger.info("🤖 Utilizando modelo: %s", self.model)
+                    
+                    # Llamada asíncrona: no bloquea el event loop mientras el modelo responde
+                    async with claude_pool.slot(input_tokens=estimated_input, output_tokens=MAX_OUTPUT_TOKENS, model=self.model):
+                        raw_response = await self.client.messages.with_raw_response.create(
+                            model=self.model,
+                            max_tokens=MAX_OUTPUT_TOKENS,
+                            temperature=0,
+                            system=system_blocks,
+                            messages=[
+                                {"role": "user", "content": prompt}
+                            ]
+                        )
+                    # Presupuestos restantes según las cabeceras anthropic-ratelimit-*
+                    claude_scheduler.observe(raw_response.headers)
+                    response = raw_response.parse()
                     
                     # Si llegamos aquí, la llamada fue exitosa
                     # Extraer y estructurar la respuesta
                     content = response.content[0].text
-                    print(f"✅ Código generado exitosamente ({len(content)} caracteres)")
+                    usage = usage_from_response(response)
+                    claude_pool.record_usage(usage, self.model)
+                    logger.info("✅ Código generado exitosamente (%s caracteres) | tokens entrada %s, caché leídos %s, caché escritos %s",
+                                len(content), usage['input_tokens'], usage['cache_read_input_tokens'], usage['cache_creation_input_tokens'])
                     
                     # Intentar extraer los bloques de código
                     code_blocks = self._extract_code_blocks(content)
+                    if skeleton and not code_blocks.get("css"):
+                        # CSS que el modelo dio por bueno: se usa el del esqueleto
+                        code_blocks["css"] = skeleton.get("css", "")
                     
-                    return {
-                        "success": True,
-                        "component_name": frame_data.get('name', 'Component'),
-                        "html_code": code_blocks.get("html", ""),
-                        "css_code": code_blocks.get("css", ""),
-                        "stencil_code": code_blocks.get("tsx", ""),
-                        "storybook_code": code_blocks.get("story", ""),
-                        "full_response": content
-                    }
+                    result = self._build_result(frame_data, content, code_blocks, prompt_stats, usage)
+                    # Si hubo cambio de modelo durante los reintentos, guardar bajo el modelo usado
+                    if self.model != model_requested:
+                        cache_key = generation_cache_key(frame_data, self.model, system_text, template_version)
+                    await self._store_result(cache_key, result)
+                    return dict(result, cache="bypass" if force_regenerate else "miss")
                     
                 except Exception as api_error:
                     # Convertir el error a string para análisis
                     error_msg = str(api_error)
-                    print(f"❌ Error en la llamada a la API de Claude: {error_msg}")
+                    logger.error("❌ Error en la llamada a la API de Claude: %s", error_msg)
+                    headers = error_headers(api_error)
+                    claude_scheduler.observe(headers)
                     
                     # Verificar si es un error de modelo no encontrado (404)
                     if "not_found_error" in error_msg and "model:" in error_msg:
-                        print(f"❌ Error: Modelo no disponible: {error_msg}")
+                        logger.error("❌ Error: Modelo no disponible: %s", error_msg)
                         # Intentar cambiar a un modelo alternativo disponible
                         if self.model == "claude-3-opus-20240229":
-                            print("🔄 Cambiando al modelo claude-3-sonnet-20240229...")
+                            logger.info("🔄 Cambiando al modelo claude-3-sonnet-20240229...")
                             self.model = "claude-3-sonnet-20240229"
                             retry_count += 1
                             continue
                         elif self.model == "claude-3-sonnet-20240229":
-                            print("🔄 Cambiando al modelo claude-3-haiku-20240307...")
+                            logger.info("🔄 Cambiando al modelo claude-3-haiku-20240307...")
                             self.model = "claude-3-haiku-20240307"
                             retry_count += 1
                             continue
@@ -160,24 +324,24 @@ Notas opcionales (ajusta según tu contexto)
                             }
                     
                     # Verificar si es un error de límite de tasa (429)
-                    elif "rate_limit_error" in error_msg or "429" in error_msg:
+                    elif is_rate_limit_error(api_error):
                         retry_count += 1
+                        # Bloquea las admisiones de todo el proceso durante retry-after
+                        wait_time = claude_scheduler.record_rate_limited(headers, retry_count - 1)
                         if retry_count > max_retries:
-                            print(f"❌ Error de límite de tasa después de {max_retries} intentos: {error_msg}")
+                            logger.error("❌ Error de límite de tasa después de %s intentos: %s", max_retries, error_msg)
                             return {
                                 "success": False,
                                 "error": f"Error de límite de tasa en la API de Claude. Por favor, inténtalo más tarde o reduce la cantidad de solicitudes.",
                                 "rate_limited": True
                             }
                         
-                        # Calcular tiempo de espera con retroceso exponencial
-                        wait_time = base_delay * (2 ** (retry_count - 1))
-                        print(f"⏳ Límite de tasa alcanzado. Esperando {wait_time} segundos antes de reintentar...")
-                        await asyncio.sleep(wait_time)
+                        # La siguiente admisión en claude_pool.slot espera lo indicado por la API
+                        logger.warning("⏳ Límite de tasa alcanzado. Reintentando en %.1f segundos (retry-after)...", wait_time)
                         continue
                     # Verificar si es un error de crédito insuficiente
                     elif "credit balance is too low" in error_msg or "credit balance too low" in error_msg:
-                        print(f"❌ Error de saldo insuficiente en Claude API: {error_msg}")
+                        logger.error("❌ Error de saldo insuficiente en Claude API: %s", error_msg)
                         return {
                             "success": False,
                             "error": "Saldo insuficiente en la cuenta de Claude AI. Por favor, recarga tu saldo en la web de Anthropic.",
@@ -185,7 +349,7 @@ Notas opcionales (ajusta según tu contexto)
                         }
                     # Manejo de errores de autenticación
                     elif "auth" in error_msg.lower() or "unauthorized" in error_msg.lower() or "api key" in error_msg.lower():
-                        print(f"❌ Error de autenticación en Claude API: {error_msg}")
+                        logger.error("❌ Error de autenticación en Claude API: %s", error_msg)
                         return {
                             "success": False,
                             "error": "Error de autenticación con la API de Claude. Por favor, verifica que la API key sea válida.",
@@ -193,7 +357,7 @@ Notas opcionales (ajusta según tu contexto)
                         }
                     # Manejo de otros errores comunes de Anthropic
                     elif "bad_request_error" in error_msg:
-                        print(f"❌ Error en la solicitud a Claude API: {error_msg}")
+                        logger.error("❌ Error en la solicitud a Claude API: %s", error_msg)
                         return {
                             "success": False,
                             "error": "Error en el formato de la solicitud a Claude AI. El componente puede ser demasiado complejo o contener datos no válidos.",
@@ -201,7 +365,7 @@ Notas opcionales (ajusta según tu contexto)
                         }
                     else:
                         # Es otro tipo de error
-                        print(f"❌ Error general en la API de Claude: {error_msg}")
+                        logger.error("❌ Error general en la API de Claude: %s", error_msg)
                         # Formatear el mensaje de error para el usuario de forma amigable
                         user_friendly_error = "Error en la API de Claude. "
                         if "404" in error_msg:
@@ -220,17 +384,148 @@ Notas opcionales (ajusta según tu contexto)
 
                 
         except Exception as e:
-            print(f"❌ Error generando código con Claude: {str(e)}")
+            logger.error("❌ Error generando código con Claude: %s", e)
             return {
                 "success": False,
                 "error": f"Error generando código: {str(e)}"
             }
     
-    def _create_component_prompt(self, frame_data: Dict[str, Any]) -> str:
-        """Crear un prompt detallado para Claude basado en los datos del frame"""
+    async def _cached_result(self, cache_key: str, frame_data: Dict[str, Any], force_regenerate: bool) -> Optional[Dict[str, Any]]:
+        # Resultado de la caché de generaciones (None si no hay o se fuerza la regeneración)
+        if force_regenerate:
+            generation_cache.record_bypass()
+            return None
+        try:
+            cached = await asyncio.to_thread(generation_cache.get, cache_key)
+        except Exception as cache_error:
+            logger.warning("⚠️ No se pudo leer la caché de generaciones: %s", cache_error)
+            return None
+        if cached is None:
+            return None
+        logger.info("⚡ Componente %s servido desde la caché de generaciones", frame_data.get('name'))
+        return dict(cached, cache="hit")
+    
+    async def _store_result(self, cache_key: str, result: Dict[str, Any]):
+        try:
+            await asyncio.to_thread(generation_cache.put, cache_key, result)
+        except Exception as cache_error:
+            logger.warning("⚠️ No se pudo guardar en la caché de generaciones: %s", cache_error)
+    
+    @staticmethod
+    def _build_result(
+        frame_data: Dict[str, Any],
+        content: str,
+        code_blocks: Dict[str, str],
+        prompt_stats: Dict[str, Any],
+        usage: Dict[str, int]
+    ) -> Dict[str, Any]:
+        return {
+            "success": True,
+            "component_name": frame_data.get('name', 'Component'),
+            "html_code": code_blocks.get("html", ""),
+            "css_code": code_blocks.get("css", ""),
+            "stencil_code": code_blocks.get("tsx", ""),
+            "storybook_code": code_blocks.get("story", ""),
+            "full_response": content,
+            "prompt_stats": prompt_stats,
+            "usage": usage
+        }
+    
+    async def stream_component_code(
+        self,
+        frame_data: Dict[str, Any],
+        force_regenerate: bool = False,
+        design_preamble: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Variante en streaming de generate_component_code
+
+        Emite eventos {"event": ..., ...} a medida que llega la respuesta:
+        - "delta": texto nuevo del modelo
+        - "block": un bloque html/css/tsx/story en cuanto se cierra su fence
+        - "result": el mismo diccionario que devuelve generate_component_code,
+          con "timings" (ttft_ms, first_block_ms, total_ms)
+        Se hace un único intento: si falla, el último evento es un "result" con success=False.
+        """
+        started = time.perf_counter()
+        system_blocks = build_system_blocks(design_preamble)
+        system_text = "\n\n".join(block["text"] for block in system_blocks)
+        cache_key = generation_cache_key(frame_data, self.model, system_text, self._template_version())
+        
+        cached = await self._cached_result(cache_key, frame_data, force_regenerate)
+        if cached is not None:
+            for kind, field in (("html", "html_code"), ("css", "css_code"), ("tsx", "stencil_code"), ("story", "storybook_code")):
+                if cached.get(field):
+                    yield {"event": "block", "kind": kind, "code": cached[field]}
+            elapsed = round((time.perf_counter() - started) * 1000, 1)
+            yield {"event": "result", "data": dict(cached, timings={"ttft_ms": elapsed, "first_block_ms": elapsed, "total_ms": elapsed})}
+            return
+        
+        # Fuera del event loop: destilar un frame grande tarda en proporción a su tamaño
+        prompt, prompt_stats = await asyncio.to_thread(self._create_component_prompt, frame_data)
+        logger.info("🌊 Generando en streaming el componente %s con %s...", frame_data.get('name'), self.model)
+        timings: Dict[str, Any] = {"ttft_ms": None, "first_block_ms": None}
+        parser = FenceParser()
+        try:
+            estimated_input = estimate_tokens(system_text) + estimate_tokens(prompt)
+            async with claude_pool.slot(input_tokens=estimated_input, output_tokens=MAX_OUTPUT_TOKENS, model=self.model):
+                async with self.client.messages.stream(
+                    model=self.model,
+                    max_tokens=MAX_OUTPUT_TOKENS,
+                    temperature=0,
+                    system=system_blocks,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ]
+                ) as stream:
+                    claude_scheduler.observe(stream.response.headers)
+                    async for text in stream.text_stream:
+                        if timings["ttft_ms"] is None:
+                            timings["ttft_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                        yield {"event": "delta", "text": text}
+                        for kind, code in parser.feed(text):
+                            if timings["first_block_ms"] is None:
+                                timings["first_block_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                            yield {"event": "block", "kind": kind, "code": code}
+                    final_message = await stream.get_final_message()
+        except Exception as api_error:
+            error_msg = str(api_error)
+            logger.error("❌ Error en la llamada en streaming a Claude: %s", error_msg)
+            result = {"success": False, "error": f"Error en la API de Claude. Detalles: {error_msg}"}
+            headers = error_headers(api_error)
+            claude_scheduler.observe(headers)
+            if is_rate_limit_error(api_error):
+                claude_scheduler.record_rate_limited(headers)
+                result["rate_limited"] = True
+            yield {"event": "result", "data": result}
+            return
+        
+        for kind, code in parser.finish():
+            yield {"event": "block", "kind": kind, "code": code}
+        content = "".join(block.text for block in final_message.content if getattr(block, "type", None) == "text")
+        usage = usage_from_response(final_message)
+        claude_pool.record_usage(usage, self.model)
+        result = self._build_result(frame_data, content, self._extract_code_blocks(content), prompt_stats, usage)
+        await self._store_result(cache_key, result)
+        timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info("✅ Streaming completado: primer token %s ms, primer bloque %s ms, total %s ms",
+                    timings['ttft_ms'], timings['first_block_ms'], timings['total_ms'])
+        yield {"event": "result", "data": dict(result, cache="bypass" if force_regenerate else "miss", timings=timings)}
+    
+    def _template_version(self, skeleton: Optional[Dict[str, str]] = None) -> str:
+        # El presupuesto de tokens cambia el prompt, así que forma parte de la clave de caché;
+        # el esqueleto sale del frame, así que basta con la versión del generador
+        version = f"{PROMPT_TEMPLATE_VERSION}:{self.token_budget}"
+        return f"{version}:skeleton-{SKELETON_PROMPT_VERSION}-{GENERATOR_VERSION}" if skeleton else version
+    
+    def _create_component_prompt(self, frame_data: Dict[str, Any], skeleton: Optional[Dict[str, str]] = None) -> Tuple[str, Dict[str, Any]]:
+        """Crear un prompt detallado para Claude basado en los datos del frame
+
+        Devuelve el prompt y las estadísticas de reducción del frame (tokens antes/después).
+        """
         component_name = frame_data.get('name', 'Component')
+        distilled, prompt_stats = distill_frame(frame_data, self.token_budget)
         
-        prompt = f"""# Tarea: Convertir diseño de Figma a componente Stencil
+        prompt = f"""# Componente a convertir
 
 Por favor analiza este componente de Figma llamado "{component_name}" y genera el código necesario para implementarlo usando Stencil.
 
@@ -239,50 +534,37 @@ Por favor analiza este componente de Figma llamado "{component_name}" y genera e
 - Dimensiones: {frame_data.get('width')}×{frame_data.get('height')}px
 - Tipo: {frame_data.get('type')}
 
-## Datos detallados del frame:
+## Datos detallados del frame (formato compacto):
+`size` = [ancho, alto] en px; colores en hex; `repeat` = número de hermanos idénticos consecutivos;
+`omitted_descendants` = nodos omitidos por tamaño (usa la imagen de referencia para ese detalle).
 ```json
-{json.dumps(frame_data, indent=2, ensure_ascii=False)}
+{json.dumps(distilled, separators=(",", ":"), ensure_ascii=False)}
 ```
 
 ## Imagen de referencia
 Imagen URL: {frame_data.get('image_url', 'No disponible')}
 
-## Tu tarea
-
-Proporciona el código para implementar este diseño como un componente web utilizando Stencil.js, con los siguientes entregables:
-
-1. **HTML Base**: El HTML básico que representa la estructura del componente
-2. **CSS**: Los estilos CSS completos y detallados
-3. **Componente Stencil**: El código TypeScript completo para el componente Stencil
-4. **Storybook**: Un archivo de Storybook para mostrar el componente con sus diferentes estados/propiedades
-
-Asegúrate de:
-- Usar nomenclatura BEM para las clases CSS
-- Crear un componente reutilizable y con propiedades configurables
-- Implementar estados (normal, hover, focus, disabled) cuando sea apropiado
-- Hacer el componente responsive y accesible
-- Incluir comentarios explicativos en el código
-
-Proporciona cada bloque de código con sus marcadores de lenguaje correspondientes. Por ejemplo:
-
-```html
-<!-- Código HTML aquí -->
-```
-
-```css
-/* Estilos CSS aquí */
-```
+Genera los cuatro entregables descritos en las instrucciones para este componente.
+"""
+        if skeleton:
+            prompt += f"""
+## Esqueleto generado a partir del árbol del frame
+Este código ya traduce el layout, los colores y los textos (como props con slot). Úsalo como base:
+corrige lo que no coincida con la imagen y añade estados, accesibilidad y eventos.
+Devuelve siempre completos el componente Stencil, el HTML y la historia de Storybook, coherentes
+con las props y slots de tu TSX; si el CSS del esqueleto no necesita cambios, omite ese bloque
+y se usará tal cual.
 
 ```tsx
-// Componente Stencil aquí
+{skeleton.get('tsx', '')}
 ```
 
-```tsx
-// Archivo Storybook aquí
+```css
+{skeleton.get('css', '')}
 ```
 """
         
-        return prompt
+        return prompt, prompt_stats
     
     async def check_available_models(self):
         """Verificar qué modelos están disponibles actualmente"""
@@ -296,29 +578,29 @@ Proporciona cada bloque de código con sus marcadores de lenguaje correspondient
         for model in models_to_check:
             try:
                 # Prueba simple para verificar si el modelo está disponible
-                print(f"🔍 Verificando disponibilidad del modelo: {model}...")
-                await asyncio.to_thread(
-                    self.client.messages.create,
-                    model=model,
-                    max_tokens=10,
-                    temperature=0,
-                    messages=[
-                        {"role": "user", "content": "test"}
-                    ]
-                )
+                logger.debug("🔍 Verificando disponibilidad del modelo: %s...", model)
+                async with claude_pool.slot(model=model):
+                    await self.client.messages.create(
+                        model=model,
+                        max_tokens=10,
+                        temperature=0,
+                        messages=[
+                            {"role": "user", "content": "test"}
+                        ]
+                    )
                 # Si no hay error, el modelo está disponible
                 available_models.append(model)
-                print(f"✅ Modelo {model} disponible")
+                logger.info("✅ Modelo %s disponible", model)
             except Exception as e:
-                print(f"❌ Modelo {model} no disponible: {str(e)}")
+                logger.error("❌ Modelo %s no disponible: %s", model, e)
         
         if available_models:
             # Actualizar el modelo al mejor disponible
             self.model = available_models[0]
-            print(f"✅ Usando el mejor modelo disponible: {self.model}")
+            logger.info("✅ Usando el mejor modelo disponible: %s", self.model)
             return available_models
         else:
-            print("❌ No se encontraron modelos disponibles")
+            logger.error("❌ No se encontraron modelos disponibles")
             return []
     
     def _extract_code_blocks(self, content: str) -> Dict[str, str]:
@@ -331,19 +613,19 @@ Proporciona cada bloque de código con sus marcadores de lenguaje correspondient
         }
         
         try:
-            print("🔍 Extrayendo bloques de código de la respuesta...")
+            logger.debug("🔍 Extrayendo bloques de código de la respuesta...")
             
             # HTML
             html_match = re.search(r"```html\n(.*?)\n```", content, re.DOTALL)
             if html_match:
                 code_blocks["html"] = html_match.group(1)
-                print("✅ Bloque HTML encontrado")
+                logger.debug("✅ Bloque HTML encontrado")
             
             # CSS
             css_match = re.search(r"```css\n(.*?)\n```", content, re.DOTALL)
             if css_match:
                 code_blocks["css"] = css_match.group(1)
-                print("✅ Bloque CSS encontrado")
+                logger.debug("✅ Bloque CSS encontrado")
             
             # Stencil Component (tsx)
             tsx_match = re.search(r"```tsx\n(.*?)\n```", content, re.DOTALL)
@@ -352,7 +634,7 @@ Proporciona cada bloque de código con sus marcadores de lenguaje correspondient
             
             if tsx_match:
                 code_blocks["tsx"] = tsx_match.group(1)
-                print("✅ Bloque TSX/TypeScript encontrado")
+                logger.debug("✅ Bloque TSX/TypeScript encontrado")
             
             # Storybook (intentar diversas variantes de formato)
             story_patterns = [
@@ -365,7 +647,7 @@ Proporciona cada bloque de código con sus marcadores de lenguaje correspondient
                 story_match = re.search(pattern, content, re.DOTALL)
                 if story_match:
                     code_blocks["story"] = story_match.group(1)
-                    print("✅ Bloque Storybook encontrado con patrón específico")
+                    logger.debug("✅ Bloque Storybook encontrado con patrón específico")
                     break
             
             # Si no encontramos un bloque específico de Storybook, buscamos un segundo bloque tsx
@@ -375,12 +657,13 @@ Proporciona cada bloque de código con sus marcadores de lenguaje correspondient
                 if len(all_tsx) > 1:
                     # El segundo bloque tsx probablemente es el Storybook
                     code_blocks["story"] = all_tsx[1].group(1)
-                    print("✅ Bloque Storybook encontrado como segundo bloque TSX")
+                    logger.debug("✅ Bloque Storybook encontrado como segundo bloque TSX")
             
-            print(f"✅ Extracción completada: HTML({len(code_blocks['html'])}), CSS({len(code_blocks['css'])}), TSX({len(code_blocks['tsx'])}), Story({len(code_blocks['story'])})")
+            logger.debug("✅ Extracción completada: HTML(%s), CSS(%s), TSX(%s), Story(%s)",
+                         len(code_blocks['html']), len(code_blocks['css']), len(code_blocks['tsx']), len(code_blocks['story']))
             
         except Exception as e:
-            print(f"⚠️ Error extrayendo bloques de código: {str(e)}")
+            logger.warning("⚠️ Error extrayendo bloques de código: %s", e)
         
         return code_blocks
         
@@ -0,0 +1,205 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+
+class FigmaFileCache:
+    """Caché de documentos de Figma en dos niveles: memoria (LRU) y disco
+
+    Las entradas se direccionan por contenido usando (file_key, version): una
+    versión de Figma es inmutable, así que una entrada nunca queda obsoleta; sólo
+    hace falta saber cuál es la versión actual del archivo. Esa comprobación se
+    hace con una petición barata (depth=1) y se recuerda durante
+    `revalidate_seconds` para no repetirla en cada llamada.
+
+    El presupuesto de memoria se mide en bytes del JSON serializado.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        memory_budget_bytes: int,
+        disk_budget_bytes: int,
+        revalidate_seconds: float,
+    ):
+        self.cache_dir = cache_dir
+        self.memory_budget_bytes = memory_budget_bytes
+        self.disk_budget_bytes = disk_budget_bytes
+        self.revalidate_seconds = revalidate_seconds
+        # (file_key, version, kind) -> (valor, bytes en memoria, bytes ahorrados por acierto)
+        self._memory: "OrderedDict[Tuple[str, str, str], Tuple[Any, int, int]]" = OrderedDict()
+        self._memory_bytes = 0
+        # file_key -> (version, last_modified, momento de la última validación)
+        self._versions: Dict[str, Tuple[str, Optional[str], float]] = {}
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "revalidations": 0,
+            "revalidations_skipped": 0,
+            "bytes_saved": 0,
+            "bytes_downloaded": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "FigmaFileCache":
+        return cls(
+            cache_dir=os.getenv("FIGMA_CACHE_DIR", os.path.join(".cache", "figma")),
+            memory_budget_bytes=int(float(os.getenv("FIGMA_CACHE_MEMORY_MB", "256")) * 1024 * 1024),
+            disk_budget_bytes=int(float(os.getenv("FIGMA_CACHE_DISK_MB", "2048")) * 1024 * 1024),
+            revalidate_seconds=float(os.getenv("FIGMA_CACHE_REVALIDATE_SECONDS", "30")),
+        )
+
+    # --- Versiones conocidas -------------------------------------------------
+
+    def remember_version(self, file_key: str, version: str, last_modified: Optional[str] = None):
+        """Registrar la versión actual de un archivo tras validarla contra Figma"""
+        self._versions[file_key] = (str(version), last_modified, time.monotonic())
+
+    def fresh_version(self, file_key: str) -> Optional[str]:
+        """Versión validada hace menos de `revalidate_seconds`, o None si hay que revalidar"""
+        known = self._versions.get(file_key)
+        if not known:
+            return None
+        version, _, checked_at = known
+        if time.monotonic() - checked_at > self.revalidate_seconds:
+            return None
+        return version
+
+    def known_last_modified(self, file_key: str) -> Optional[str]:
+        known = self._versions.get(file_key)
+        return known[1] if known else None
+
+    # --- Nivel en memoria ----------------------------------------------------
+
+    def get_memory(self, file_key: str, version: str, kind: str = "document") -> Optional[Any]:
+        """Buscar en la LRU; `kind` distingue el documento completo de vistas derivadas (p. ej. "structure")"""
+        key = (file_key, str(version), kind)
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        self._memory.move_to_end(key)
+        self.stats["memory_hits"] += 1
+        self.stats["bytes_saved"] += entry[2]
+        return entry[0]
+
+    def put_memory(self, file_key: str, version: str, value: Any, size: int, kind: str = "document", saved_bytes: Optional[int] = None):
+        """Guardar en la LRU; `saved_bytes` es lo que se evita descargar en cada acierto (por defecto `size`)"""
+        key = (file_key, str(version), kind)
+        if size > self.memory_budget_bytes:
+            # Entradas mayores que todo el presupuesto se quedan sólo en disco
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous[1]
+        self._memory[key] = (value, size, saved_bytes if saved_bytes is not None else size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.memory_budget_bytes and self._memory:
+            _, (_, evicted_size, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self.stats["memory_evictions"] += 1
+
+    # --- Nivel en disco (operaciones bloqueantes: llamar con asyncio.to_thread) ---
+
+    def _disk_path(self, file_key: str, version: str) -> str:
+        safe_key = "".join(ch for ch in file_key if ch.isalnum() or ch in "-_")
+        safe_version = "".join(ch for ch in str(version) if ch.isalnum() or ch in "-_.")
+        return os.path.join(self.cache_dir, safe_key, f"{safe_version}.json")
+
+    def find_disk(self, file_key: str, version: str) -> Optional[Tuple[str, int]]:
+        """Ruta y tamaño del documento en disco, o None si no está guardado"""
+        path = self._disk_path(file_key, version)
+        try:
+            size = os.path.getsize(path)
+            # Marcar como usado recientemente para la expulsión LRU del disco
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path, size
+
+    def read_disk(self, file_key: str, version: str) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Leer y decodificar un documento del disco; devuelve (documento, bytes)"""
+        found = self.find_disk(file_key, version)
+        if found is None:
+            return None
+        try:
+            with open(found[0], "rb") as fh:
+                raw = fh.read()
+            document = json.loads(raw)
+        except (OSError, ValueError):
+            return None
+        return document, len(raw)
+
+    def begin_disk_write(self, file_key: str) -> str:
+        """Ruta temporal donde volcar un documento mientras se descarga"""
+        directory = os.path.dirname(self._disk_path(file_key, "tmp"))
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f".download-{os.getpid()}-{time.monotonic_ns()}.tmp")
+
+    def commit_disk_write(self, tmp_path: str, file_key: str, version: str):
+        """Publicar de forma atómica un documento descargado y aplicar el presupuesto de disco"""
+        os.replace(tmp_path, self._disk_path(file_key, version))
+        self._enforce_disk_budget()
+
+    def write_disk(self, file_key: str, version: str, raw: bytes):
+        """Guardar el JSON crudo de forma atómica y aplicar el presupuesto de disco"""
+        tmp_path = self.begin_disk_write(file_key)
+        with open(tmp_path, "wb") as fh:
+            fh.write(raw)
+        self.commit_disk_write(tmp_path, file_key, version)
+
+    def _enforce_disk_budget(self):
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.disk_budget_bytes:
+            return
+        # Expulsar primero los menos usados (mtime más antiguo)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_budget_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                self.stats["disk_evictions"] += 1
+            except OSError:
+                pass
+
+    def record_disk_hit(self, size: int):
+        self.stats["disk_hits"] += 1
+        self.stats["bytes_saved"] += size
+
+    def record_miss(self, size: int):
+        self.stats["misses"] += 1
+        self.stats["bytes_downloaded"] += size
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Contadores de aciertos/fallos y ocupación de la caché"""
+        stats = dict(self.stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        stats["memory_entries"] = len(self._memory)
+        stats["memory_bytes"] = self._memory_bytes
+        stats["memory_budget_bytes"] = self.memory_budget_bytes
+        stats["disk_budget_bytes"] = self.disk_budget_bytes
+        stats["cache_dir"] = self.cache_dir
+        stats["known_files"] = len(self._versions)
+        return stats
+
+
+# Caché única por proceso
+figma_file_cache = FigmaFileCache.from_env()
@@ -1,26 +1,124 @@
 ﻿import aiohttp
 import asyncio
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import json
+import os
+import time
+from contextlib import asynccontextmanager
+
+from app.figma.cache import figma_file_cache
+from app.figma.index import DocumentIndex, variant_names
+from app.figma.renders import render_cache, render_key, render_proxy_path
+from app.figma.retry import figma_requests
+from app.figma.session import figma_pool
+from app.figma.singleflight import figma_single_flight
+from app.figma.streaming import TeeReader, parse_structure_file, parse_structure_stream
+from app.figma.tokens import (
+    SPACING_SAMPLE_COMPONENTS,
+    SPACING_SAMPLE_DEPTH,
+    build_token_table,
+    design_token_cache,
+    token_counts,
+    tokens_to_css,
+)
+from app.log import get_logger, truncate
+
+logger = get_logger(__name__)
+
+# Niveles del árbol que necesita el listado de páginas/frames (documento -> páginas -> frames)
+SHALLOW_STRUCTURE_DEPTH = 2
+
+# Agrupación de ids en las peticiones por lotes (/nodes, /images)
+BATCH_CHUNK_SIZE = int(os.getenv("FIGMA_BATCH_CHUNK_SIZE", "50"))
+BATCH_MAX_IDS_CHARS = int(os.getenv("FIGMA_BATCH_MAX_IDS_CHARS", "2000"))
+
+# Miniaturas de componentes: ids por petición a /images, peticiones simultáneas,
+# tiempo máximo por bloque y formato/escala por defecto (las vistas en rejilla
+# pueden pedir menos escala o jpg)
+THUMBNAIL_CHUNK_SIZE = int(os.getenv("FIGMA_THUMBNAIL_CHUNK_SIZE", "50"))
+THUMBNAIL_CONCURRENCY = int(os.getenv("FIGMA_THUMBNAIL_CONCURRENCY", "4"))
+THUMBNAIL_CHUNK_TIMEOUT = float(os.getenv("FIGMA_THUMBNAIL_CHUNK_TIMEOUT", "60"))
+# Veces que un bloque fallido se parte en dos para aislar los nodos que no se pueden rasterizar
+THUMBNAIL_SPLIT_DEPTH = int(os.getenv("FIGMA_THUMBNAIL_SPLIT_DEPTH", "3"))
+THUMBNAIL_SCALE = float(os.getenv("FIGMA_THUMBNAIL_SCALE", "2"))
+THUMBNAIL_FORMAT = os.getenv("FIGMA_THUMBNAIL_FORMAT", "png")
+RENDER_FORMATS = ("png", "jpg", "svg", "pdf")
+RENDER_SCALE_RANGE = (0.01, 4.0)
+
+# Escala y formato de los renders de frames (vista previa junto al código generado)
+FRAME_RENDER_SCALE = 2
+FRAME_RENDER_FORMAT = "png"
+
+# Render de frames: espera máxima tras recibir los nodos, límite de la petición y
+# tiempo que se conserva un render pendiente para resolverlo después
+RENDER_WAIT_TIMEOUT = float(os.getenv("FIGMA_RENDER_WAIT_TIMEOUT", "1.5"))
+RENDER_FETCH_TIMEOUT = float(os.getenv("FIGMA_RENDER_FETCH_TIMEOUT", "60"))
+PENDING_RENDER_TTL = float(os.getenv("FIGMA_PENDING_RENDER_TTL", "300"))
+
+# Parsear en streaming la estructura de archivos grandes (desactivar con FIGMA_STREAMING_PARSE=0)
+STREAMING_PARSE_DEFAULT = os.getenv("FIGMA_STREAMING_PARSE", "1") not in ("0", "false", "False")
+
+
+def _chunk_ids(ids: List[str], max_count: int, max_chars: int) -> List[List[str]]:
+    # Partir una lista de ids en bloques que respeten cantidad máxima y longitud del parámetro
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    current_chars = 0
+    for node_id in ids:
+        extra = len(node_id) + (1 if current else 0)
+        if current and (len(current) >= max_count or current_chars + extra > max_chars):
+            chunks.append(current)
+            current, current_chars = [], 0
+            extra = len(node_id)
+        current.append(node_id)
+        current_chars += extra
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@asynccontextmanager
+async def _existing_session(session: aiohttp.ClientSession):
+    yield session
+
 
 class FigmaClient:
-    def __init__(self, access_token: str):
+    def __init__(self, access_token: str, session: Optional[aiohttp.ClientSession] = None):
         self.access_token = access_token
         self.base_url = "https://api.figma.com/v1"
         self.headers = {
             "X-Figma-Token": access_token,
             "Content-Type": "application/json"
         }
+        # Sesión explícita opcional; por defecto se usa el pool compartido del proceso
+        self._session = session
+        # Renders de frames en curso o recién resueltos: (file_key, frame_id) -> Task
+        self._pending_renders: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._render_durations: Dict[Tuple[str, str], float] = {}
+
+    def _session_scope(self):
+        # Entrega la sesión HTTP a usar sin cerrarla al terminar (las conexiones se reutilizan)
+        if self._session is not None and not self._session.closed:
+            return _existing_session(self._session)
+        return figma_pool.session_scope()
+
+    def _get(self, session: aiohttp.ClientSession, url: str, **kwargs):
+        # GET a la API de Figma con reintentos (429/5xx, Retry-After) y concurrencia adaptativa por token
+        return figma_requests.request(session, self.access_token, "GET", url, **kwargs)
+
+    def _coalesced(self, url: str, fetch, variant: Optional[str] = None):
+        # Peticiones idénticas en curso (método, URL y token) esperan una sola descarga;
+        # `variant` separa los consumidores que procesan la misma URL de otra forma
+        return figma_single_flight.do(("GET", url, self.access_token, variant), fetch)
 
     async def test_connection(self) -> Dict[str, Any]:
         # Probar conexion con Figma
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.base_url}/me", headers=self.headers) as response:
+            async with self._session_scope() as session:
+                async with self._get(session, f"{self.base_url}/me", headers=self.headers) as response:
                     if response.status == 200:
                         user_data = await response.json()
-                        print("🔍 DEBUG - Respuesta completa de /me:")
-                        print(user_data)
+                        logger.debug("🔍 Respuesta completa de /me: %s", truncate(user_data))
                         
                         return {
                             "success": True,
@@ -45,42 +143,41 @@ class FigmaClient:
     async def get_teams(self) -> List[Dict[str, Any]]:
         # Obtener equipos y crear opciones de acceso
         try:
-            async with aiohttp.ClientSession() as session:
-                print("\n🔍 DEBUG - Obteniendo equipos de Figma...")
+            async with self._session_scope() as session:
+                logger.debug("🔍 Obteniendo equipos de Figma...")
                 
                 # Obtener datos del usuario actual
-                print("📡 Llamando a API: GET /v1/me")
-                async with session.get(f"{self.base_url}/me", headers=self.headers) as response:
+                logger.debug("📡 Llamando a API: GET /v1/me")
+                async with self._get(session, f"{self.base_url}/me", headers=self.headers) as response:
                     if response.status == 200:
                         me_data = await response.json()
-                        print(f"✅ Respuesta exitosa de /me - Status: {response.status}")
-                        print(f"👤 Usuario: {me_data.get('handle', 'N/A')} ({me_data.get('email', 'N/A')})")
-                        print(f"🆔 User ID: {me_data.get('id', 'N/A')}")
+                        logger.info("✅ Respuesta exitosa de /me - Status: %s", response.status)
+                        logger.info("👤 Usuario: %s (%s)", me_data.get('handle', 'N/A'), me_data.get('email', 'N/A'))
+                        logger.info("🆔 User ID: %s", me_data.get('id', 'N/A'))
                         
                         # Obtener los equipos
-                        print("\n📡 Llamando a API: GET /v1/teams")
-                        async with session.get(f"{self.base_url}/teams", headers=self.headers) as teams_response:
+                        logger.debug("📡 Llamando a API: GET /v1/teams")
+                        async with self._get(session, f"{self.base_url}/teams", headers=self.headers) as teams_response:
                             teams_response_text = await teams_response.text()
-                            print(f"📊 Respuesta completa de /teams:")
-                            print(teams_response_text)
+                            logger.debug("📊 Respuesta completa de /teams: %s", truncate(teams_response_text))
                             
                             if teams_response.status == 200:
                                 try:
                                     teams_data = json.loads(teams_response_text)
                                     teams = teams_data.get("teams", [])
-                                    print(f"✅ Respuesta exitosa de /teams - Status: {teams_response.status}")
-                                    print(f"🏢 Equipos encontrados: {len(teams)}")
+                                    logger.info("✅ Respuesta exitosa de /teams - Status: %s", teams_response.status)
+                                    logger.info("🏢 Equipos encontrados: %s", len(teams))
                                     
                                     for team in teams:
-                                        print(f"\n🏢 Equipo: {team.get('name', 'N/A')}")
-                                        print(f"   🆔 ID: {team.get('id', 'N/A')}")
-                                        print(f"   📊 URL API: {self.base_url}/teams/{team.get('id')}/projects")
-                                        print(f"   🔗 URL Web: https://www.figma.com/files/team/{team.get('id')}")
+                                        logger.debug("🏢 Equipo: %s", team.get('name', 'N/A'))
+                                        logger.debug("   🆔 ID: %s", team.get('id', 'N/A'))
+                                        logger.debug("   📊 URL API: %s/teams/%s/projects", self.base_url, team.get('id'))
+                                        logger.debug("   🔗 URL Web: https://www.figma.com/files/team/%s", team.get('id'))
                                 except json.JSONDecodeError:
-                                    print(f"❌ Error decodificando JSON de equipos")
+                                    logger.error("❌ Error decodificando JSON de equipos")
                             else:
-                                print(f"❌ Error al obtener equipos: {teams_response.status}")
-                                print(f"   Error: {teams_response_text}")
+                                logger.error("❌ Error al obtener equipos: %s", teams_response.status)
+                                logger.error("   Error: %s", teams_response_text)
                         
                         access_items = []
                         
@@ -109,7 +206,7 @@ class FigmaClient:
                                 
                                 # Si el equipo específico no está en la lista, añadirlo manualmente
                                 if not has_specific_team:
-                                    print(f"\n📌 Añadiendo manualmente el equipo ID: {specific_team_id}")
+                                    logger.debug("📌 Añadiendo manualmente el equipo ID: %s", specific_team_id)
                                     access_items.append({
                                         "id": specific_team_id,
                                         "name": f"🏢 Equipo Manual (ID: {specific_team_id})",
@@ -118,7 +215,7 @@ class FigmaClient:
                                         "description": f"Equipo de Figma añadido manualmente"
                                     })
                             except json.JSONDecodeError:
-                                print(f"❌ Error procesando JSON de equipos para access_items")
+                                logger.error("❌ Error procesando JSON de equipos para access_items")
                         
                         # Agregar opción para pegar URL directa
                         access_items.append({
@@ -147,42 +244,41 @@ class FigmaClient:
                             "description": "Ver datos completos de la API"
                         })
                         
-                        print(f"\n📊 Total de elementos de acceso: {len(access_items)}")
+                        logger.info("📊 Total de elementos de acceso: %s", len(access_items))
                         return access_items
                     else:
-                        print(f"❌ Error al obtener datos del usuario: {response.status}")
+                        logger.error("❌ Error al obtener datos del usuario: %s", response.status)
                         error_text = await response.text()
-                        print(f"   Error: {error_text}")
+                        logger.error("   Error: %s", error_text)
                         return []
         except Exception as e:
-            print(f"❌ Error getting access items: {e}")
+            logger.error("❌ Error getting access items: %s", e)
             return []
 
     async def get_team_by_id(self, team_id: str) -> Dict[str, Any]:
         """Obtener información directamente de un equipo específico por su ID"""
         try:
-            print(f"\n🔍 DEBUG - Obteniendo información del equipo {team_id}...")
+            logger.debug("🔍 Obteniendo información del equipo %s...", team_id)
             
             # Intentar obtener proyectos del equipo
-            print(f"📡 Llamando a API: GET /v1/teams/{team_id}/projects")
+            logger.debug("📡 Llamando a API: GET /v1/teams/%s/projects", team_id)
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.base_url}/teams/{team_id}/projects", headers=self.headers) as response:
+            async with self._session_scope() as session:
+                async with self._get(session, f"{self.base_url}/teams/{team_id}/projects", headers=self.headers) as response:
                     response_text = await response.text()
-                    print(f"📊 Respuesta completa:")
-                    print(response_text)
+                    logger.debug("📊 Respuesta completa: %s", truncate(response_text))
                     
                     if response.status == 200:
                         try:
                             data = json.loads(response_text)
                             projects = data.get("projects", [])
-                            print(f"✅ Respuesta exitosa - Status: {response.status}")
-                            print(f"📂 Proyectos encontrados: {len(projects)}")
+                            logger.info("✅ Respuesta exitosa - Status: %s", response.status)
+                            logger.info("📂 Proyectos encontrados: %s", len(projects))
                             
                             for project in projects:
-                                print(f"\n📂 Proyecto: {project.get('name', 'N/A')}")
-                                print(f"   🆔 ID: {project.get('id', 'N/A')}")
-                                print(f"   📊 URL API: {self.base_url}/projects/{project.get('id')}/files")
+                                logger.debug("📂 Proyecto: %s", project.get('name', 'N/A'))
+                                logger.debug("   🆔 ID: %s", project.get('id', 'N/A'))
+                                logger.debug("   📊 URL API: %s/projects/%s/files", self.base_url, project.get('id'))
                             
                             return {
                                 "success": True,
@@ -191,22 +287,22 @@ class FigmaClient:
                                 "projects": projects
                             }
                         except json.JSONDecodeError:
-                            print(f"❌ Error decodificando JSON de proyectos")
+                            logger.error("❌ Error decodificando JSON de proyectos")
                             return {
                                 "success": False,
                                 "error": "Error decodificando respuesta JSON",
                                 "raw_response": response_text
                             }
                     else:
-                        print(f"❌ Error al obtener proyectos: {response.status}")
-                        print(f"   Error: {response_text}")
+                        logger.error("❌ Error al obtener proyectos: %s", response.status)
+                        logger.error("   Error: %s", response_text)
                         return {
                             "success": False,
                             "error": f"Error HTTP {response.status}",
                             "raw_response": response_text
                         }
         except Exception as e:
-            print(f"❌ Error obteniendo información del equipo: {str(e)}")
+            logger.error("❌ Error obteniendo información del equipo: %s", e)
             return {
                 "success": False,
                 "error": f"Exception: {str(e)}"
@@ -215,59 +311,59 @@ class FigmaClient:
     async def get_team_projects(self, team_id: str) -> List[Dict[str, Any]]:
         # Obtener proyectos de un equipo
         try:
-            print(f"\n🔍 DEBUG - Obteniendo proyectos del equipo {team_id}...")
-            print(f"📡 Llamando a API: GET /v1/teams/{team_id}/projects")
+            logger.debug("🔍 Obteniendo proyectos del equipo %s...", team_id)
+            logger.debug("📡 Llamando a API: GET /v1/teams/%s/projects", team_id)
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.base_url}/teams/{team_id}/projects", headers=self.headers) as response:
+            async with self._session_scope() as session:
+                async with self._get(session, f"{self.base_url}/teams/{team_id}/projects", headers=self.headers) as response:
                     if response.status == 200:
                         data = await response.json()
                         projects = data.get("projects", [])
-                        print(f"✅ Respuesta exitosa - Status: {response.status}")
-                        print(f"📂 Proyectos encontrados: {len(projects)}")
+                        logger.info("✅ Respuesta exitosa - Status: %s", response.status)
+                        logger.info("📂 Proyectos encontrados: %s", len(projects))
                         
                         for project in projects:
-                            print(f"\n📂 Proyecto: {project.get('name', 'N/A')}")
-                            print(f"   🆔 ID: {project.get('id', 'N/A')}")
-                            print(f"   📊 URL API: {self.base_url}/projects/{project.get('id')}/files")
+                            logger.debug("📂 Proyecto: %s", project.get('name', 'N/A'))
+                            logger.debug("   🆔 ID: %s", project.get('id', 'N/A'))
+                            logger.debug("   📊 URL API: %s/projects/%s/files", self.base_url, project.get('id'))
                         
                         return projects
                     else:
                         error_text = await response.text()
-                        print(f"❌ Error al obtener proyectos: {response.status}")
-                        print(f"   Error: {error_text}")
+                        logger.error("❌ Error al obtener proyectos: %s", response.status)
+                        logger.error("   Error: %s", error_text)
                         return []
         except Exception as e:
-            print(f"❌ Error getting team projects: {e}")
+            logger.error("❌ Error getting team projects: %s", e)
             return []
 
     async def get_project_files(self, project_id: str) -> List[Dict[str, Any]]:
         # Obtener archivos de un proyecto
         try:
-            print(f"\n🔍 DEBUG - Obteniendo archivos del proyecto {project_id}...")
-            print(f"📡 Llamando a API: GET /v1/projects/{project_id}/files")
+            logger.debug("🔍 Obteniendo archivos del proyecto %s...", project_id)
+            logger.debug("📡 Llamando a API: GET /v1/projects/%s/files", project_id)
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.base_url}/projects/{project_id}/files", headers=self.headers) as response:
+            async with self._session_scope() as session:
+                async with self._get(session, f"{self.base_url}/projects/{project_id}/files", headers=self.headers) as response:
                     if response.status == 200:
                         data = await response.json()
                         files = data.get("files", [])
-                        print(f"✅ Respuesta exitosa - Status: {response.status}")
-                        print(f"📄 Archivos encontrados: {len(files)}")
+                        logger.info("✅ Respuesta exitosa - Status: %s", response.status)
+                        logger.info("📄 Archivos encontrados: %s", len(files))
                         
                         for file in files:
-                            print(f"\n📄 Archivo: {file.get('name', 'N/A')}")
-                            print(f"   🆔 Key: {file.get('key', 'N/A')}")
-                            print(f"   📊 URL API: {self.base_url}/files/{file.get('key')}")
+                            logger.debug("📄 Archivo: %s", file.get('name', 'N/A'))
+                            logger.debug("   🆔 Key: %s", file.get('key', 'N/A'))
+                            logger.debug("   📊 URL API: %s/files/%s", self.base_url, file.get('key'))
                         
                         return files
                     else:
                         error_text = await response.text()
-                        print(f"❌ Error al obtener archivos: {response.status}")
-                        print(f"   Error: {error_text}")
+                        logger.error("❌ Error al obtener archivos: %s", response.status)
+                        logger.error("   Error: %s", error_text)
                         return []
         except Exception as e:
-            print(f"❌ Error getting project files: {e}")
+            logger.error("❌ Error getting project files: %s", e)
             return []
 
     async def get_files_from_access_item(self, item_id: str, item_type: str) -> List[Dict[str, Any]]:
@@ -275,7 +371,7 @@ class FigmaClient:
         try:
             if item_type == "team":
                 # Si es un equipo, obtenemos sus proyectos
-                print(f"\n🔍 DEBUG - Obteniendo archivos para el equipo {item_id}...")
+                logger.debug("🔍 Obteniendo archivos para el equipo %s...", item_id)
                 projects = await self.get_team_projects(item_id)
                 
                 # Si hay proyectos, mostrar opciones de proyectos
@@ -293,7 +389,7 @@ class FigmaClient:
                 return []
             elif item_type == "project":
                 # Si es un proyecto, obtenemos sus archivos
-                print(f"\n🔍 DEBUG - Obteniendo archivos para el proyecto {item_id}...")
+                logger.debug("🔍 Obteniendo archivos para el proyecto %s...", item_id)
                 files = await self.get_project_files(item_id)
                 
                 if files:
@@ -344,8 +440,8 @@ class FigmaClient:
                 ]
             elif item_type == "debug":
                 # Devolver datos raw para debug
-                async with aiohttp.ClientSession() as session:
-                    async with session.get(f"{self.base_url}/me", headers=self.headers) as response:
+                async with self._session_scope() as session:
+                    async with self._get(session, f"{self.base_url}/me", headers=self.headers) as response:
                         if response.status == 200:
                             data = await response.json()
                             return [{
@@ -358,10 +454,434 @@ class FigmaClient:
             else:
                 return []
         except Exception as e:
-            print(f"❌ Error getting files from access item: {e}")
+            logger.error("❌ Error getting files from access item: %s", e)
             return []
 
-    async def get_file_structure(self, file_key: str) -> Dict[str, Any]:
+    def _file_error(self, file_key: str, status: int, error_data: str) -> Dict[str, Any]:
+        # Traducir un error HTTP de GET /v1/files/{key} a la respuesta estándar del cliente
+        if status == 404:
+            logger.error("❌ Archivo no encontrado - Status: %s", status)
+            return {
+                "success": False,
+                "error": f"Archivo no encontrado. Verifica que el file_key '{file_key}' sea correcto y tengas acceso al archivo."
+            }
+        elif status == 403:
+            logger.error("❌ Acceso denegado - Status: %s", status)
+            return {
+                "success": False,
+                "error": f"Acceso denegado. No tienes permisos para acceder a este archivo."
+            }
+
+        logger.error("❌ Error al obtener estructura: %s", status)
+        logger.error("   Error: %s", error_data)
+
+        error_message = "Error desconocido"
+        try:
+            error_json = json.loads(error_data)
+            if isinstance(error_json, dict):
+                error_message = error_json.get("err", error_message)
+        except:
+            pass
+
+        return {
+            "success": False,
+            "error": f"Error HTTP {status}: {error_message}",
+            "raw_error": error_data,
+            # Figma siguió respondiendo 429 tras agotar los reintentos
+            "rate_limited": status == 429
+        }
+
+    async def get_file_version(self, file_key: str) -> Dict[str, Any]:
+        """Obtener la versión actual de un archivo con una petición ligera (depth=1)"""
+        cached_version = figma_file_cache.fresh_version(file_key)
+        if cached_version:
+            figma_file_cache.stats["revalidations_skipped"] += 1
+            return {
+                "success": True,
+                "version": cached_version,
+                "last_modified": figma_file_cache.known_last_modified(file_key)
+            }
+
+        url = f"{self.base_url}/files/{file_key}?depth=1"
+
+        async def fetch() -> Dict[str, Any]:
+            logger.debug("📡 Revalidando versión: GET /v1/files/%s?depth=1", file_key)
+            async with self._session_scope() as session:
+                async with self._get(session, url, headers=self.headers) as response:
+                    if response.status != 200:
+                        return self._file_error(file_key, response.status, await response.text())
+                    meta = await response.json()
+
+            figma_file_cache.stats["revalidations"] += 1
+            version = str(meta.get("version"))
+            figma_file_cache.remember_version(file_key, version, meta.get("lastModified"))
+            return {
+                "success": True,
+                "version": version,
+                "last_modified": meta.get("lastModified")
+            }
+
+        return await self._coalesced(url, fetch)
+
+    async def _get_file_document(self, file_key: str, version: Optional[str] = None) -> Dict[str, Any]:
+        """Obtener el documento completo de un archivo, usando la caché por (file_key, version)
+
+        Sólo se descarga el documento entero cuando la versión del archivo cambió
+        (o no está en ninguna de las dos capas de la caché). Con `version` se pide
+        esa versión concreta del historial en vez de la actual.
+        """
+        pinned = version is not None
+        if pinned:
+            version = str(version)
+        else:
+            version_info = await self.get_file_version(file_key)
+            if not version_info["success"]:
+                return version_info
+            version = version_info["version"]
+
+        document = figma_file_cache.get_memory(file_key, version)
+        if document is not None:
+            logger.info("⚡ Documento %s@%s servido desde memoria", file_key, version)
+            return {"success": True, "data": document, "cache": "memory"}
+
+        from_disk = await asyncio.to_thread(figma_file_cache.read_disk, file_key, version)
+        if from_disk is not None:
+            document, size = from_disk
+            figma_file_cache.record_disk_hit(size)
+            figma_file_cache.put_memory(file_key, version, document, size)
+            logger.info("💾 Documento %s@%s servido desde disco (%s bytes)", file_key, version, size)
+            return {"success": True, "data": document, "cache": "disk"}
+
+        url = f"{self.base_url}/files/{file_key}" + (f"?version={version}" if pinned else "")
+
+        async def fetch() -> Dict[str, Any]:
+            logger.debug("📡 Llamando a API: GET /v1/files/%s%s", file_key, f"?version={version}" if pinned else "")
+            async with self._session_scope() as session:
+                async with self._get(session, url, headers=self.headers) as response:
+                    raw = await response.read()
+                    if response.status != 200:
+                        return self._file_error(file_key, response.status, raw.decode("utf-8", errors="replace"))
+
+            try:
+                document = json.loads(raw)
+            except json.JSONDecodeError as e:
+                logger.error("❌ Error decodificando JSON: %s", e)
+                return {
+                    "success": False,
+                    "error": f"Error al decodificar la respuesta JSON: {str(e)}"
+                }
+
+            # El archivo pudo cambiar entre la revalidación y la descarga: manda la versión descargada
+            downloaded_version = str(document.get("version", version))
+            if not pinned:
+                figma_file_cache.remember_version(file_key, downloaded_version, document.get("lastModified"))
+            figma_file_cache.record_miss(len(raw))
+            figma_file_cache.put_memory(file_key, downloaded_version, document, len(raw))
+            try:
+                await asyncio.to_thread(figma_file_cache.write_disk, file_key, downloaded_version, raw)
+            except OSError as e:
+                logger.warning("⚠️ No se pudo guardar el documento en la caché de disco: %s", e)
+            return {"success": True, "data": document, "cache": "miss"}
+
+        return await self._coalesced(url, fetch)
+
+    def cached_document_index(self, file_key: str, version: Optional[str] = None) -> Optional[DocumentIndex]:
+        """Índice del documento si ya está en memoria para la versión actual (sin llamar a Figma)"""
+        version = version or figma_file_cache.fresh_version(file_key)
+        if not version:
+            return None
+        return figma_file_cache.get_memory(file_key, version, kind="index")
+
+    async def get_document_index(self, file_key: str, version: Optional[str] = None) -> Dict[str, Any]:
+        """Índice del documento completo (ver `DocumentIndex`), construido una vez por versión
+
+        Se guarda en la caché de memoria junto al documento, como otra vista de
+        la misma (file_key, versión); puede seguir ahí aunque el documento se
+        haya expulsado, porque ocupa mucho menos. Con `version` se indexa esa
+        versión del historial (p. ej. para compararla con la actual).
+        """
+        pinned = version
+        if version is None:
+            version_info = await self.get_file_version(file_key)
+            if not version_info["success"]:
+                return version_info
+            version = version_info["version"]
+
+        index = self.cached_document_index(file_key, version)
+        if index is not None:
+            return {"success": True, "index": index, "cache": "memory"}
+
+        async def build() -> Dict[str, Any]:
+            document_result = await self._get_file_document(file_key, pinned)
+            if not document_result["success"]:
+                return document_result
+            index = await asyncio.to_thread(DocumentIndex, document_result["data"])
+            indexed_version = index.version or version
+            figma_file_cache.put_memory(file_key, indexed_version, index, index.size_bytes(), kind="index", saved_bytes=0)
+            logger.info("🗂️ Índice de %s@%s: %s nodos en %s ms", file_key, indexed_version, len(index), index.build_ms)
+            return {"success": True, "index": index, "cache": document_result["cache"]}
+
+        return await self._coalesced(f"{self.base_url}/files/{file_key}", build, variant=f"index:{pinned or ''}")
+
+    async def diff_file_versions(self, file_key: str, from_version: str, to_version: Optional[str] = None) -> Dict[str, Any]:
+        """Frames y componentes añadidos, eliminados o modificados entre dos versiones del archivo
+
+        Sin `to_version` se compara con la versión actual. Cada versión se indexa
+        una vez (con el hash de cada subárbol) y queda en la caché.
+        """
+        try:
+            before, after = await asyncio.gather(
+                self.get_document_index(file_key, str(from_version)),
+                self.get_document_index(file_key, str(to_version) if to_version else None)
+            )
+            for result in (before, after):
+                if not result["success"]:
+                    return result
+            changes = after["index"].diff(before["index"])
+            logger.info(
+                "🔀 %s %s -> %s: %s añadidos, %s eliminados, %s modificados",
+                file_key, changes["from_version"], changes["to_version"],
+                len(changes["added"]), len(changes["removed"]), len(changes["changed"])
+            )
+            return dict(changes, success=True, file_key=file_key)
+        except Exception as e:
+            logger.error("❌ Error comparando versiones: %s", e)
+            return {
+                "success": False,
+                "error": f"Error comparando versiones del archivo: {str(e)}"
+            }
+
+    async def unchanged_nodes(self, file_key: str, since_version: str, node_ids: List[str]) -> Dict[str, Any]:
+        """Nodos de `node_ids` idénticos en la versión actual y en `since_version`"""
+        before, after = await asyncio.gather(
+            self.get_document_index(file_key, str(since_version)),
+            self.get_document_index(file_key)
+        )
+        for result in (before, after):
+            if not result["success"]:
+                return result
+        return {
+            "success": True,
+            "version": after["index"].version,
+            "unchanged": after["index"].unchanged_since(before["index"], node_ids)
+        }
+
+    async def find_document_nodes(
+        self,
+        file_key: str,
+        node_type: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+        page_id: Optional[str] = None,
+        component_id: Optional[str] = None,
+        limit: int = 100
+    ) -> Dict[str, Any]:
+        """Buscar nodos del documento por tipo, prefijo de nombre, página o componente (desde el índice)"""
+        try:
+            index_result = await self.get_document_index(file_key)
+            if not index_result["success"]:
+                return index_result
+            index = index_result["index"]
+            nodes = []
+            total = 0
+            for found in index.search(node_type=node_type, name_prefix=name_prefix, page_id=page_id, component_id=component_id):
+                total += 1
+                if len(nodes) < limit:
+                    nodes.append(index.summary(found))
+            return {
+                "success": True,
+                "file_key": file_key,
+                "version": index.version,
+                "nodes": nodes,
+                "total_count": total,
+                "truncated": total > len(nodes),
+                "cache": index_result["cache"]
+            }
+        except Exception as e:
+            logger.error("❌ Error buscando nodos: %s", e)
+            return {
+                "success": False,
+                "error": f"Error buscando nodos del archivo: {str(e)}"
+            }
+
+    async def get_document_node(self, file_key: str, node_id: str) -> Dict[str, Any]:
+        """Datos de un nodo (frame, componente...) por id, desde el índice del documento"""
+        try:
+            index_result = await self.get_document_index(file_key)
+            if not index_result["success"]:
+                return index_result
+            index = index_result["index"]
+            found = index.find(node_id)
+            if found is None:
+                return {
+                    "success": False,
+                    "not_found": True,
+                    "error": f"No existe el nodo {node_id} en el archivo"
+                }
+            return {
+                "success": True,
+                "file_key": file_key,
+                "version": index.version,
+                "node": index.details(found),
+                "cache": index_result["cache"]
+            }
+        except Exception as e:
+            logger.error("❌ Error obteniendo nodo: %s", e)
+            return {
+                "success": False,
+                "error": f"Error obteniendo el nodo del archivo: {str(e)}"
+            }
+
+    @staticmethod
+    def _extract_pages(document: Dict[str, Any]) -> List[Dict[str, Any]]:
+        # Extraer paginas (CANVAS) y sus frames de primer nivel de un documento ya decodificado
+        pages = []
+        for page in document.get("children", []):
+            if page.get("type") == "CANVAS":
+                frames = []
+                
+                for child in page.get("children", []):
+                    if child.get("type") == "FRAME":
+                        frames.append({
+                            "id": child.get("id"),
+                            "name": child.get("name"),
+                            "type": child.get("type"),
+                            "width": child.get("absoluteBoundingBox", {}).get("width"),
+                            "height": child.get("absoluteBoundingBox", {}).get("height"),
+                            "background_color": child.get("backgroundColor")
+                        })
+                
+                pages.append({
+                    "id": page.get("id"),
+                    "name": page.get("name"),
+                    "type": page.get("type"),
+                    "frames_count": len(frames),
+                    "frames": frames
+                })
+        return pages
+
+    async def _get_structure_streaming(self, file_key: str) -> Dict[str, Any]:
+        """Obtener sólo páginas y frames parseando el documento de forma incremental
+
+        Nunca mantiene el documento completo en memoria: la respuesta se parsea
+        bloque a bloque desde el stream de aiohttp (y se copia tal cual a la caché
+        de disco); un acierto en disco se vuelve a parsear en streaming.
+        """
+        version_info = await self.get_file_version(file_key)
+        if not version_info["success"]:
+            return version_info
+        version = version_info["version"]
+
+        structure = figma_file_cache.get_memory(file_key, version, kind="structure")
+        if structure is not None:
+            return {"success": True, "data": structure, "cache": "memory"}
+
+        document = figma_file_cache.get_memory(file_key, version)
+        if document is not None:
+            structure = {
+                "name": document.get("name"),
+                "version": str(document.get("version", version)),
+                "lastModified": document.get("lastModified"),
+                "pages": self._extract_pages(document.get("document", {})),
+            }
+            figma_file_cache.put_memory(file_key, version, structure, len(json.dumps(structure)), kind="structure", saved_bytes=0)
+            return {"success": True, "data": structure, "cache": "memory"}
+
+        found = await asyncio.to_thread(figma_file_cache.find_disk, file_key, version)
+        if found is not None:
+            path, size = found
+            structure = await asyncio.to_thread(parse_structure_file, path)
+            figma_file_cache.record_disk_hit(size)
+            figma_file_cache.put_memory(file_key, version, structure, len(json.dumps(structure)), kind="structure", saved_bytes=size)
+            logger.info("💾 Estructura de %s@%s parseada desde disco (%s bytes)", file_key, version, size)
+            return {"success": True, "data": structure, "cache": "disk"}
+
+        url = f"{self.base_url}/files/{file_key}"
+
+        async def fetch() -> Dict[str, Any]:
+            logger.debug("📡 Llamando a API (streaming): GET /v1/files/%s", file_key)
+            tmp_path = figma_file_cache.begin_disk_write(file_key)
+            committed = False
+            try:
+                with open(tmp_path, "wb") as sink:
+                    async with self._session_scope() as session:
+                        async with self._get(session, url, headers=self.headers) as response:
+                            if response.status != 200:
+                                return self._file_error(file_key, response.status, await response.text())
+                            reader = TeeReader(response.content, sink)
+                            structure = await parse_structure_stream(reader)
+
+                downloaded_version = structure.get("version") or version
+                structure["version"] = downloaded_version
+                figma_file_cache.remember_version(file_key, downloaded_version, structure.get("lastModified"))
+                figma_file_cache.record_miss(reader.bytes_read)
+                figma_file_cache.put_memory(file_key, downloaded_version, structure, len(json.dumps(structure)), kind="structure", saved_bytes=reader.bytes_read)
+                try:
+                    await asyncio.to_thread(figma_file_cache.commit_disk_write, tmp_path, file_key, downloaded_version)
+                    committed = True
+                except OSError as e:
+                    logger.warning("⚠️ No se pudo guardar el documento en la caché de disco: %s", e)
+                logger.info("✅ Estructura parseada en streaming (%s bytes)", reader.bytes_read)
+                return {"success": True, "data": structure, "cache": "miss"}
+            finally:
+                if not committed and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+        # Misma URL que el documento completo, pero el resultado es sólo la estructura
+        return await self._coalesced(url, fetch, variant="structure")
+
+    async def _get_structure_shallow(self, file_key: str, page_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Obtener páginas y frames pidiendo a Figma sólo los dos primeros niveles del árbol
+
+        Usa `depth=2` (documento -> páginas -> nodos de primer nivel) y, si se
+        indican páginas, `ids` para recortar el documento en el servidor. No se
+        pide `geometry=paths`, así que Figma omite los trazados vectoriales.
+        La respuesta trae la versión del archivo, por lo que sirve también de
+        revalidación.
+        """
+        kind = "shallow" + (":" + ",".join(sorted(page_ids)) if page_ids else "")
+        known_version = figma_file_cache.fresh_version(file_key)
+        if known_version:
+            structure = figma_file_cache.get_memory(file_key, known_version, kind=kind)
+            if structure is not None:
+                figma_file_cache.stats["revalidations_skipped"] += 1
+                return {"success": True, "data": structure, "cache": "memory"}
+
+        query = f"depth={SHALLOW_STRUCTURE_DEPTH}"
+        if page_ids:
+            query += f"&ids={','.join(page_ids)}"
+        url = f"{self.base_url}/files/{file_key}?{query}"
+
+        async def fetch() -> Dict[str, Any]:
+            logger.debug("📡 Llamando a API: GET /v1/files/%s?%s", file_key, query)
+            async with self._session_scope() as session:
+                async with self._get(session, url, headers=self.headers) as response:
+                    raw = await response.read()
+                    if response.status != 200:
+                        return self._file_error(file_key, response.status, raw.decode("utf-8", errors="replace"))
+
+            data = json.loads(raw)
+            version = str(data.get("version"))
+            figma_file_cache.stats["revalidations"] += 1
+            figma_file_cache.remember_version(file_key, version, data.get("lastModified"))
+            figma_file_cache.record_miss(len(raw))
+            structure = {
+                "name": data.get("name"),
+                "version": version,
+                "lastModified": data.get("lastModified"),
+                "pages": self._extract_pages(data.get("document", {})),
+            }
+            figma_file_cache.put_memory(file_key, version, structure, len(raw), kind=kind)
+            return {"success": True, "data": structure, "cache": "miss"}
+
+        return await self._coalesced(url, fetch)
+
+    async def get_file_structure(
+        self,
+        file_key: str,
+        shallow: bool = True,
+        page_ids: Optional[List[str]] = None,
+        streaming: Optional[bool] = None
+    ) -> Dict[str, Any]:
         # Obtener estructura completa de un archivo (paginas y frames)
         try:
             # Si es un file_key de ejemplo, devolver estructura mock
@@ -371,94 +891,62 @@ class FigmaClient:
                     "error": "Este es un archivo de ejemplo. Para usar un archivo real, necesitas el file_key real de Figma."
                 }
             
-            print(f"\n🔍 DEBUG - Obteniendo estructura del archivo {file_key}...")
-            print(f"📡 Llamando a API: GET /v1/files/{file_key}")
+            logger.debug("🔍 Obteniendo estructura del archivo %s...", file_key)
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.base_url}/files/{file_key}", headers=self.headers) as response:
-                    response_text = await response.text()
-                    
-                    if response.status == 200:
-                        try:
-                            data = json.loads(response_text)
-                            print(f"✅ Respuesta exitosa - Status: {response.status}")
-                            print(f"📄 Nombre del archivo: {data.get('name', 'N/A')}")
-                            
-                            # Extraer paginas y frames
-                            pages = []
-                            document = data.get("document", {})
-                            
-                            for page in document.get("children", []):
-                                if page.get("type") == "CANVAS":
-                                    frames = []
-                                    
-                                    for child in page.get("children", []):
-                                        if child.get("type") == "FRAME":
-                                            frames.append({
-                                                "id": child.get("id"),
-                                                "name": child.get("name"),
-                                                "type": child.get("type"),
-                                                "width": child.get("absoluteBoundingBox", {}).get("width"),
-                                                "height": child.get("absoluteBoundingBox", {}).get("height"),
-                                                "background_color": child.get("backgroundColor")
-                                            })
-                                    
-                                    pages.append({
-                                        "id": page.get("id"),
-                                        "name": page.get("name"),
-                                        "type": page.get("type"),
-                                        "frames_count": len(frames),
-                                        "frames": frames
-                                    })
-                                    print(f"📑 Página: {page.get('name')} - {len(frames)} frames")
-                            
-                            return {
-                                "success": True,
-                                "file_key": file_key,
-                                "file_name": data.get("name"),
-                                "pages_count": len(pages),
-                                "pages": pages,
-                                "version": data.get("version"),
-                                "last_modified": data.get("lastModified")
-                            }
-                        except json.JSONDecodeError as e:
-                            print(f"❌ Error decodificando JSON: {str(e)}")
-                            return {
-                                "success": False,
-                                "error": f"Error al decodificar la respuesta JSON: {str(e)}"
-                            }
-                    elif response.status == 404:
-                        print(f"❌ Archivo no encontrado - Status: {response.status}")
-                        return {
-                            "success": False,
-                            "error": f"Archivo no encontrado. Verifica que el file_key '{file_key}' sea correcto y tengas acceso al archivo."
-                        }
-                    elif response.status == 403:
-                        print(f"❌ Acceso denegado - Status: {response.status}")
-                        return {
-                            "success": False,
-                            "error": f"Acceso denegado. No tienes permisos para acceder a este archivo."
-                        }
-                    else:
-                        error_data = response_text
-                        print(f"❌ Error al obtener estructura: {response.status}")
-                        print(f"   Error: {error_data}")
-                        
-                        error_message = "Error desconocido"
-                        try:
-                            error_json = json.loads(error_data)
-                            if isinstance(error_json, dict):
-                                error_message = error_json.get("err", error_message)
-                        except:
-                            pass
-                        
-                        return {
-                            "success": False,
-                            "error": f"Error HTTP {response.status}: {error_message}",
-                            "raw_error": error_data
-                        }
+            if streaming is None:
+                streaming = STREAMING_PARSE_DEFAULT
+            
+            # Con el índice del documento en memoria no hace falta pedir ni recorrer nada
+            index = self.cached_document_index(file_key)
+            if index is not None:
+                figma_file_cache.stats["revalidations_skipped"] += 1
+                data = {"name": index.name, "version": index.version, "lastModified": index.last_modified}
+                pages = index.pages_structure(page_ids)
+                cache_status = "index"
+            elif shallow:
+                # Modo por defecto: el listado sólo necesita dos niveles del árbol
+                structure_result = await self._get_structure_shallow(file_key, page_ids)
+                if not structure_result["success"]:
+                    return structure_result
+                data = structure_result["data"]
+                pages = data["pages"]
+                cache_status = structure_result["cache"]
+            elif streaming:
+                structure_result = await self._get_structure_streaming(file_key)
+                if not structure_result["success"]:
+                    return structure_result
+                data = structure_result["data"]
+                # La estructura cacheada tiene todas las páginas: filtrar sin modificarla
+                pages = [page for page in data["pages"] if page["id"] in page_ids] if page_ids else data["pages"]
+                cache_status = structure_result["cache"]
+            else:
+                # Documento completo: se indexa una vez y el resto de consultas usan el índice
+                index_result = await self.get_document_index(file_key)
+                if not index_result["success"]:
+                    return index_result
+                index = index_result["index"]
+                data = {"name": index.name, "version": index.version, "lastModified": index.last_modified}
+                pages = index.pages_structure(page_ids)
+                cache_status = index_result["cache"]
+            
+            logger.info("✅ Estructura disponible (caché: %s)", cache_status)
+            logger.info("📄 Nombre del archivo: %s", data.get('name', 'N/A'))
+            for page in pages:
+                logger.info("📑 Página: %s - %s frames", page.get('name'), page.get('frames_count'))
+            
+            return {
+                "success": True,
+                "file_key": file_key,
+                "file_name": data.get("name"),
+                "pages_count": len(pages),
+                "pages": pages,
+                "version": data.get("version"),
+                "last_modified": data.get("lastModified"),
+                "cache": cache_status,
+                "mode": "shallow" if shallow else "full"
+            }
         except Exception as e:
-            print(f"❌ Error getting file structure: {str(e)}")
+            logger.error("❌ Error getting file structure: %s", e)
             return {
                 "success": False,
                 "error": f"Error obteniendo la estructura del archivo: {str(e)}"
@@ -471,31 +959,30 @@ class FigmaClient:
     async def get_all_teams(self) -> List[Dict[str, Any]]:
         """Obtener todos los equipos disponibles para el usuario sin filtrar"""
         try:
-            print("\n🔍 DEBUG - Obteniendo TODOS los equipos de Figma...")
+            logger.debug("🔍 Obteniendo TODOS los equipos de Figma...")
             
-            async with aiohttp.ClientSession() as session:
+            async with self._session_scope() as session:
                 # Llamada directa a la API de equipos
-                print("📡 Llamando a API: GET /v1/teams")
-                async with session.get(f"{self.base_url}/teams", headers=self.headers) as response:
+                logger.debug("📡 Llamando a API: GET /v1/teams")
+                async with self._get(session, f"{self.base_url}/teams", headers=self.headers) as response:
                     response_text = await response.text()
-                    print(f"📊 Respuesta completa de /teams:")
-                    print(response_text)
+                    logger.debug("📊 Respuesta completa de /teams: %s", truncate(response_text))
                     
                     if response.status == 200:
                         try:
                             teams_data = json.loads(response_text)
                             teams = teams_data.get("teams", [])
-                            print(f"✅ Respuesta exitosa - Status: {response.status}")
-                            print(f"🏢 TODOS los equipos encontrados: {len(teams)}")
+                            logger.info("✅ Respuesta exitosa - Status: %s", response.status)
+                            logger.info("🏢 TODOS los equipos encontrados: %s", len(teams))
                             
                             all_teams = []
                             for team in teams:
                                 team_name = team.get("name", "Sin nombre")
                                 team_id = team.get("id", "ID desconocido")
-                                print(f"\n🏢 Equipo: {team_name}")
-                                print(f"   🆔 ID: {team_id}")
-                                print(f"   📊 URL API: {self.base_url}/teams/{team_id}/projects")
-                                print(f"   🔗 URL Web: https://www.figma.com/files/team/{team_id}")
+                                logger.debug("🏢 Equipo: %s", team_name)
+                                logger.debug("   🆔 ID: %s", team_id)
+                                logger.debug("   📊 URL API: %s/teams/%s/projects", self.base_url, team_id)
+                                logger.debug("   🔗 URL Web: https://www.figma.com/files/team/%s", team_id)
                                 
                                 all_teams.append({
                                     "id": team_id,
@@ -509,7 +996,7 @@ class FigmaClient:
                             found = any(team["id"] == specific_team_id for team in all_teams)
                             
                             if not found:
-                                print(f"\n📌 Añadiendo manualmente el equipo conocido ID: {specific_team_id}")
+                                logger.debug("📌 Añadiendo manualmente el equipo conocido ID: %s", specific_team_id)
                                 all_teams.append({
                                     "id": specific_team_id,
                                     "name": "Website Team",
@@ -520,30 +1007,30 @@ class FigmaClient:
                             return all_teams
                             
                         except json.JSONDecodeError:
-                            print(f"❌ Error decodificando JSON de equipos")
+                            logger.error("❌ Error decodificando JSON de equipos")
                             return []
                     else:
-                        print(f"❌ Error al obtener equipos: {response.status}")
-                        print(f"   Error: {response_text}")
+                        logger.error("❌ Error al obtener equipos: %s", response.status)
+                        logger.error("   Error: %s", response_text)
                         return []
         except Exception as e:
-            print(f"❌ Error getting all teams: {e}")
+            logger.error("❌ Error getting all teams: %s", e)
             return []
 
     async def check_team_access(self, team_id: str) -> Dict[str, Any]:
         """Verificar si tenemos acceso a un equipo específico"""
         try:
-            print(f"🔍 Verificando acceso al equipo {team_id}...")
+            logger.debug("🔍 Verificando acceso al equipo %s...", team_id)
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"{self.base_url}/teams/{team_id}/projects", headers=self.headers) as response:
+            async with self._session_scope() as session:
+                async with self._get(session, f"{self.base_url}/teams/{team_id}/projects", headers=self.headers) as response:
                     if response.status == 200:
                         # Si podemos obtener los proyectos, entonces tenemos acceso
                         data = await response.json()
                         team_name = data.get("name", f"Equipo {team_id}")
                         projects_count = len(data.get("projects", []))
                         
-                        print(f"✅ Acceso confirmado a equipo {team_name} con {projects_count} proyectos")
+                        logger.info("✅ Acceso confirmado a equipo %s con %s proyectos", team_name, projects_count)
                         return {
                             "accessible": True,
                             "team_id": team_id,
@@ -551,92 +1038,274 @@ class FigmaClient:
                             "projects_count": projects_count
                         }
                     else:
-                        print(f"❌ Sin acceso al equipo {team_id} - Status: {response.status}")
+                        logger.error("❌ Sin acceso al equipo %s - Status: %s", team_id, response.status)
                         return {
                             "accessible": False,
                             "team_id": team_id,
                             "error": f"HTTP Status: {response.status}"
                         }
         except Exception as e:
-            print(f"❌ Error verificando acceso al equipo {team_id}: {str(e)}")
+            logger.error("❌ Error verificando acceso al equipo %s: %s", team_id, e)
             return {
                 "accessible": False,
                 "team_id": team_id,
                 "error": str(e)
             }
 
-    async def get_frame_details(self, file_key: str, frame_id: str) -> Dict[str, Any]:
-        """Obtener detalles completos de un frame específico"""
+    @staticmethod
+    def _build_frame_details(file_key: str, frame_id: str, frame_data: Dict[str, Any]) -> Dict[str, Any]:
+        # Datos del frame que se entregan al generador de código
+        return {
+            "id": frame_id,
+            "name": frame_data.get("name", "Sin nombre"),
+            "type": frame_data.get("type", "FRAME"),
+            "width": frame_data.get("absoluteBoundingBox", {}).get("width"),
+            "height": frame_data.get("absoluteBoundingBox", {}).get("height"),
+            "background_color": frame_data.get("backgroundColor"),
+            "children": frame_data.get("children", []),
+            "styles": frame_data.get("styles", {}),
+            "layout": frame_data.get("layoutMode"),
+            "constraints": frame_data.get("constraints", {}),
+            "effects": frame_data.get("effects", []),
+            "file_key": file_key,
+            "raw_data": frame_data  # Incluir datos completos para análisis
+        }
+
+    async def get_frames_details_batch(
+        self,
+        file_key: str,
+        frame_ids: List[str],
+        include_images: bool = True,
+        concurrency: int = 4
+    ) -> Dict[str, Any]:
+        """Obtener detalles y render de varios frames con pocas peticiones
+
+        Figma acepta ids separados por comas tanto en /files/{key}/nodes como en
+        /images/{key}; los ids se agrupan en bloques (por cantidad y longitud de
+        URL) y cada bloque se pide una sola vez. El resultado se reparte por frame.
+        """
+        try:
+            unique_ids = list(dict.fromkeys(i for i in frame_ids if i))
+            chunks = _chunk_ids(unique_ids, BATCH_CHUNK_SIZE, BATCH_MAX_IDS_CHARS)
+            semaphore = asyncio.Semaphore(max(1, concurrency))
+            logger.debug("🔍 Obteniendo %s frames de %s en %s bloque(s)...", len(unique_ids), file_key, len(chunks))
+
+            async def fetch_nodes(chunk: List[str]) -> Dict[str, Any]:
+                async with semaphore:
+                    ids_param = ",".join(chunk)
+                    logger.debug("📡 Llamando a API: GET /v1/files/%s/nodes (%s ids)", file_key, len(chunk))
+                    async with self._session_scope() as session:
+                        async with self._get(session, f"{self.base_url}/files/{file_key}/nodes?ids={ids_param}", headers=self.headers) as response:
+                            if response.status != 200:
+                                error_text = await response.text()
+                                logger.error("❌ Error al obtener bloque de nodos: %s", response.status)
+                                return {"error": f"Error al obtener detalles del frame: HTTP {response.status}", "raw_error": error_text}
+                            data = await response.json()
+                            return {"nodes": data.get("nodes", {})}
+
+            async def fetch_images(chunk: List[str]) -> Dict[str, Any]:
+                async with semaphore:
+                    ids_param = ",".join(chunk)
+                    logger.debug("📡 Obteniendo renders: GET /v1/images/%s (%s ids)", file_key, len(chunk))
+                    async with self._session_scope() as session:
+                        async with self._get(session, f"{self.base_url}/images/{file_key}?ids={ids_param}&format=png&scale=2", headers=self.headers) as response:
+                            if response.status != 200:
+                                logger.warning("⚠️ No se pudieron obtener las imágenes del bloque - Status: %s", response.status)
+                                return {}
+                            data = await response.json()
+                            return data.get("images") or {}
+
+            node_tasks = [fetch_nodes(chunk) for chunk in chunks]
+            image_tasks = [fetch_images(chunk) for chunk in chunks] if include_images else []
+            outcomes = await asyncio.gather(*node_tasks, *image_tasks, return_exceptions=True)
+            node_outcomes = outcomes[:len(node_tasks)]
+            image_outcomes = outcomes[len(node_tasks):]
+
+            images: Dict[str, Any] = {}
+            for outcome in image_outcomes:
+                if isinstance(outcome, dict):
+                    images.update(outcome)
+
+            frames: Dict[str, Dict[str, Any]] = {}
+            for chunk, outcome in zip(chunks, node_outcomes):
+                if isinstance(outcome, BaseException) or "error" in outcome:
+                    error = str(outcome) if isinstance(outcome, BaseException) else outcome["error"]
+                    for frame_id in chunk:
+                        frames[frame_id] = {"success": False, "error": error}
+                    continue
+                for frame_id in chunk:
+                    frame_data = (outcome["nodes"].get(frame_id) or {}).get("document") or {}
+                    if not frame_data:
+                        frames[frame_id] = {"success": False, "error": "No se encontraron datos del frame"}
+                        continue
+                    frame_details = self._build_frame_details(file_key, frame_id, frame_data)
+                    if include_images:
+                        frame_details["image_url"] = images.get(frame_id)
+                        frame_details["image_proxy_url"] = self.render_proxy_url(file_key, frame_id, frame_details["image_url"])
+                    frames[frame_id] = {"success": True, "frame": frame_details}
+
+            found = sum(1 for f in frames.values() if f["success"])
+            logger.info("✅ %s/%s frames obtenidos con %s peticiones", found, len(unique_ids), len(node_tasks) + len(image_tasks))
+            return {
+                "success": True,
+                "frames": frames,
+                "requests": len(node_tasks) + len(image_tasks)
+            }
+        except Exception as e:
+            logger.error("❌ Error getting frames batch: %s", e)
+            return {
+                "success": False,
+                "error": f"Error obteniendo detalles de los frames: {str(e)}"
+            }
+
+    async def _fetch_frame_render(self, file_key: str, frame_id: str) -> Optional[str]:
+        # Pedir a Figma el render PNG de un frame (rasterizado en el servidor, suele ser lo más lento)
+        logger.debug("📡 Obteniendo render del frame: GET /v1/images/%s?ids=%s", file_key, frame_id)
+        async with self._session_scope() as session:
+            async with self._get(
+                session,
+                f"{self.base_url}/images/{file_key}?ids={frame_id}&format={FRAME_RENDER_FORMAT}&scale={FRAME_RENDER_SCALE}",
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(total=RENDER_FETCH_TIMEOUT)
+            ) as img_response:
+                if img_response.status == 200:
+                    img_data = await img_response.json()
+                    return (img_data.get("images") or {}).get(frame_id)
+                logger.warning("⚠️ No se pudo obtener la imagen del frame - Status: %s", img_response.status)
+                return None
+
+    def _start_frame_render(self, file_key: str, frame_id: str) -> "asyncio.Task":
+        # Lanzar (o reutilizar) la petición de render en segundo plano
+        key = (file_key, frame_id)
+        task = self._pending_renders.get(key)
+        if task is not None:
+            failed = task.done() and (task.cancelled() or task.exception() is not None or task.result() is None)
+            if not failed:
+                return task
+
+        async def timed_render() -> Optional[str]:
+            render_started = time.perf_counter()
+            try:
+                return await self._fetch_frame_render(file_key, frame_id)
+            finally:
+                self._render_durations[key] = round((time.perf_counter() - render_started) * 1000, 1)
+
+        task = asyncio.create_task(timed_render())
+        self._pending_renders[key] = task
+
+        def forget():
+            if self._pending_renders.get(key) is task:
+                self._pending_renders.pop(key, None)
+                self._render_durations.pop(key, None)
+
+        # Conservar el resultado un tiempo para resolverlo después; luego liberarlo
+        task.add_done_callback(lambda _: asyncio.get_running_loop().call_later(PENDING_RENDER_TTL, forget))
+        return task
+
+    async def resolve_frame_render(self, file_key: str, frame_id: str, timeout: Optional[float] = None) -> Optional[str]:
+        """Resolver el render de un frame que get_frame_details dejó pendiente
+
+        Espera como máximo `timeout` segundos (sin cancelar la petición en curso);
+        devuelve None si el render aún no está listo o falló.
+        """
+        task = self._start_frame_render(file_key, frame_id)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning("⏳ Render del frame %s todavía pendiente", frame_id)
+            return None
+        except Exception as e:
+            logger.warning("⚠️ Error obteniendo render del frame %s: %s", frame_id, e)
+            return None
+
+    async def get_frame_details(
+        self,
+        file_key: str,
+        frame_id: str,
+        include_image: bool = True,
+        render_timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Obtener detalles completos de un frame específico
+
+        Los nodos y el render se piden en paralelo. Una vez llegan los nodos, el
+        render se espera como mucho `render_timeout` segundos más; si no está
+        listo, `image_url` queda en None con `image_status="pending"` y puede
+        resolverse después con `resolve_frame_render`.
+        """
+        started = time.perf_counter()
+        render_task = None
         try:
-            print(f"\n🔍 DEBUG - Obteniendo detalles del frame {frame_id} en archivo {file_key}...")
+            logger.debug("🔍 Obteniendo detalles del frame %s en archivo %s...", frame_id, file_key)
             
-            # Primero necesitamos obtener más detalles con el endpoint de nodos
-            print(f"📡 Llamando a API: GET /v1/files/{file_key}/nodes?ids={frame_id}")
+            if include_image:
+                render_task = self._start_frame_render(file_key, frame_id)
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
+            logger.debug("📡 Llamando a API: GET /v1/files/%s/nodes?ids=%s", file_key, frame_id)
+            
+            async with self._session_scope() as session:
+                async with self._get(
+                    session,
                     f"{self.base_url}/files/{file_key}/nodes?ids={frame_id}",
                     headers=self.headers
                 ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        print(f"✅ Respuesta exitosa - Status: {response.status}")
-                        
-                        # Extraer datos del frame específico
-                        nodes = data.get("nodes", {})
-                        frame_data = nodes.get(frame_id, {}).get("document", {})
-                        
-                        if not frame_data:
-                            return {
-                                "success": False,
-                                "error": "No se encontraron datos del frame"
-                            }
-                        
-                        # Extraer elementos hijos del frame con sus propiedades
-                        frame_details = {
-                            "id": frame_id,
-                            "name": frame_data.get("name", "Sin nombre"),
-                            "type": frame_data.get("type", "FRAME"),
-                            "width": frame_data.get("absoluteBoundingBox", {}).get("width"),
-                            "height": frame_data.get("absoluteBoundingBox", {}).get("height"),
-                            "background_color": frame_data.get("backgroundColor"),
-                            "children": frame_data.get("children", []),
-                            "styles": frame_data.get("styles", {}),
-                            "layout": frame_data.get("layoutMode"),
-                            "constraints": frame_data.get("constraints", {}),
-                            "effects": frame_data.get("effects", []),
-                            "file_key": file_key,
-                            "raw_data": frame_data  # Incluir datos completos para análisis
-                        }
-                        
-                        # Obtener también las imágenes/renderizaciones del frame
-                        print(f"📡 Obteniendo render del frame: GET /v1/images/{file_key}?ids={frame_id}")
-                        
-                        async with session.get(
-                            f"{self.base_url}/images/{file_key}?ids={frame_id}&format=png&scale=2",
-                            headers=self.headers
-                        ) as img_response:
-                            if img_response.status == 200:
-                                img_data = await img_response.json()
-                                frame_details["image_url"] = img_data.get("images", {}).get(frame_id)
-                            else:
-                                print(f"⚠️ No se pudo obtener la imagen del frame - Status: {img_response.status}")
-                        
-                        return {
-                            "success": True,
-                            "frame": frame_details
-                        }
-                    else:
+                    if response.status != 200:
                         error_text = await response.text()
-                        print(f"❌ Error al obtener detalles del frame: {response.status}")
-                        print(f"   Error: {error_text}")
+                        logger.error("❌ Error al obtener detalles del frame: %s", response.status)
+                        logger.error("   Error: %s", error_text)
                         return {
                             "success": False,
                             "error": f"Error al obtener detalles del frame: HTTP {response.status}",
-                            "raw_error": error_text
+                            "raw_error": error_text,
+                            "rate_limited": response.status == 429
                         }
+                    data = await response.json()
+            nodes_ms = round((time.perf_counter() - started) * 1000, 1)
+            logger.info("✅ Nodos recibidos en %s ms", nodes_ms)
+            
+            # Extraer datos del frame específico
+            frame_data = (data.get("nodes", {}).get(frame_id) or {}).get("document", {})
+            
+            if not frame_data:
+                return {
+                    "success": False,
+                    "error": "No se encontraron datos del frame"
+                }
+            
+            # Extraer elementos hijos del frame con sus propiedades
+            frame_details = self._build_frame_details(file_key, frame_id, frame_data)
+            
+            image_status = "skipped"
+            render_ms = None
+            if render_task is not None:
+                timeout = RENDER_WAIT_TIMEOUT if render_timeout is None else render_timeout
+                waited_started = time.perf_counter()
+                frame_details["image_url"] = await self.resolve_frame_render(file_key, frame_id, timeout=timeout)
+                frame_details["image_proxy_url"] = self.render_proxy_url(file_key, frame_id, frame_details["image_url"])
+                if render_task.done():
+                    image_status = "ready" if frame_details["image_url"] else "failed"
+                    render_ms = self._render_durations.get((file_key, frame_id))
+                else:
+                    image_status = "pending"
+                render_wait_ms = round((time.perf_counter() - waited_started) * 1000, 1)
+            else:
+                render_wait_ms = 0.0
+            frame_details["image_status"] = image_status
+            
+            return {
+                "success": True,
+                "frame": frame_details,
+                "metadata": {
+                    "image_status": image_status,
+                    "timings": {
+                        "nodes_ms": nodes_ms,
+                        "render_ms": render_ms,
+                        "render_wait_ms": render_wait_ms,
+                        "total_ms": round((time.perf_counter() - started) * 1000, 1)
+                    }
+                }
+            }
         except Exception as e:
-            print(f"❌ Error getting frame details: {str(e)}")
+            logger.error("❌ Error getting frame details: %s", e)
             return {
                 "success": False,
                 "error": f"Error obteniendo detalles del frame: {str(e)}"
@@ -644,36 +1313,44 @@ class FigmaClient:
 
     async def get_file_components_and_styles(self, file_key: str) -> Dict[str, Any]:
         """Obtener componentes y estilos de un archivo de Figma"""
+        # Las dos peticiones van siempre juntas: se agrupan bajo la URL de /components
+        return await self._coalesced(
+            f"{self.base_url}/files/{file_key}/components",
+            lambda: self._fetch_components_and_styles(file_key),
+            variant="with-styles"
+        )
+
+    async def _fetch_components_and_styles(self, file_key: str) -> Dict[str, Any]:
         try:
             components = []
             styles = []
             
-            async with aiohttp.ClientSession() as session:
-                print(f"\n🔍 DEBUG - Obteniendo componentes del archivo {file_key}...")
-                print(f"📡 Llamando a API: GET /v1/files/{file_key}/components")
+            async with self._session_scope() as session:
+                logger.debug("🔍 Obteniendo componentes del archivo %s...", file_key)
+                logger.debug("📡 Llamando a API: GET /v1/files/%s/components", file_key)
                 
-                async with session.get(f"{self.base_url}/files/{file_key}/components", headers=self.headers) as response:
+                async with self._get(session, f"{self.base_url}/files/{file_key}/components", headers=self.headers) as response:
                     if response.status == 200:
                         data = await response.json()
                         components = data.get("meta", {}).get("components", [])
-                        print(f"✅ Componentes encontrados: {len(components)}")
+                        logger.info("✅ Componentes encontrados: %s", len(components))
                     else:
                         error_text = await response.text()
-                        print(f"⚠️ Error obteniendo componentes: {response.status}")
-                        print(f"   Error: {error_text}")
+                        logger.warning("⚠️ Error obteniendo componentes: %s", response.status)
+                        logger.warning("   Error: %s", error_text)
                 
-                print(f"\n🔍 DEBUG - Obteniendo estilos del archivo {file_key}...")
-                print(f"📡 Llamando a API: GET /v1/files/{file_key}/styles")
+                logger.debug("🔍 Obteniendo estilos del archivo %s...", file_key)
+                logger.debug("📡 Llamando a API: GET /v1/files/%s/styles", file_key)
                 
-                async with session.get(f"{self.base_url}/files/{file_key}/styles", headers=self.headers) as response:
+                async with self._get(session, f"{self.base_url}/files/{file_key}/styles", headers=self.headers) as response:
                     if response.status == 200:
                         data = await response.json()
                         styles = data.get("meta", {}).get("styles", [])
-                        print(f"✅ Estilos encontrados: {len(styles)}")
+                        logger.info("✅ Estilos encontrados: %s", len(styles))
                     else:
                         error_text = await response.text()
-                        print(f"⚠️ Error obteniendo estilos: {response.status}")
-                        print(f"   Error: {error_text}")
+                        logger.warning("⚠️ Error obteniendo estilos: %s", response.status)
+                        logger.warning("   Error: %s", error_text)
             
             return {
                 "success": True,
@@ -681,12 +1358,112 @@ class FigmaClient:
                 "styles": styles
             }
         except Exception as e:
-            print(f"❌ Error obteniendo componentes y estilos: {str(e)}")
+            logger.error("❌ Error obteniendo componentes y estilos: %s", e)
             return {
                 "success": False,
                 "error": f"Error obteniendo componentes y estilos: {str(e)}"
             }
 
+    async def get_design_tokens(self, file_key: str) -> Dict[str, Any]:
+        """Tabla de design tokens del archivo (colores, tipografía, efectos y espaciado)
+
+        Se calcula una vez por (file_key, versión) a partir de los estilos
+        publicados y se guarda en `design_token_cache`; mientras la versión no
+        cambie, la generación la reutiliza sin volver a llamar a Figma. Incluye
+        también el listado compacto de estilos y componentes para el preámbulo
+        del prompt.
+        """
+        try:
+            version_info = await self.get_file_version(file_key)
+            if not version_info["success"]:
+                return version_info
+            version = version_info["version"]
+            entry = await asyncio.to_thread(design_token_cache.get, file_key, version)
+            if entry is not None:
+                return dict(entry, success=True, cache="hit")
+            return await figma_single_flight.do(
+                ("TOKENS", self.access_token, file_key, version),
+                lambda: self._build_design_tokens(file_key, version)
+            )
+        except Exception as e:
+            logger.error("❌ Error obteniendo design tokens: %s", e)
+            return {
+                "success": False,
+                "error": f"Error obteniendo design tokens: {str(e)}"
+            }
+
+    async def _build_design_tokens(self, file_key: str, version: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        comp_styles = await self.get_file_components_and_styles(file_key)
+        if not comp_styles.get("success"):
+            return comp_styles
+        styles = comp_styles.get("styles") or []
+        components = comp_styles.get("components") or []
+
+        # Los valores salen de los nodos de cada estilo; la escala de espaciado,
+        # del auto-layout de una muestra estable de componentes publicados
+        style_ids = [style["node_id"] for style in styles if style.get("node_id")]
+        sample_ids = sorted(c["node_id"] for c in components if c.get("node_id"))[:SPACING_SAMPLE_COMPONENTS]
+        style_nodes, component_nodes = await asyncio.gather(
+            self._fetch_nodes(file_key, style_ids),
+            self._fetch_nodes(file_key, sample_ids, depth=SPACING_SAMPLE_DEPTH)
+        )
+        tokens = build_token_table(styles, style_nodes["nodes"], component_nodes["nodes"].values())
+        entry = {
+            "file_key": file_key,
+            "version": version,
+            "tokens": tokens,
+            "css": tokens_to_css(tokens),
+            "counts": token_counts(tokens),
+            "unresolved_styles": sorted(
+                style.get("name") or "" for style in styles if style.get("node_id") not in style_nodes["nodes"]
+            ),
+            # Listado compacto para el preámbulo del prompt (build_design_system_preamble)
+            "styles": [
+                {"name": style.get("name"), "style_type": style.get("style_type"), "description": style.get("description")}
+                for style in styles
+            ],
+            "components": [
+                {"name": component.get("name"), "description": component.get("description")}
+                for component in components
+            ],
+        }
+        build_ms = round((time.perf_counter() - started) * 1000, 1)
+        failed = style_nodes["failed"] + component_nodes["failed"]
+        if failed:
+            # Tabla incompleta: se devuelve pero no se guarda, el siguiente intento la recalcula
+            logger.warning("⚠️ Design tokens de %s@%s incompletos (%s bloques de nodos fallidos)", file_key, version, failed)
+            return dict(entry, success=True, cache="partial", build_ms=build_ms)
+        await asyncio.to_thread(design_token_cache.put, file_key, version, entry, build_ms)
+        logger.info("🎨 Design tokens de %s@%s calculados en %s ms: %s", file_key, version, build_ms, entry["counts"])
+        return dict(entry, success=True, cache="miss", build_ms=build_ms)
+
+    async def _fetch_nodes(self, file_key: str, node_ids: List[str], depth: Optional[int] = None, concurrency: int = 4) -> Dict[str, Any]:
+        """Nodos de /files/{key}/nodes pedidos en bloques; {"nodes": {id: documento}, "requests", "failed"}"""
+        unique_ids = list(dict.fromkeys(i for i in node_ids if i))
+        chunks = _chunk_ids(unique_ids, BATCH_CHUNK_SIZE, BATCH_MAX_IDS_CHARS)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        depth_param = f"&depth={depth}" if depth else ""
+
+        async def fetch(chunk: List[str]) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                logger.debug("📡 Llamando a API: GET /v1/files/%s/nodes (%s ids)", file_key, len(chunk))
+                async with self._session_scope() as session:
+                    url = f"{self.base_url}/files/{file_key}/nodes?ids={','.join(chunk)}{depth_param}"
+                    async with self._get(session, url, headers=self.headers) as response:
+                        if response.status != 200:
+                            logger.warning("⚠️ Error al obtener bloque de nodos: %s", response.status)
+                            return None
+                        return (await response.json()).get("nodes", {})
+
+        results = await asyncio.gather(*(fetch(chunk) for chunk in chunks))
+        nodes = {}
+        for result in results:
+            for node_id, node in (result or {}).items():
+                if node and node.get("document"):
+                    nodes[node_id] = node["document"]
+        return {"nodes": nodes, "requests": len(chunks), "failed": sum(1 for result in results if result is None)}
+
     async def get_file_complete_details(self, file_key: str) -> Dict[str, Any]:
         """Obtener todos los detalles disponibles de un archivo de Figma"""
         try:
@@ -710,20 +1487,196 @@ class FigmaClient:
                 "styles": comp_styles.get("styles", [])
             }
         except Exception as e:
-            print(f"❌ Error obteniendo detalles completos: {str(e)}")
+            logger.error("❌ Error obteniendo detalles completos: %s", e)
             return {
                 "success": False,
                 "error": f"Error obteniendo detalles completos: {str(e)}"
             }
             
-    async def get_components_with_thumbnails(self, file_key: str) -> Dict[str, Any]:
+    def render_proxy_url(
+        self,
+        file_key: str,
+        node_id: str,
+        image_url: Optional[str],
+        scale: float = FRAME_RENDER_SCALE,
+        image_format: str = FRAME_RENDER_FORMAT,
+        version: Optional[str] = None
+    ) -> Optional[str]:
+        """Ruta del proxy local para un render cuya URL de S3 ya se conoce
+
+        Recuerda esa URL para que el proxy la descargue sin volver a pedir el
+        render a Figma. Si no se indica versión se usa la validada recientemente.
+        """
+        if not image_url:
+            return None
+        version = version or figma_file_cache.fresh_version(file_key)
+        render_cache.remember_source(file_key, node_id, scale, image_format, image_url, version)
+        return render_proxy_path(file_key, node_id, scale, image_format, version)
+
+    async def get_cached_render(
+        self,
+        file_key: str,
+        node_id: str,
+        scale: float = FRAME_RENDER_SCALE,
+        image_format: str = FRAME_RENDER_FORMAT,
+        version: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Render de un nodo guardado en disco, descargándolo una sola vez
+
+        La entrada se identifica por (file_key, node_id, versión, escala, formato);
+        sin versión explícita se usa la actual del archivo. Descargas simultáneas
+        del mismo render comparten una sola petición.
+        """
+        try:
+            if not version:
+                version_info = await self.get_file_version(file_key)
+                if not version_info["success"]:
+                    return version_info
+                version = version_info["version"]
+            key = render_key(file_key, node_id, version, scale, image_format)
+            found = await asyncio.to_thread(render_cache.find, key)
+            if found is not None:
+                return {"success": True, "path": found[0], "key": key, "version": version, "cache": "hit"}
+            return await figma_single_flight.do(
+                ("RENDER", key),
+                lambda: self._download_render(file_key, node_id, scale, image_format, version, key)
+            )
+        except Exception as e:
+            logger.error("❌ Error obteniendo render cacheado: %s", e)
+            return {
+                "success": False,
+                "error": f"Error obteniendo el render: {str(e)}"
+            }
+
+    async def _download_render(self, file_key: str, node_id: str, scale: float, image_format: str, version: str, key: str) -> Dict[str, Any]:
+        data = None
+        async with self._session_scope() as session:
+            # Primero la URL de S3 que ya entregó Figma (p. ej. en el lote de miniaturas)
+            url = render_cache.source_for(file_key, node_id, scale, image_format, version)
+            if url:
+                render_cache.stats["source_reuses"] += 1
+                data = await render_cache.download(session, url)
+            if data is None:
+                renders = await self.get_node_renders(file_key, [node_id], scale=scale, image_format=image_format, version=version)
+                url = renders["images"].get(node_id)
+                if not url:
+                    if node_id in renders["failed"]:
+                        # El bloque falló (429, 5xx o timeout): no es que el nodo no tenga render
+                        status = renders["failed"][node_id]
+                        return {
+                            "success": False,
+                            "error": f"Figma no respondió al pedir el render del nodo {node_id} (HTTP {status or 'sin respuesta'})",
+                            "rate_limited": status == 429
+                        }
+                    return {"success": False, "error": f"Figma no devolvió el render del nodo {node_id}", "not_found": True}
+                data = await render_cache.download(session, url)
+        if data is None:
+            return {"success": False, "error": f"No se pudo descargar el render del nodo {node_id}"}
+        path = await asyncio.to_thread(render_cache.store, key, image_format, data)
+        logger.info("💾 Render %s@%s guardado en disco (%s bytes)", node_id, version, len(data))
+        return {"success": True, "path": path, "key": key, "version": version, "cache": "miss"}
+
+    async def get_node_renders(
+        self,
+        file_key: str,
+        node_ids: List[str],
+        scale: float = THUMBNAIL_SCALE,
+        image_format: str = THUMBNAIL_FORMAT,
+        chunk_size: int = THUMBNAIL_CHUNK_SIZE,
+        concurrency: int = THUMBNAIL_CONCURRENCY,
+        version: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Renders de muchos nodos en bloques de /images pedidos en paralelo
+
+        Los ids se agrupan por cantidad y longitud de URL, y como mucho
+        `concurrency` bloques van en paralelo. Si un bloque falla (error HTTP o
+        timeout) se reintenta partido en dos, hasta THUMBNAIL_SPLIT_DEPTH veces,
+        para que un nodo que Figma no consigue rasterizar no deje sin imagen al
+        resto; un 429 no se parte (más peticiones sólo empeorarían el límite).
+        Los resultados de los bloques se combinan; los nodos sin render quedan
+        en `missing`, y los de bloques que fallaron además en `failed` con el
+        status HTTP del último intento (None si fue un timeout o error de red).
+        """
+        unique_ids = list(dict.fromkeys(i for i in node_ids if i))
+        chunks = _chunk_ids(unique_ids, max(1, chunk_size), BATCH_MAX_IDS_CHARS)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        stats = {"requests": 0, "failed_chunks": 0, "split_chunks": 0}
+        failed: Dict[str, Optional[int]] = {}
+        started = time.perf_counter()
+
+        async def fetch_chunk(chunk: List[str], session: aiohttp.ClientSession) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+            async with semaphore:
+                stats["requests"] += 1
+                url = f"{self.base_url}/images/{file_key}?ids={','.join(chunk)}&format={image_format}&scale={scale:g}"
+                if version:
+                    url += f"&version={version}"
+                try:
+                    async with self._get(session, url, headers=self.headers, timeout=aiohttp.ClientTimeout(total=THUMBNAIL_CHUNK_TIMEOUT)) as response:
+                        if response.status == 200:
+                            data = await response.json()
+                            return data.get("images") or {}, response.status
+                        logger.warning("⚠️ Bloque de %s renders falló - Status: %s", len(chunk), response.status)
+                        return None, response.status
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning("⚠️ Bloque de %s renders falló: %s", len(chunk), type(e).__name__)
+                    return None, None
+
+        async def render(chunk: List[str], session: aiohttp.ClientSession, splits_left: int) -> Dict[str, Any]:
+            images, status = await fetch_chunk(chunk, session)
+            if images is not None:
+                return images
+            if splits_left > 0 and len(chunk) > 1 and status != 429:
+                stats["split_chunks"] += 1
+                half = len(chunk) // 2
+                parts = await asyncio.gather(
+                    render(chunk[:half], session, splits_left - 1),
+                    render(chunk[half:], session, splits_left - 1)
+                )
+                return {node_id: url for part in parts for node_id, url in part.items()}
+            stats["failed_chunks"] += 1
+            failed.update((node_id, status) for node_id in chunk)
+            return {}
+
+        logger.debug("📡 Solicitando %s renders (%s, escala %g) en %s bloque(s)", len(unique_ids), image_format, scale, len(chunks))
+        async with self._session_scope() as session:
+            outcomes = await asyncio.gather(*(render(chunk, session, THUMBNAIL_SPLIT_DEPTH) for chunk in chunks))
+
+        images: Dict[str, str] = {}
+        for outcome in outcomes:
+            # Figma devuelve null para los nodos que no pudo rasterizar
+            images.update({node_id: url for node_id, url in outcome.items() if url})
+        missing = [node_id for node_id in unique_ids if node_id not in images]
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info("✅ %s/%s renders en %s ms (%s peticiones)", len(images), len(unique_ids), elapsed_ms, stats['requests'])
+        return {
+            "images": images,
+            "missing": missing,
+            "failed": failed,
+            "stats": dict(
+                stats,
+                requested=len(unique_ids),
+                rendered=len(images),
+                chunks=len(chunks),
+                scale=scale,
+                format=image_format,
+                elapsed_ms=elapsed_ms
+            )
+        }
+
+    async def get_components_with_thumbnails(
+        self,
+        file_key: str,
+        scale: Optional[float] = None,
+        image_format: Optional[str] = None
+    ) -> Dict[str, Any]:
         """Obtener componentes con imágenes de vista previa
         
         Este método obtiene todos los componentes de un archivo de Figma
-        y solicita imágenes de vista previa para cada componente.
+        y solicita imágenes de vista previa para cada componente, en bloques
+        pedidos en paralelo (ver `get_node_renders`).
         """
         try:
-            print(f"\n🔍 DEBUG - Obteniendo componentes con imágenes del archivo {file_key}...")
+            logger.debug("🔍 Obteniendo componentes con imágenes del archivo %s...", file_key)
             
             # Paso 1: Obtener todos los componentes del archivo
             comp_result = await self.get_file_components_and_styles(file_key)
@@ -734,108 +1687,108 @@ class FigmaClient:
             components = comp_result.get("components", [])
             
             if not components:
-                print("⚠️ No se encontraron componentes en el archivo")
+                logger.warning("⚠️ No se encontraron componentes en el archivo")
                 return {
                     "success": True,
                     "components": [],
                     "message": "No se encontraron componentes en el archivo"
                 }
                 
-            print(f"✅ Se encontraron {len(components)} componentes")
+            logger.info("✅ Se encontraron %s componentes", len(components))
             
             # Paso 2: Preparar los IDs para solicitar las imágenes
             component_ids = [component.get("node_id") for component in components if component.get("node_id")]
             
             if not component_ids:
-                print("⚠️ No se pudieron extraer IDs de los componentes")
+                logger.warning("⚠️ No se pudieron extraer IDs de los componentes")
                 return {
                     "success": False,
                     "error": "No se pudieron extraer IDs de los componentes",
                     "raw_components": components
                 }
                 
-            # Limitar a 50 componentes para evitar problemas con la API
-            if len(component_ids) > 50:
-                print(f"⚠️ Limitando a 50 componentes de {len(component_ids)} encontrados")
-                component_ids = component_ids[:50]
-                
-            # Paso 3: Solicitar imágenes para los componentes
-            async with aiohttp.ClientSession() as session:
-                print(f"📡 Solicitando imágenes para {len(component_ids)} componentes")
+            # Paso 3: Solicitar imágenes para todos los componentes, por bloques
+            # (la versión del archivo identifica las miniaturas en el proxy local)
+            scale = scale or THUMBNAIL_SCALE
+            image_format = image_format or THUMBNAIL_FORMAT
+            renders, version_info = await asyncio.gather(
+                self.get_node_renders(file_key, component_ids, scale=scale, image_format=image_format),
+                self.get_file_version(file_key)
+            )
+            image_urls = renders["images"]
+            version = version_info.get("version") if version_info.get("success") else None
+            # Si el documento ya está indexado, las variantes se agrupan por su COMPONENT_SET
+            index = self.cached_document_index(file_key, version) if version else None
+            
+            # Paso 4: Combinar los datos de los componentes con sus imágenes
+            components_with_images = []
+            
+            for component in components:
+                # Copia: la lista viene de una respuesta compartida (single-flight) con otras peticiones
+                component = dict(component)
+                node_id = component.get("node_id")
+                if node_id in image_urls:
+                    # Añadir la URL de la imagen al componente (y la del proxy local, que no caduca)
+                    component["thumbnail_url"] = image_urls[node_id]
+                    component["thumbnail_proxy_url"] = self.render_proxy_url(
+                        file_key, node_id, image_urls[node_id], scale=scale, image_format=image_format, version=version
+                    )
+                    
+                # Agregar más información útil
+                component["description"] = component.get("description", "")
+                component["key"] = component.get("key", "")
+                component["name"] = component.get("name", "Componente sin nombre")
+                component["page_name"] = component.get("page_name", component.get("containing_frame", {}).get("name", ""))
                 
-                # Construir la URL con todos los IDs (con formato=png y escala=1)
-                ids_param = ",".join(component_ids)
-                url = f"{self.base_url}/images/{file_key}?ids={ids_param}&format=png&scale=2"
+                # Añadir información sobre variantes: set de variantes al que pertenece o nombre con "/"
+                component_name = component.get("name", "")
+                if index is not None:
+                    base_name, variant_name = index.component_group(node_id, component_name)
+                else:
+                    state_group = (component.get("containing_frame") or {}).get("containingStateGroup") or {}
+                    base_name, variant_name = variant_names(component_name, state_group.get("name"))
+                component["base_name"] = base_name
+                component["is_variant"] = variant_name is not None
+                if variant_name is not None:
+                    component["variant_name"] = variant_name
                 
-                print(f"📡 Llamando a API: GET {url}")
+                components_with_images.append(component)
                 
-                async with session.get(url, headers=self.headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        image_urls = data.get("images", {})
-                        print(f"✅ Se obtuvieron {len(image_urls)} imágenes")
-                        
-                        # Paso 4: Combinar los datos de los componentes con sus imágenes
-                        components_with_images = []
-                        
-                        for component in components:
-                            node_id = component.get("node_id")
-                            if node_id in image_urls:
-                                # Añadir la URL de la imagen al componente
-                                component["thumbnail_url"] = image_urls[node_id]
-                                
-                            # Agregar más información útil
-                            component["description"] = component.get("description", "")
-                            component["key"] = component.get("key", "")
-                            component["name"] = component.get("name", "Componente sin nombre")
-                            component["page_name"] = component.get("page_name", component.get("containing_frame", {}).get("name", ""))
-                            
-                            # Añadir información sobre variantes si está disponible
-                            component_name = component.get("name", "")
-                            if "/" in component_name:
-                                parts = component_name.split("/")
-                                component["base_name"] = parts[0].strip()
-                                component["variant_name"] = "/".join(parts[1:]).strip()
-                                component["is_variant"] = True
-                            else:
-                                component["base_name"] = component_name
-                                component["is_variant"] = False
-                            
-                            components_with_images.append(component)
-                            
-                        # Organizar componentes por grupos de variantes
-                        component_groups = {}
-                        for component in components_with_images:
-                            base_name = component.get("base_name", "")
-                            if not base_name:
-                                base_name = "Sin grupo"
-                                
-                            if base_name not in component_groups:
-                                component_groups[base_name] = []
-                                
-                            component_groups[base_name].append(component)
-                        
-                        return {
-                            "success": True,
-                            "components": components_with_images,
-                            "component_groups": component_groups,
-                            "total_count": len(components_with_images)
-                        }
-                    else:
-                        error_text = await response.text()
-                        print(f"❌ Error obteniendo imágenes: {response.status}")
-                        print(f"   Error: {error_text}")
-                        
-                        # Devolver los componentes sin imágenes como fallback
-                        return {
-                            "success": False,
-                            "error": f"Error obteniendo imágenes: HTTP {response.status}",
-                            "components": components,
-                            "total_count": len(components)
-                        }
+            # Organizar componentes por grupos de variantes
+            component_groups = {}
+            for component in components_with_images:
+                base_name = component.get("base_name", "")
+                if not base_name:
+                    base_name = "Sin grupo"
+                    
+                if base_name not in component_groups:
+                    component_groups[base_name] = []
+                    
+                component_groups[base_name].append(component)
+            
+            return {
+                "success": True,
+                "components": components_with_images,
+                "component_groups": component_groups,
+                "total_count": len(components_with_images),
+                "thumbnails": dict(renders["stats"], missing=renders["missing"])
+            }
         except Exception as e:
-            print(f"❌ Error obteniendo componentes con imágenes: {str(e)}")
+            logger.error("❌ Error obteniendo componentes con imágenes: %s", e)
             return {
                 "success": False,
                 "error": f"Error obteniendo componentes con imágenes: {str(e)}"
             }
+
+
+# Un cliente por token, reutilizado por todos los endpoints
+_clients: Dict[str, FigmaClient] = {}
+
+
+def get_figma_client(access_token: str) -> FigmaClient:
+    """Obtener el cliente de Figma compartido para un token (usa el pool HTTP del proceso)"""
+    client = _clients.get(access_token)
+    if client is None:
+        client = FigmaClient(access_token)
+        _clients[access_token] = client
+    return client
@@ -0,0 +1,366 @@
+import hashlib
+import json
+import math
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from app.models.nodes import NODE_TYPES, NodeTree, type_code
+
+# Campos que el índice conserva de cada nodo (el resto del documento no se retiene)
+INDEX_FIELDS = ("componentId", "backgroundColor")
+
+# Coste aproximado en memoria por nodo de las listas y cadenas de ids/nombres
+_NODE_OVERHEAD_BYTES = 120
+
+# Campos que no cuentan para el hash de un subárbol: identidad, posición absoluta en
+# el lienzo (mover un frame no cambia su código), datos de plugins y de prototipo
+HASH_IGNORED_FIELDS = {
+    "id", "children", "absoluteBoundingBox", "absoluteRenderBounds", "relativeTransform", "size",
+    "pluginData", "sharedPluginData", "exportSettings", "interactions", "reactions", "transitionNodeID",
+    "transitionDuration", "transitionEasing", "prototypeDevice", "flowStartingPoints", "prototypeStartNodeID",
+}
+HASH_SIZE = 16
+_HASH_ENCODER = json.JSONEncoder(sort_keys=True, separators=(",", ":"), default=str)
+
+# Contadores de construcción de índices del proceso (ver /debug/figma-cache)
+index_stats = {
+    "builds": 0,
+    "build_ms_total": 0.0,
+    "nodes_indexed": 0,
+}
+
+
+def variant_names(name: Optional[str], state_group: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """(nombre base, nombre de la variante) de un componente
+
+    Las variantes de un COMPONENT_SET se agrupan por el nombre del set
+    ("Button" + "Size=Small, State=Hover"); el resto, por la convención de
+    nombres con "/" ("Icons/Arrow"). Sin ninguna de las dos no es una variante.
+    """
+    name = name or ""
+    if state_group:
+        return state_group, name
+    if "/" in name:
+        base, _, variant = name.partition("/")
+        return base.strip(), variant.strip()
+    return name, None
+
+
+def _subtree_hashes(root: Dict[str, Any], tree: NodeTree) -> bytes:
+    """Hash de Merkle de cada subárbol, concatenados en el orden de `tree` (HASH_SIZE bytes por nodo)
+
+    El hash de un nodo combina sus propiedades (sin HASH_IGNORED_FIELDS, con el
+    tamaño redondeado) con el hash y la posición relativa de cada hijo, así un
+    cambio en cualquier descendiente cambia el hash de todos sus ancestros y
+    sólo de ellos.
+    """
+    encode = _HASH_ENCODER.encode
+    blake2b = hashlib.blake2b
+    boxes = tree.boxes
+    # Hash de las propiedades propias, en el mismo preorden que NodeTree.from_json
+    own: List[bytes] = []
+    stack: List[Any] = [root]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        offset = len(own) * 4
+        fields = {key: value for key, value in node.items() if key not in HASH_IGNORED_FIELDS}
+        own.append(blake2b(f"{boxes[offset + 2]:.2f}x{boxes[offset + 3]:.2f}{encode(fields)}".encode(), digest_size=HASH_SIZE).digest())
+        children = node.get("children")
+        if children:
+            stack.extend(reversed(children))
+
+    digests: List[bytes] = [b""] * len(own)
+    ends = tree.ends
+    for index in range(len(own) - 1, -1, -1):
+        digest = blake2b(own[index], digest_size=HASH_SIZE)
+        child, end = index + 1, ends[index]
+        if child < end:
+            x, y = boxes[index * 4], boxes[index * 4 + 1]
+            while child < end:
+                digest.update(digests[child])
+                digest.update(f"{boxes[child * 4] - x:.2f},{boxes[child * 4 + 1] - y:.2f};".encode())
+                child = ends[child]
+        digests[index] = digest.digest()
+    return b"".join(digests)
+
+
+def _known_type_code(node_type: str) -> int:
+    # Los filtros llegan de la petición: un tipo desconocido no se registra (no hay nodos de ese tipo)
+    return NODE_TYPES.index(node_type) if node_type in NODE_TYPES else -1
+
+
+class DocumentIndex:
+    """Índice de un documento de Figma construido una vez por (file_key, versión)
+
+    Guarda la estructura del documento como NodeTree (sin propiedades de estilo
+    ni geometría) más tablas derivadas, así listar páginas y frames, buscar un
+    nodo por id, por tipo, por componente o por prefijo de nombre no vuelve a
+    recorrer el árbol de dicts en cada petición:
+
+    - id -> nodo (`NodeTree.find`)
+    - tipo -> índices de sus nodos, en orden del documento
+    - página -> frames de primer nivel
+    - componente -> instancias
+    - nombres ordenados para búsquedas por prefijo (se crea la primera vez)
+    - hash de Merkle de cada subárbol, para comparar versiones (`diff`)
+    """
+
+    def __init__(self, file_data: Dict[str, Any]):
+        started = time.perf_counter()
+        self.name: Optional[str] = file_data.get("name")
+        self.version: Optional[str] = str(file_data["version"]) if file_data.get("version") is not None else None
+        self.last_modified: Optional[str] = file_data.get("lastModified")
+        self.tree = NodeTree.from_json(file_data.get("document") or {}, fields=INDEX_FIELDS)
+        tree = self.tree
+        self._hashes = _subtree_hashes(file_data.get("document") or {}, tree)
+
+        # Metadatos de componentes del archivo (clave pública y descripción)
+        self.components: Dict[str, Dict[str, Any]] = dict(file_data.get("components") or {})
+
+        self._by_type: Dict[int, array] = {}
+        for index, code in enumerate(tree.types):
+            bucket = self._by_type.get(code)
+            if bucket is None:
+                bucket = self._by_type[code] = array("i")
+            bucket.append(index)
+
+        canvas = type_code("CANVAS")
+        frame = type_code("FRAME")
+        self.pages = array("i", (index for index in tree.children(0) if tree.types[index] == canvas)) if len(tree) else array("i")
+        self._page_frames: Dict[int, array] = {
+            page: array("i", (child for child in tree.children(page) if tree.types[child] == frame))
+            for page in self.pages
+        }
+
+        self._instances: Dict[str, array] = {}
+        for index in self._by_type.get(type_code("INSTANCE"), ()):
+            component_id = tree.get(index, "componentId")
+            if component_id:
+                self._instances.setdefault(component_id, array("i")).append(index)
+
+        self._names: Optional[List[str]] = None
+        self._name_order: Optional[array] = None
+        self._structure: Optional[List[Dict[str, Any]]] = None
+        self.build_ms = round((time.perf_counter() - started) * 1000, 1)
+        index_stats["builds"] += 1
+        index_stats["build_ms_total"] = round(index_stats["build_ms_total"] + self.build_ms, 1)
+        index_stats["nodes_indexed"] += len(tree)
+
+    def __len__(self) -> int:
+        return len(self.tree)
+
+    def size_bytes(self) -> int:
+        """Memoria aproximada del índice, para el presupuesto de la caché"""
+        tree = self.tree
+        columns = (tree.types, tree.parents, tree.ends, tree.depths, tree.hidden, tree.boxes)
+        total = sum(column.itemsize * len(column) for column in columns)
+        total += sum(len(value or "") for value in tree.ids) + sum(len(value or "") for value in tree.names)
+        total += sum(bucket.itemsize * len(bucket) for bucket in self._by_type.values()) + len(self._hashes)
+        return total + len(tree) * _NODE_OVERHEAD_BYTES
+
+    # --- Consultas ---------------------------------------------------------------
+
+    def find(self, node_id: str) -> Optional[int]:
+        return self.tree.find(node_id)
+
+    def of_type(self, node_type: str) -> array:
+        return self._by_type.get(_known_type_code(node_type), array("i"))
+
+    def page_of(self, index: int) -> Optional[int]:
+        """Página que contiene un nodo: los subárboles de las páginas son rangos consecutivos"""
+        position = bisect_right(self.pages, index) - 1
+        if position < 0:
+            return None
+        page = self.pages[position]
+        return page if index < self.tree.ends[page] else None
+
+    def frames_of(self, page: int) -> array:
+        return self._page_frames.get(page, array("i"))
+
+    def instances_of(self, component_id: str) -> array:
+        return self._instances.get(component_id, array("i"))
+
+    def with_name_prefix(self, prefix: str) -> Iterator[int]:
+        """Nodos cuyo nombre empieza por `prefix` (sin distinguir mayúsculas), en orden alfabético"""
+        if self._names is None:
+            order = sorted(range(len(self.tree)), key=lambda index: (self.tree.names[index] or "").casefold())
+            self._name_order = array("i", order)
+            self._names = [(self.tree.names[index] or "").casefold() for index in order]
+        prefix = prefix.casefold()
+        position = bisect_left(self._names, prefix)
+        while position < len(self._names) and self._names[position].startswith(prefix):
+            yield self._name_order[position]
+            position += 1
+
+    def search(
+        self,
+        node_type: Optional[str] = None,
+        name_prefix: Optional[str] = None,
+        page_id: Optional[str] = None,
+        component_id: Optional[str] = None,
+    ) -> Iterator[int]:
+        """Nodos que cumplen todos los filtros, partiendo de la tabla más selectiva disponible"""
+        if component_id is not None:
+            candidates: Iterator[int] = iter(self.instances_of(component_id))
+        elif name_prefix:
+            candidates = self.with_name_prefix(name_prefix)
+        elif node_type is not None:
+            candidates = iter(self.of_type(node_type))
+        elif page_id is not None:
+            page = self.find(page_id)
+            candidates = iter(range(page, self.tree.ends[page])) if page is not None else iter(())
+        else:
+            candidates = iter(range(len(self.tree)))
+
+        code = _known_type_code(node_type) if node_type is not None else None
+        page = self.find(page_id) if page_id is not None else None
+        if page_id is not None and page is None:
+            return
+        folded = name_prefix.casefold() if name_prefix else None
+        for index in candidates:
+            if code is not None and self.tree.types[index] != code:
+                continue
+            if folded is not None and not (self.tree.names[index] or "").casefold().startswith(folded):
+                continue
+            if page is not None and not page <= index < self.tree.ends[page]:
+                continue
+            yield index
+
+    def component_group(self, node_id: str, name: Optional[str] = None) -> Tuple[str, Optional[str]]:
+        """(nombre base, variante) de un componente, agrupando por su COMPONENT_SET si lo tiene"""
+        index = self.find(node_id)
+        state_group = None
+        if index is not None:
+            name = self.tree.names[index] if name is None else name
+            parent = self.tree.parents[index]
+            if parent >= 0 and self.tree.type_of(parent) == "COMPONENT_SET":
+                state_group = self.tree.names[parent]
+        return variant_names(name, state_group)
+
+    def subtree_hash(self, index: int) -> str:
+        return self._hashes[index * HASH_SIZE:(index + 1) * HASH_SIZE].hex()
+
+    def _diff_targets(self) -> Dict[str, int]:
+        # Lo que se regenera como componente: frames de primer nivel de cada página y componentes/sets
+        targets = {self.tree.ids[frame]: frame for page in self.pages for frame in self.frames_of(page)}
+        for node_type in ("COMPONENT_SET", "COMPONENT"):
+            for index in self.of_type(node_type):
+                targets[self.tree.ids[index]] = index
+        return targets
+
+    def diff(self, previous: "DocumentIndex") -> Dict[str, Any]:
+        """Frames y componentes añadidos, eliminados o modificados respecto a `previous`
+
+        Se comparan por id y hash de su subárbol; un nodo que sólo se movió en
+        el lienzo o de página no cuenta como modificado.
+        """
+        before, after = previous._diff_targets(), self._diff_targets()
+        added = [self.summary(index) for node_id, index in after.items() if node_id not in before]
+        removed = [previous.summary(index) for node_id, index in before.items() if node_id not in after]
+        changed = []
+        for node_id, index in after.items():
+            old_index = before.get(node_id)
+            if old_index is None:
+                continue
+            old_hash, new_hash = previous.subtree_hash(old_index), self.subtree_hash(index)
+            if old_hash != new_hash:
+                changed.append(dict(self.summary(index), previous_hash=old_hash))
+        return {
+            "from_version": previous.version,
+            "to_version": self.version,
+            "added": added,
+            "removed": removed,
+            "changed": changed,
+            "unchanged_count": len(after) - len(added) - len(changed),
+        }
+
+    def unchanged_since(self, previous: "DocumentIndex", node_ids: List[str]) -> List[str]:
+        """Ids de `node_ids` cuyo subárbol es idéntico en `previous` (los que no hace falta regenerar)"""
+        unchanged = []
+        for node_id in node_ids:
+            index, old_index = self.find(node_id), previous.find(node_id)
+            if index is not None and old_index is not None and self.subtree_hash(index) == previous.subtree_hash(old_index):
+                unchanged.append(node_id)
+        return unchanged
+
+    # --- Vistas ------------------------------------------------------------------
+
+    def summary(self, index: int) -> Dict[str, Any]:
+        """Datos de un nodo para los listados (sin propiedades de estilo)"""
+        tree = self.tree
+        width, height = tree.boxes[index * 4 + 2], tree.boxes[index * 4 + 3]
+        page = self.page_of(index)
+        parent = tree.parents[index]
+        node = {
+            "id": tree.ids[index],
+            "name": tree.names[index],
+            "type": tree.type_of(index),
+            "width": None if math.isnan(width) else width,
+            "height": None if math.isnan(height) else height,
+            "visible": not tree.hidden[index],
+            "parent_id": tree.ids[parent] if parent >= 0 else None,
+            "page_id": tree.ids[page] if page is not None else None,
+            "page_name": tree.names[page] if page is not None else None,
+            "depth": tree.depths[index],
+            "children_count": sum(1 for _ in tree.children(index)),
+            "descendants_count": tree.subtree_size(index) - 1,
+            "hash": self.subtree_hash(index),
+        }
+        component_id = tree.get(index, "componentId")
+        if component_id:
+            node["component_id"] = component_id
+        return node
+
+    def details(self, index: int) -> Dict[str, Any]:
+        """Resumen de un nodo con su ruta desde la página, sus hijos y, si es un componente, sus instancias"""
+        tree = self.tree
+        node = self.summary(index)
+        node["path"] = [tree.names[ancestor] for ancestor in reversed(list(tree.ancestors(index)))][1:]
+        node["children"] = [
+            {"id": tree.ids[child], "name": tree.names[child], "type": tree.type_of(child)}
+            for child in tree.children(index)
+        ]
+        if tree.type_of(index) == "COMPONENT":
+            node["instances_count"] = len(self.instances_of(tree.ids[index]))
+            metadata = self.components.get(tree.ids[index]) or {}
+            node["key"] = metadata.get("key")
+            node["description"] = metadata.get("description", "")
+            node["base_name"], node["variant_name"] = self.component_group(tree.ids[index])
+        return node
+
+    def pages_structure(self, page_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """Páginas y frames de primer nivel, con el mismo formato que la estructura del documento"""
+        if self._structure is None:
+            self._structure = [self._page_structure(page) for page in self.pages]
+        if not page_ids:
+            return self._structure
+        wanted = set(page_ids)
+        return [page for page in self._structure if page["id"] in wanted]
+
+    def _page_structure(self, page: int) -> Dict[str, Any]:
+        tree = self.tree
+        frames = []
+        for frame in self.frames_of(page):
+            box = tree.box(frame) or {}
+            frames.append({
+                "id": tree.ids[frame],
+                "name": tree.names[frame],
+                "type": tree.type_of(frame),
+                "width": box.get("width"),
+                "height": box.get("height"),
+                "background_color": tree.get(frame, "backgroundColor")
+            })
+        return {
+            "id": tree.ids[page],
+            "name": tree.names[page],
+            "type": tree.type_of(page),
+            "frames_count": len(frames),
+            "frames": frames
+        }
+
+    def type_counts(self) -> Dict[str, int]:
+        return {NODE_TYPES[code]: len(bucket) for code, bucket in self._by_type.items()}
@@ -0,0 +1,215 @@
+import aiohttp
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from urllib.parse import quote
+
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+RENDER_CONTENT_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "svg": "image/svg+xml",
+    "pdf": "application/pdf",
+}
+
+# Límite de URLs de S3 recordadas antes de purgar las caducadas
+MAX_KNOWN_SOURCES = 20000
+
+
+def render_key(file_key: str, node_id: str, version: str, scale: float, image_format: str) -> str:
+    """Clave estable de un render: (file_key, node_id, versión del archivo, escala, formato)"""
+    payload = json.dumps([file_key, node_id, str(version), round(float(scale), 3), image_format], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:40]
+
+
+def render_proxy_path(file_key: str, node_id: str, scale: float, image_format: str, version: Optional[str] = None) -> str:
+    """Ruta del proxy local de renders; con `v` la respuesta se puede cachear como inmutable"""
+    path = f"/figma/files/{quote(file_key, safe='')}/renders/{quote(node_id, safe='')}?scale={scale:g}&format={image_format}"
+    if version:
+        path += f"&v={quote(str(version), safe='')}"
+    return path
+
+
+class RenderCache:
+    """Caché en disco de los renders de Figma (PNG/JPG/SVG/PDF) servidos por el proxy local
+
+    Las URLs que devuelve /images apuntan a S3 y caducan; aquí cada render se
+    descarga una vez y se guarda bajo `render_key`, que incluye la versión del
+    archivo, así que una entrada nunca queda obsoleta. El índice (LRU por
+    último acceso) vive en memoria y se reconstruye del directorio al arrancar;
+    si el total supera `disk_budget_bytes` se borran los menos usados.
+
+    También recuerda durante `source_ttl_seconds` las URLs de S3 ya conocidas
+    (p. ej. las de un lote de miniaturas) para no volver a pedir el render.
+    Las descargas simultáneas están limitadas a `max_downloads`.
+    """
+
+    def __init__(self, cache_dir: str, disk_budget_bytes: int, max_downloads: int, source_ttl_seconds: float):
+        self.cache_dir = cache_dir
+        self.disk_budget_bytes = disk_budget_bytes
+        self.max_downloads = max(1, max_downloads)
+        self.source_ttl_seconds = source_ttl_seconds
+        # clave -> (ruta, bytes), de menos a más reciente
+        self._index: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._index_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+        # (file_key, node_id, escala, formato) -> (url, versión o None, momento)
+        self._sources: Dict[Tuple[str, str, float, str], Tuple[str, Optional[str], float]] = {}
+        self._download_semaphore: Optional[asyncio.Semaphore] = None
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "downloads": 0,
+            "download_failures": 0,
+            "source_reuses": 0,
+            "bytes_downloaded": 0,
+            "bytes_served": 0,
+            "evictions": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "RenderCache":
+        return cls(
+            cache_dir=os.getenv("FIGMA_RENDER_CACHE_DIR", os.path.join(".cache", "renders")),
+            disk_budget_bytes=int(float(os.getenv("FIGMA_RENDER_CACHE_MB", "512")) * 1024 * 1024),
+            max_downloads=int(os.getenv("FIGMA_RENDER_DOWNLOAD_CONCURRENCY", "8")),
+            source_ttl_seconds=float(os.getenv("FIGMA_RENDER_URL_TTL_SECONDS", "600")),
+        )
+
+    # --- URLs de S3 conocidas ------------------------------------------------
+
+    def remember_source(self, file_key: str, node_id: str, scale: float, image_format: str, url: str, version: Optional[str] = None):
+        now = time.monotonic()
+        if len(self._sources) >= MAX_KNOWN_SOURCES:
+            # Olvidar las URLs ya caducadas antes de crecer más
+            self._sources = {k: v for k, v in self._sources.items() if now - v[2] <= self.source_ttl_seconds}
+        self._sources[(file_key, node_id, round(float(scale), 3), image_format)] = (url, version, now)
+
+    def source_for(self, file_key: str, node_id: str, scale: float, image_format: str, version: str) -> Optional[str]:
+        """URL de S3 reciente del mismo render (y de la misma versión, si se conocía)"""
+        source = self._sources.get((file_key, node_id, round(float(scale), 3), image_format))
+        if source is None:
+            return None
+        url, source_version, remembered_at = source
+        if time.monotonic() - remembered_at > self.source_ttl_seconds or (source_version and source_version != version):
+            return None
+        return url
+
+    # --- Disco (operaciones bloqueantes: llamar con asyncio.to_thread) -------
+
+    def _path(self, key: str, image_format: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{image_format}")
+
+    def _load_index(self):
+        # Reconstruir el índice LRU desde el directorio (orden por último acceso)
+        if self._loaded:
+            return
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.startswith(".") or name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, name.split(".", 1)[0], path, st.st_size))
+        for _, key, path, size in sorted(entries):
+            self._index[key] = (path, size)
+            self._index_bytes += size
+        self._loaded = True
+
+    def find(self, key: str) -> Optional[Tuple[str, int]]:
+        """Ruta y tamaño del render guardado, o None"""
+        with self._lock:
+            self._load_index()
+            entry = self._index.get(key)
+            if entry is None or not os.path.exists(entry[0]):
+                if entry is not None:
+                    self._index.pop(key, None)
+                    self._index_bytes -= entry[1]
+                self.stats["misses"] += 1
+                return None
+            self._index.move_to_end(key)
+            self.stats["hits"] += 1
+            self.stats["bytes_served"] += entry[1]
+        try:
+            # Marcar como usado para que el orden LRU sobreviva a un reinicio
+            os.utime(entry[0], None)
+        except OSError:
+            pass
+        return entry
+
+    def store(self, key: str, image_format: str, data: bytes) -> str:
+        """Guardar un render de forma atómica y aplicar el presupuesto de disco"""
+        path = self._path(key, image_format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}-{time.monotonic_ns()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._load_index()
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self._index_bytes -= previous[1]
+            self._index[key] = (path, len(data))
+            self._index_bytes += len(data)
+            self.stats["bytes_served"] += len(data)
+            # Expulsar los menos usados (nunca el recién guardado)
+            while self._index_bytes > self.disk_budget_bytes and len(self._index) > 1:
+                _, (old_path, old_size) = self._index.popitem(last=False)
+                self._index_bytes -= old_size
+                self.stats["evictions"] += 1
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+        return path
+
+    # --- Descargas -----------------------------------------------------------
+
+    async def download(self, session: aiohttp.ClientSession, url: str, timeout: float = 60) -> Optional[bytes]:
+        """Descargar un render de S3 (sin el token de Figma), con descargas simultáneas acotadas"""
+        if self._download_semaphore is None:
+            self._download_semaphore = asyncio.Semaphore(self.max_downloads)
+        async with self._download_semaphore:
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                    if response.status != 200:
+                        logger.warning("⚠️ No se pudo descargar el render - Status: %s", response.status)
+                        self.stats["download_failures"] += 1
+                        return None
+                    data = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("⚠️ No se pudo descargar el render: %s", type(e).__name__)
+                self.stats["download_failures"] += 1
+                return None
+        self.stats["downloads"] += 1
+        self.stats["bytes_downloaded"] += len(data)
+        return data
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["entries"] = len(self._index)
+        stats["disk_bytes"] = self._index_bytes
+        stats["disk_budget_bytes"] = self.disk_budget_bytes
+        stats["known_sources"] = len(self._sources)
+        stats["cache_dir"] = self.cache_dir
+        return stats
+
+
+# Caché única por proceso
+render_cache = RenderCache.from_env()
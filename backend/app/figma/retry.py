@@ -0,0 +1,230 @@
+import aiohttp
+import asyncio
+import hashlib
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+
+from app.log import get_logger
+from app.metrics import figma_calls, figma_endpoint, figma_in_flight, figma_latency
+
+logger = get_logger(__name__)
+
+# Respuestas transitorias que merece la pena reintentar
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def _retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    # Retry-After puede venir en segundos o como fecha HTTP
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class AdaptiveConcurrencyLimit:
+    """Límite de peticiones simultáneas que se adapta a la respuesta de Figma (AIMD)
+
+    Cada éxito suma 1/límite (≈ +1 por cada ronda completa de peticiones) y cada
+    429 lo reduce a la mitad. Un Retry-After bloquea todas las peticiones del
+    mismo token hasta que vence, no sólo la que lo recibió.
+    """
+
+    def __init__(self, initial: float, minimum: float, maximum: float):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+
+    async def acquire(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        while True:
+            delay = self.blocked_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            async with self._condition:
+                if self.in_flight < max(1, int(self.limit)):
+                    self.in_flight += 1
+                    return
+                await self._condition.wait()
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_throttled(self, retry_after: Optional[float] = None):
+        self.limit = max(self.minimum, self.limit / 2)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+
+class FigmaRequestLayer:
+    """Capa común de peticiones a la API de Figma: reintentos y control de carga
+
+    - Reintenta 429 y 5xx (y errores de conexión/timeouts) con retroceso
+      exponencial con jitter, respetando Retry-After cuando Figma lo envía.
+    - Limita el tiempo total dedicado a reintentos por petición.
+    - Mantiene por token un límite de concurrencia adaptativo.
+    Si se agotan los reintentos se entrega la última respuesta al llamador,
+    que la trata como cualquier otro error HTTP.
+    """
+
+    def __init__(self):
+        self.settings = self._load_settings()
+        self._limits: Dict[str, AdaptiveConcurrencyLimit] = {}
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "retries_by_reason": {},
+            "rate_limited": 0,
+            "gave_up": 0,
+            "retry_wait_ms": 0.0,
+        }
+
+    @staticmethod
+    def _load_settings() -> Dict[str, Any]:
+        # Configuración (sobrescribible desde variables de entorno)
+        return {
+            "max_retries": int(os.getenv("FIGMA_MAX_RETRIES", "4")),
+            "base_delay": float(os.getenv("FIGMA_RETRY_BASE_DELAY", "0.5")),
+            "max_delay": float(os.getenv("FIGMA_RETRY_MAX_DELAY", "20")),
+            "retry_budget": float(os.getenv("FIGMA_RETRY_BUDGET_SECONDS", "45")),
+            "concurrency_initial": float(os.getenv("FIGMA_CONCURRENCY_INITIAL", "8")),
+            "concurrency_min": float(os.getenv("FIGMA_CONCURRENCY_MIN", "1")),
+            "concurrency_max": float(os.getenv("FIGMA_CONCURRENCY_MAX", "32")),
+        }
+
+    def limit_for(self, access_token: str) -> AdaptiveConcurrencyLimit:
+        limit = self._limits.get(access_token)
+        if limit is None:
+            settings = self.settings
+            limit = AdaptiveConcurrencyLimit(
+                settings["concurrency_initial"], settings["concurrency_min"], settings["concurrency_max"]
+            )
+            self._limits[access_token] = limit
+        return limit
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniforme entre 0 y el retroceso exponencial
+        ceiling = min(self.settings["max_delay"], self.settings["base_delay"] * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def _plan_retry(self, attempt: int, started: float, delay: float) -> bool:
+        # ¿Queda margen (intentos y presupuesto de tiempo) para esperar `delay` y reintentar?
+        if attempt >= self.settings["max_retries"]:
+            return False
+        return time.monotonic() - started + delay <= self.settings["retry_budget"]
+
+    def _record_retry(self, reason: str, delay: float, url: str, attempt: int):
+        self.stats["retries"] += 1
+        reasons = self.stats["retries_by_reason"]
+        reasons[reason] = reasons.get(reason, 0) + 1
+        self.stats["retry_wait_ms"] = round(self.stats["retry_wait_ms"] + delay * 1000, 1)
+        logger.info("🔁 Figma %s en %s: reintento %s/%s en %.1fs", reason, urlsplit(url).path, attempt + 1, self.settings['max_retries'], delay)
+
+    @asynccontextmanager
+    async def request(self, session: aiohttp.ClientSession, access_token: str, method: str, url: str, **kwargs):
+        """Equivalente a `session.request(...)` como context manager, con reintentos
+
+        Cada intento se registra en las métricas del endpoint de Figma, con la
+        duración hasta que el llamador termina de leer la respuesta.
+        """
+        limit = self.limit_for(access_token)
+        started = time.monotonic()
+        endpoint = figma_endpoint(url)
+        attempt = 0
+        self.stats["requests"] += 1
+        while True:
+            await limit.acquire()
+            figma_in_flight.inc()
+            attempt_started = time.perf_counter()
+            status = "error"
+            try:
+                try:
+                    response = await session.request(method, url, **kwargs)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                    status = type(error).__name__
+                    delay = self._backoff(attempt)
+                    if not self._plan_retry(attempt, started, delay):
+                        self.stats["gave_up"] += 1
+                        raise
+                    reason = type(error).__name__
+                else:
+                    status = str(response.status)
+                    if response.status not in RETRY_STATUSES:
+                        if response.status < 400:
+                            limit.on_success()
+                        try:
+                            yield response
+                        finally:
+                            response.release()
+                        return
+                    retry_after = _retry_after_seconds(response.headers.get("Retry-After"))
+                    if response.status == 429:
+                        self.stats["rate_limited"] += 1
+                        limit.on_throttled(retry_after)
+                    if retry_after is not None:
+                        # Pequeño jitter para que los que esperan no vuelvan todos a la vez
+                        delay = retry_after + random.uniform(0, min(1.0, retry_after * 0.1))
+                    else:
+                        delay = self._backoff(attempt)
+                    if not self._plan_retry(attempt, started, delay):
+                        self.stats["gave_up"] += 1
+                        logger.warning("⚠️ Figma %s en %s: sin más reintentos (%s realizados)", response.status, urlsplit(url).path, attempt)
+                        try:
+                            yield response
+                        finally:
+                            response.release()
+                        return
+                    response.release()
+                    reason = str(response.status)
+            finally:
+                figma_in_flight.dec()
+                figma_latency.observe(time.perf_counter() - attempt_started, endpoint)
+                figma_calls.inc(endpoint, status)
+                await limit.release()
+            self._record_retry(reason, delay, url, attempt)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        limits = {
+            # Nunca exponer el token: se identifica por un prefijo de su hash
+            hashlib.sha256(token.encode("utf-8")).hexdigest()[:8]: {
+                "limit": round(limit.limit, 2),
+                "in_flight": limit.in_flight,
+                "blocked_for_s": round(max(0.0, limit.blocked_until - time.monotonic()), 1),
+            }
+            for token, limit in self._limits.items()
+        }
+        return {
+            "settings": dict(self.settings),
+            "stats": dict(self.stats, retries_by_reason=dict(self.stats["retries_by_reason"])),
+            "concurrency": limits,
+        }
+
+
+# Capa única por proceso (los límites adaptativos se comparten entre clientes del mismo token)
+figma_requests = FigmaRequestLayer()
@@ -0,0 +1,163 @@
+import aiohttp
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class FigmaSessionPool:
+    """Sesión aiohttp compartida (una por proceso) para todas las llamadas a la API de Figma
+
+    Se crea en el arranque de FastAPI y se cierra en el apagado. Mantiene un
+    TCPConnector acotado con keep-alive, límite por host y caché DNS, de modo
+    que las llamadas reutilizan conexiones TCP/TLS hacia api.figma.com.
+    """
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self.settings = self._load_settings()
+        self.stats = {
+            "sessions_created": 0,
+            "requests_started": 0,
+            "requests_finished": 0,
+            "requests_failed": 0,
+            "in_flight": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0,
+        }
+        self.started_at: Optional[float] = None
+
+    @staticmethod
+    def _load_settings() -> Dict[str, Any]:
+        # Configuración del pool (sobrescribible desde variables de entorno)
+        return {
+            "limit": int(os.getenv("FIGMA_POOL_LIMIT", "100")),
+            "limit_per_host": int(os.getenv("FIGMA_POOL_LIMIT_PER_HOST", "20")),
+            "keepalive_timeout": float(os.getenv("FIGMA_KEEPALIVE_TIMEOUT", "30")),
+            "dns_ttl": int(os.getenv("FIGMA_DNS_TTL", "300")),
+            "connect_timeout": float(os.getenv("FIGMA_CONNECT_TIMEOUT", "15")),
+            "total_timeout": float(os.getenv("FIGMA_TOTAL_TIMEOUT", "300")),
+        }
+
+    def _build_trace_config(self) -> aiohttp.TraceConfig:
+        # Trazas de aiohttp para medir el uso del pool sin tocar atributos privados
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, ctx, params):
+            self.stats["requests_started"] += 1
+            self.stats["in_flight"] += 1
+
+        async def on_request_end(session, ctx, params):
+            self.stats["requests_finished"] += 1
+            self.stats["in_flight"] -= 1
+
+        async def on_request_exception(session, ctx, params):
+            self.stats["requests_failed"] += 1
+            self.stats["in_flight"] -= 1
+
+        async def on_connection_create_end(session, ctx, params):
+            self.stats["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            self.stats["connections_reused"] += 1
+
+        async def on_dns_cache_hit(session, ctx, params):
+            self.stats["dns_cache_hits"] += 1
+
+        async def on_dns_cache_miss(session, ctx, params):
+            self.stats["dns_cache_misses"] += 1
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        settings = self.settings
+        self._connector = aiohttp.TCPConnector(
+            limit=settings["limit"],
+            limit_per_host=settings["limit_per_host"],
+            keepalive_timeout=settings["keepalive_timeout"],
+            ttl_dns_cache=settings["dns_ttl"],
+            use_dns_cache=True,
+            enable_cleanup_closed=True,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=self._connector,
+            timeout=aiohttp.ClientTimeout(
+                total=settings["total_timeout"],
+                connect=settings["connect_timeout"],
+            ),
+            trace_configs=[self._build_trace_config()],
+        )
+        self.stats["sessions_created"] += 1
+        self.started_at = time.time()
+        return self._session
+
+    async def start(self) -> aiohttp.ClientSession:
+        """Crear la sesión compartida (idempotente)"""
+        if self._session is not None and not self._session.closed:
+            return self._session
+
+        session = self._create_session()
+        settings = self.settings
+        logger.info(
+            "✅ Pool HTTP de Figma iniciado (limit=%s, por host=%s, keep-alive=%ss)",
+            settings['limit'], settings['limit_per_host'], settings['keepalive_timeout']
+        )
+        return session
+
+    async def close(self):
+        """Cerrar la sesión compartida y liberar las conexiones"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+            # Dar tiempo a que se cierren los transportes SSL subyacentes
+            await asyncio.sleep(0.25)
+            logger.info("🔌 Pool HTTP de Figma cerrado")
+        self._session = None
+        self._connector = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """Devolver la sesión compartida, creándola si aún no existe (scripts, tests manuales)"""
+        if self._session is None or self._session.closed:
+            return self._create_session()
+        return self._session
+
+    @asynccontextmanager
+    async def session_scope(self):
+        """Context manager que entrega la sesión compartida sin cerrarla al salir"""
+        yield self.get_session()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Métricas de uso del pool de conexiones"""
+        connector = self._connector
+        pool = {
+            "active": self._session is not None and not self._session.closed,
+            "uptime_seconds": round(time.time() - self.started_at, 1) if self.started_at else 0,
+            "settings": dict(self.settings),
+        }
+        if connector is not None and not connector.closed:
+            pool["limit"] = connector.limit
+            pool["limit_per_host"] = connector.limit_per_host
+        stats = dict(self.stats)
+        reused = stats["connections_reused"]
+        created = stats["connections_created"]
+        stats["connection_reuse_ratio"] = round(reused / (reused + created), 3) if (reused + created) else 0.0
+        pool["stats"] = stats
+        return pool
+
+
+# Pool único por proceso
+figma_pool = FigmaSessionPool()
@@ -0,0 +1,51 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Agrupa peticiones idénticas en curso para que compartan una sola descarga
+
+    La primera llamada con una clave lanza la descarga como tarea propia; las
+    que llegan mientras sigue en curso esperan esa misma tarea en vez de repetir
+    la petición a Figma. Cada llamador espera con `asyncio.shield`, de modo que
+    si uno se desconecta (y FastAPI cancela su petición) la descarga sigue para
+    los demás y su resultado termina igualmente en la caché.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {
+            "leaders": 0,
+            "coalesced": 0,
+            "cancelled_waiters": 0,
+        }
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.stats["leaders"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.cancelled():
+                self.stats["cancelled_waiters"] += 1
+            raise
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Si todos los llamadores se fueron, nadie recoge el error: evitar el aviso de asyncio
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats, in_flight=len(self._in_flight))
+
+
+# Única por proceso: la clave incluye el token, así que los clientes de distintos tokens no se mezclan
+figma_single_flight = SingleFlight()
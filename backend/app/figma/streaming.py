@@ -0,0 +1,146 @@
+import ijson
+from typing import Dict, List, Any, Optional, Tuple, AsyncIterator, BinaryIO
+
+# Tamaño de lectura del stream; acota la memoria usada por el parser
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_PAGE = "document.children.item"
+_FRAME = "document.children.item.children.item"
+
+_FILE_FIELDS = {"name": "name", "version": "version", "lastModified": "lastModified"}
+_PAGE_FIELDS = {f"{_PAGE}.{key}": key for key in ("id", "name", "type")}
+_FRAME_FIELDS = {f"{_FRAME}.{key}": key for key in ("id", "name", "type")}
+_FRAME_BOX_FIELDS = {f"{_FRAME}.absoluteBoundingBox.{key}": key for key in ("width", "height")}
+_FRAME_BG_FIELDS = {f"{_FRAME}.backgroundColor.{key}": key for key in ("r", "g", "b", "a")}
+
+# Cualquier prefijo más largo pertenece a un subárbol profundo que no interesa
+_MAX_PREFIX_LEN = max(len(prefix) for prefix in (*_FRAME_FIELDS, *_FRAME_BOX_FIELDS, *_FRAME_BG_FIELDS))
+
+
+class StructureBuilder:
+    """Construye la estructura páginas/frames a partir de eventos de ijson
+
+    Sólo materializa los campos que necesita el listado (metadatos del archivo,
+    páginas CANVAS y sus FRAME de primer nivel). Los subárboles profundos se
+    tokenizan pero nunca se convierten en objetos Python, así que la memoria
+    no depende del tamaño del documento.
+    """
+
+    def __init__(self):
+        self.file: Dict[str, Any] = {}
+        self.pages: List[Dict[str, Any]] = []
+        self._page: Optional[Dict[str, Any]] = None
+        self._frame: Optional[Dict[str, Any]] = None
+
+    def feed(self, prefix: str, event: str, value: Any) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Procesar un evento; devuelve ("page"|"frame", datos) cuando uno se completa"""
+        if prefix in _FILE_FIELDS:
+            if event in ("string", "number"):
+                self.file[_FILE_FIELDS[prefix]] = value
+            return None
+
+        if prefix == _PAGE:
+            if event == "start_map":
+                self._page = {"id": None, "name": None, "type": None, "frames": []}
+            elif event == "end_map" and self._page is not None:
+                page, self._page = self._page, None
+                if page.get("type") != "CANVAS":
+                    return None
+                page = {
+                    "id": page["id"],
+                    "name": page["name"],
+                    "type": page["type"],
+                    "frames_count": len(page["frames"]),
+                    "frames": page["frames"],
+                }
+                self.pages.append(page)
+                return "page", page
+            return None
+
+        if self._page is None:
+            return None
+
+        if prefix in _PAGE_FIELDS:
+            self._page[_PAGE_FIELDS[prefix]] = value
+            return None
+
+        if prefix == _FRAME:
+            if event == "start_map":
+                self._frame = {"id": None, "name": None, "type": None, "width": None, "height": None, "background_color": None}
+            elif event == "end_map" and self._frame is not None:
+                frame, self._frame = self._frame, None
+                if frame.get("type") != "FRAME":
+                    return None
+                self._page["frames"].append(frame)
+                return "frame", dict(frame, page_id=self._page.get("id"))
+            return None
+
+        if self._frame is None:
+            return None
+
+        if prefix in _FRAME_FIELDS:
+            self._frame[_FRAME_FIELDS[prefix]] = value
+        elif prefix in _FRAME_BOX_FIELDS:
+            self._frame[_FRAME_BOX_FIELDS[prefix]] = value
+        elif prefix in _FRAME_BG_FIELDS:
+            if self._frame["background_color"] is None:
+                self._frame["background_color"] = {}
+            self._frame["background_color"][_FRAME_BG_FIELDS[prefix]] = value
+        return None
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "name": self.file.get("name"),
+            "version": str(self.file["version"]) if self.file.get("version") is not None else None,
+            "lastModified": self.file.get("lastModified"),
+            "pages": self.pages,
+        }
+
+
+class TeeReader:
+    """Envuelve un stream asíncrono y copia cada bloque leído a un archivo (p. ej. la caché de disco)"""
+
+    def __init__(self, stream, sink: Optional[BinaryIO] = None):
+        self._stream = stream
+        self._sink = sink
+        self.bytes_read = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        chunk = await self._stream.read(size)
+        if chunk:
+            self.bytes_read += len(chunk)
+            if self._sink is not None:
+                self._sink.write(chunk)
+        return chunk
+
+
+async def iter_structure_events(stream, builder: Optional[StructureBuilder] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Emitir páginas y frames a medida que aparecen en un stream JSON asíncrono
+
+    `stream` debe exponer `async read(n)` (por ejemplo `aiohttp.ClientResponse.content`).
+    """
+    builder = builder or StructureBuilder()
+    async for prefix, event, value in ijson.parse_async(stream, buf_size=STREAM_CHUNK_SIZE, use_float=True):
+        if len(prefix) > _MAX_PREFIX_LEN:
+            continue
+        item = builder.feed(prefix, event, value)
+        if item is not None:
+            yield item
+
+
+async def parse_structure_stream(stream) -> Dict[str, Any]:
+    """Parsear de forma incremental un documento de Figma y devolver sólo su estructura"""
+    builder = StructureBuilder()
+    async for _ in iter_structure_events(stream, builder):
+        pass
+    return builder.result()
+
+
+def parse_structure_file(path: str) -> Dict[str, Any]:
+    """Versión síncrona para documentos ya guardados en disco (usar con asyncio.to_thread)"""
+    builder = StructureBuilder()
+    with open(path, "rb") as fh:
+        for prefix, event, value in ijson.parse(fh, buf_size=STREAM_CHUNK_SIZE, use_float=True):
+            if len(prefix) <= _MAX_PREFIX_LEN:
+                builder.feed(prefix, event, value)
+    return builder.result()
@@ -0,0 +1,354 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from app.models.nodes import NodeTree
+
+# Versión del formato de la tabla de tokens; incrementarla invalida las tablas guardadas
+TOKENS_SCHEMA_VERSION = "1"
+
+TOKEN_CATEGORIES = ("colors", "typography", "effects", "spacing")
+
+# Cuántos componentes publicados se muestrean para deducir la escala de espaciado
+SPACING_SAMPLE_COMPONENTS = int(os.getenv("FIGMA_TOKENS_SPACING_SAMPLE", "200"))
+# Profundidad de los nodos de componente pedidos a /nodes para la escala de espaciado
+SPACING_SAMPLE_DEPTH = int(os.getenv("FIGMA_TOKENS_SPACING_DEPTH", "3"))
+# Tamaño máximo de la escala de espaciado deducida
+SPACING_SCALE_MAX = 12
+
+_AUTO_LAYOUT_FIELDS = ("itemSpacing", "paddingLeft", "paddingRight", "paddingTop", "paddingBottom")
+_TEXT_CASE = {"UPPER": "uppercase", "LOWER": "lowercase", "TITLE": "capitalize"}
+
+
+def token_name(style_name: str) -> str:
+    """Nombre de token en kebab-case: "Brand/Primary 500" -> "brand-primary-500" """
+    ascii_name = unicodedata.normalize("NFKD", style_name or "").encode("ascii", "ignore").decode("ascii")
+    name = re.sub(r"[^a-z0-9]+", "-", ascii_name.lower()).strip("-")
+    return name or "token"
+
+
+def _px(value: Optional[float]) -> str:
+    value = round(float(value or 0), 2)
+    return f"{value:g}px"
+
+
+def color_to_css(color: Dict[str, Any], opacity: Optional[float] = None) -> str:
+    """Color de Figma (canales 0-1) como #rrggbb o rgba(...) si tiene transparencia"""
+    r, g, b = (int(round(float(color.get(channel, 0)) * 255)) for channel in ("r", "g", "b"))
+    alpha = float(color.get("a", 1)) * (1 if opacity is None else float(opacity))
+    if alpha >= 0.999:
+        return f"#{r:02x}{g:02x}{b:02x}"
+    return f"rgba({r}, {g}, {b}, {round(alpha, 3):g})"
+
+
+def _gradient_to_css(paint: Dict[str, Any]) -> Optional[str]:
+    stops = paint.get("gradientStops") or []
+    if not stops:
+        return None
+    css_stops = ", ".join(
+        f"{color_to_css(stop.get('color', {}), paint.get('opacity'))} {round(float(stop.get('position', 0)) * 100, 1):g}%"
+        for stop in stops
+    )
+    if paint.get("type") == "GRADIENT_RADIAL":
+        return f"radial-gradient({css_stops})"
+    handles = paint.get("gradientHandlePositions") or []
+    angle = 180.0
+    if len(handles) >= 2:
+        dx = handles[1].get("x", 0) - handles[0].get("x", 0)
+        dy = handles[1].get("y", 0) - handles[0].get("y", 0)
+        # 0deg en CSS apunta hacia arriba; en Figma el eje y crece hacia abajo
+        angle = (math.degrees(math.atan2(dy, dx)) + 90) % 360
+    return f"linear-gradient({round(angle, 1):g}deg, {css_stops})"
+
+
+def paint_token(fills: Iterable[Dict[str, Any]]) -> Optional[str]:
+    """Valor CSS del relleno visible superior (en Figma el último de la lista)"""
+    visible = [paint for paint in fills or [] if paint.get("visible", True)]
+    if not visible:
+        return None
+    paint = visible[-1]
+    if paint.get("type") == "SOLID":
+        return color_to_css(paint.get("color", {}), paint.get("opacity"))
+    if str(paint.get("type", "")).startswith("GRADIENT"):
+        return _gradient_to_css(paint)
+    return None
+
+
+def text_token(style: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Propiedades tipográficas CSS de un estilo de texto"""
+    if not style:
+        return None
+    token: Dict[str, Any] = {
+        "font-family": style.get("fontFamily"),
+        "font-weight": style.get("fontWeight"),
+        "font-size": _px(style.get("fontSize")),
+    }
+    if style.get("lineHeightUnit") == "INTRINSIC_%" or not style.get("lineHeightPx"):
+        token["line-height"] = "normal"
+    else:
+        token["line-height"] = _px(style.get("lineHeightPx"))
+    if style.get("letterSpacing"):
+        token["letter-spacing"] = _px(style.get("letterSpacing"))
+    if style.get("textCase") in _TEXT_CASE:
+        token["text-transform"] = _TEXT_CASE[style["textCase"]]
+    if style.get("italic"):
+        token["font-style"] = "italic"
+    return {key: value for key, value in token.items() if value is not None}
+
+
+def effect_token(effects: Iterable[Dict[str, Any]]) -> Optional[Dict[str, str]]:
+    """Sombras como box-shadow y desenfoques como filter/backdrop-filter"""
+    shadows, token = [], {}
+    for effect in effects or []:
+        if not effect.get("visible", True):
+            continue
+        kind = effect.get("type")
+        if kind in ("DROP_SHADOW", "INNER_SHADOW"):
+            offset = effect.get("offset") or {}
+            shadow = f"{_px(offset.get('x'))} {_px(offset.get('y'))} {_px(effect.get('radius'))} {_px(effect.get('spread'))} {color_to_css(effect.get('color', {}))}"
+            shadows.append(f"inset {shadow}" if kind == "INNER_SHADOW" else shadow)
+        elif kind == "LAYER_BLUR":
+            token["filter"] = f"blur({_px(effect.get('radius'))})"
+        elif kind == "BACKGROUND_BLUR":
+            token["backdrop-filter"] = f"blur({_px(effect.get('radius'))})"
+    if shadows:
+        token["box-shadow"] = ", ".join(shadows)
+    return token or None
+
+
+def grid_spacing(name: str, grids: Iterable[Dict[str, Any]]) -> Dict[str, str]:
+    """Medianil y tamaño de sección de un estilo de cuadrícula"""
+    spacing = {}
+    for grid in grids or []:
+        suffix = "" if grid.get("pattern") in (None, "GRID") else f"-{str(grid['pattern']).lower()}"
+        if grid.get("gutterSize"):
+            spacing[f"{name}{suffix}-gutter"] = _px(grid["gutterSize"])
+        if grid.get("pattern") == "GRID" and grid.get("sectionSize"):
+            spacing[f"{name}-section"] = _px(grid["sectionSize"])
+    return spacing
+
+
+def spacing_scale(nodes: Iterable[Any], max_size: int = SPACING_SCALE_MAX) -> Dict[str, str]:
+    """Escala de espaciado deducida del auto-layout (gaps y paddings) de los componentes
+
+    Se quedan los valores más repetidos (al menos dos apariciones, o todos si
+    hay pocos), ordenados de menor a mayor: space-1, space-2...
+    """
+    counts: Counter = Counter()
+    for node in nodes:
+        if not isinstance(node, (dict, NodeTree)):
+            continue
+        for props in NodeTree.of(node).props:
+            if props is None or props.get("layoutMode") not in ("HORIZONTAL", "VERTICAL"):
+                continue
+            for field in _AUTO_LAYOUT_FIELDS:
+                value = props.get(field)
+                if isinstance(value, (int, float)) and value > 0:
+                    counts[round(float(value), 2)] += 1
+    if not counts:
+        return {}
+    frequent = [value for value, count in counts.most_common() if count >= 2] or [value for value, _ in counts.most_common()]
+    return {f"space-{index}": _px(value) for index, value in enumerate(sorted(frequent[:max_size]), start=1)}
+
+
+def _unique(table: Dict[str, Any], name: str) -> str:
+    candidate, index = name, 2
+    while candidate in table:
+        candidate = f"{name}-{index}"
+        index += 1
+    return candidate
+
+
+def build_token_table(
+    styles: List[Dict[str, Any]],
+    style_nodes: Dict[str, Dict[str, Any]],
+    component_nodes: Iterable[Dict[str, Any]] = ()
+) -> Dict[str, Dict[str, Any]]:
+    """Tabla compacta de tokens {categoría: {nombre: valor}} a partir de los estilos publicados
+
+    `style_nodes` son los nodos de cada estilo (por node_id) pedidos a /nodes;
+    sus propiedades dan el valor del token. Los estilos se recorren ordenados
+    por nombre para que la tabla (y el prompt que la incluye) sea estable.
+    """
+    tokens: Dict[str, Dict[str, Any]] = {category: {} for category in TOKEN_CATEGORIES}
+    for style in sorted(styles, key=lambda s: (s.get("style_type") or "", s.get("name") or "", s.get("node_id") or "")):
+        node = style_nodes.get(style.get("node_id"))
+        if not node:
+            continue
+        name = token_name(style.get("name"))
+        kind = style.get("style_type")
+        if kind == "FILL":
+            value = paint_token(node.get("fills"))
+            if value:
+                tokens["colors"][_unique(tokens["colors"], name)] = value
+        elif kind == "TEXT":
+            value = text_token(node.get("style"))
+            if value:
+                tokens["typography"][_unique(tokens["typography"], name)] = value
+        elif kind == "EFFECT":
+            value = effect_token(node.get("effects"))
+            if value:
+                tokens["effects"][_unique(tokens["effects"], name)] = value
+        elif kind == "GRID":
+            for spacing_name, value in grid_spacing(name, node.get("layoutGrids")).items():
+                tokens["spacing"][_unique(tokens["spacing"], spacing_name)] = value
+    for spacing_name, value in spacing_scale(component_nodes).items():
+        tokens["spacing"][_unique(tokens["spacing"], spacing_name)] = value
+    return tokens
+
+
+def tokens_to_css(tokens: Dict[str, Dict[str, Any]], max_items: Optional[int] = None) -> str:
+    """Tokens como variables CSS en :root (lo que se envía al modelo y lo que usa el código generado)"""
+    lines = [":root {"]
+
+    def section(items: Dict[str, Any]) -> List[Tuple[str, Any]]:
+        return list(items.items())[:max_items] if max_items else list(items.items())
+
+    for name, value in section(tokens.get("colors", {})):
+        lines.append(f"  --color-{name}: {value};")
+    for name, value in section(tokens.get("typography", {})):
+        family = value.get("font-family")
+        font = f"{value.get('font-weight', 400)} {value.get('font-size')}/{value.get('line-height', 'normal')}"
+        lines.append(f"  --font-{name}: {font} \"{family}\";" if family else f"  --font-{name}: {font};")
+        if value.get("letter-spacing"):
+            lines.append(f"  --letter-spacing-{name}: {value['letter-spacing']};")
+        if value.get("text-transform"):
+            lines.append(f"  --text-transform-{name}: {value['text-transform']};")
+    for name, value in section(tokens.get("effects", {})):
+        if value.get("box-shadow"):
+            lines.append(f"  --shadow-{name}: {value['box-shadow']};")
+        if value.get("filter"):
+            lines.append(f"  --blur-{name}: {value['filter']};")
+        if value.get("backdrop-filter"):
+            lines.append(f"  --backdrop-blur-{name}: {value['backdrop-filter']};")
+    for name, value in section(tokens.get("spacing", {})):
+        lines.append(f"  --{name if name.startswith('space-') else 'space-' + name}: {value};")
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def token_counts(tokens: Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+    return {category: len(tokens.get(category, {})) for category in TOKEN_CATEGORIES}
+
+
+class DesignTokenCache:
+    """Tablas de tokens por (file_key, versión): memoria (LRU) y un JSON en disco por versión
+
+    Una versión de Figma es inmutable, así que una tabla calculada nunca
+    caduca; al publicarse una versión nueva cambia la clave. En disco se
+    guardan como mucho `disk_entries` tablas: al pasarse se borran las menos
+    usadas (mtime más antiguo), como en la caché de documentos.
+    """
+
+    def __init__(self, cache_dir: str, memory_entries: int, disk_entries: int):
+        self.cache_dir = cache_dir
+        self.memory_entries = max(1, memory_entries)
+        self.disk_entries = max(1, disk_entries)
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "builds": 0,
+            "build_ms_total": 0.0,
+            "disk_evictions": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "DesignTokenCache":
+        return cls(
+            cache_dir=os.getenv("FIGMA_TOKENS_CACHE_DIR", os.path.join(".cache", "tokens")),
+            memory_entries=int(os.getenv("FIGMA_TOKENS_MEMORY_ENTRIES", "64")),
+            disk_entries=int(os.getenv("FIGMA_TOKENS_DISK_ENTRIES", "512")),
+        )
+
+    @staticmethod
+    def key(file_key: str, version: str) -> str:
+        payload = json.dumps([TOKENS_SCHEMA_VERSION, file_key, str(version)], separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:40]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, file_key: str, version: str) -> Optional[Dict[str, Any]]:
+        """Tabla guardada o None (bloqueante: llamar con asyncio.to_thread)"""
+        key = self.key(file_key, version)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return entry
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as fh:
+                entry = json.load(fh)
+            # Marcar como usada para la expulsión LRU del disco
+            os.utime(self._path(key), None)
+        except (OSError, ValueError):
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["disk_hits"] += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, file_key: str, version: str, entry: Dict[str, Any], build_ms: float):
+        """Guardar una tabla recién calculada (bloqueante: llamar con asyncio.to_thread)"""
+        key = self.key(file_key, version)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{os.getpid()}-{time.monotonic_ns()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(entry, fh, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self._path(key))
+        self._enforce_disk_budget(keep=self._path(key))
+        with self._lock:
+            self.stats["builds"] += 1
+            self.stats["build_ms_total"] = round(self.stats["build_ms_total"] + build_ms, 1)
+            self._remember(key, entry)
+
+    def _enforce_disk_budget(self, keep: str):
+        # `keep` es la tabla recién guardada: nunca se expulsa
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not name.endswith(".json") or path == keep:
+                continue
+            try:
+                entries.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue
+        # Expulsar primero las menos usadas (mtime más antiguo)
+        for _, path in sorted(entries)[:max(0, len(entries) + 1 - self.disk_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            with self._lock:
+                self.stats["disk_evictions"] += 1
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        stats["memory_entries"] = len(self._memory)
+        stats["cache_dir"] = self.cache_dir
+        return stats
+
+
+# Caché única por proceso
+design_token_cache = DesignTokenCache.from_env()
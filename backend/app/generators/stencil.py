@@ -0,0 +1,502 @@
+import html
+import json
+import math
+import os
+import re
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.figma.tokens import effect_token, paint_token, text_token, token_name
+from app.log import get_logger
+from app.models.nodes import NodeTree
+
+logger = get_logger(__name__)
+
+# Versión de las reglas; forma parte de la clave de caché cuando el esqueleto va al modelo
+GENERATOR_VERSION = "1"
+
+# Prefijo de los tags generados (ds-button, ds-card...), el mismo que pide el prompt de sistema
+TAG_PREFIX = os.getenv("STENCIL_TAG_PREFIX", "ds")
+
+# Nodos recorridos como máximo por componente; el resto se omite con un comentario
+MAX_NODES = int(os.getenv("STENCIL_GENERATOR_MAX_NODES", "2000"))
+
+_SHAPE_TYPES = {"VECTOR", "BOOLEAN_OPERATION", "STAR", "REGULAR_POLYGON", "LINE", "ELLIPSE"}
+
+_JUSTIFY = {"MIN": "flex-start", "CENTER": "center", "MAX": "flex-end", "SPACE_BETWEEN": "space-between"}
+_ALIGN = {"MIN": "flex-start", "CENTER": "center", "MAX": "flex-end", "BASELINE": "baseline"}
+_TEXT_ALIGN = {"CENTER": "center", "RIGHT": "right", "JUSTIFIED": "justify"}
+_TEXT_DECORATION = {"UNDERLINE": "underline", "STRIKETHROUGH": "line-through"}
+
+# Miembros de HTMLElement que Stencil no admite como @Prop
+_RESERVED_PROPS = {
+    "title", "hidden", "id", "slot", "style", "class", "lang", "dir", "role",
+    "tabIndex", "draggable", "children", "content", "name", "part",
+}
+
+
+def _px(value: Any) -> str:
+    value = round(float(value or 0), 2)
+    return f"{value:g}px"
+
+
+def _camel(name: str) -> str:
+    parts = token_name(name).split("-")
+    return parts[0] + "".join(part.capitalize() for part in parts[1:])
+
+
+def _pascal(name: str) -> str:
+    return "".join(part.capitalize() for part in token_name(name).split("-"))
+
+
+def _attribute(prop_name: str) -> str:
+    # Atributo HTML de una @Prop: buttonLabel -> button-label (como lo refleja Stencil)
+    return re.sub(r"(?<!^)([A-Z])", r"-\1", prop_name).lower()
+
+
+def _property_attribute(name: str) -> str:
+    # Las propiedades de componente llegan como "Label#12:0"; el sufijo es un id interno
+    return token_name(name.split("#", 1)[0])
+
+
+class _Element:
+    __slots__ = ("tag", "css_class", "attributes", "text_prop", "text", "children", "comment")
+
+    def __init__(self, tag: str, css_class: Optional[str]):
+        self.tag = tag
+        self.css_class = css_class
+        self.attributes: List[Tuple[str, str]] = []
+        self.text_prop: Optional[str] = None
+        self.text: Optional[str] = None
+        self.children: List["_Element"] = []
+        self.comment: Optional[str] = None
+
+
+class _Builder:
+    """Recorre el árbol de un frame (índices de un NodeTree) y acumula elementos, reglas CSS y props"""
+
+    def __init__(self, tree: NodeTree, block: str, tokens: Optional[Dict[str, Dict[str, Any]]]):
+        self.tree = tree
+        self.block = block
+        self.rules: Dict[str, List[Tuple[str, str]]] = {}
+        self.props: List[Dict[str, Any]] = []
+        self._prop_names: Dict[str, int] = {}
+        self.nodes = 0
+        self.skipped = 0
+        tokens = tokens or {}
+        # Valor literal -> variable CSS de tokens_to_css (los valores salen de las mismas funciones)
+        self._color_vars = {value: f"--color-{name}" for name, value in tokens.get("colors", {}).items()}
+        self._shadow_vars = {
+            value["box-shadow"]: f"--shadow-{name}"
+            for name, value in tokens.get("effects", {}).items() if value.get("box-shadow")
+        }
+        self._space_vars = {
+            value: f"--{name if name.startswith('space-') else 'space-' + name}"
+            for name, value in tokens.get("spacing", {}).items()
+        }
+
+    def _box(self, index: int, field: int) -> Optional[float]:
+        # 0 = x, 1 = y, 2 = width, 3 = height (NaN si no venía en el JSON)
+        value = self.tree.boxes[index * 4 + field]
+        return None if math.isnan(value) else value
+
+    # --- Nombres -------------------------------------------------------------
+
+    def _class_for(self, index: int, declarations: List[Tuple[str, str]]) -> str:
+        # Elemento BEM; nodos con el mismo nombre y los mismos estilos comparten clase
+        base = f"{self.block}__{token_name(self.tree.names[index] or '')}"
+        candidate, suffix = base, 2
+        while candidate in self.rules and self.rules[candidate] != declarations:
+            candidate = f"{base}-{suffix}"
+            suffix += 1
+        self.rules[candidate] = declarations
+        return candidate
+
+    def _prop_for(self, index: int, props: Dict[str, Any]) -> str:
+        layer = self.tree.names[index] or ""
+        characters = props.get("characters") or ""
+        # Capas sin renombrar (el nombre es el propio texto) o nombres largos: "text"
+        name = _camel(layer) if layer and layer != characters and len(layer) <= 32 else "text"
+        if not name or not name[0].isalpha():
+            name = "text"
+        if name in _RESERVED_PROPS:
+            name = f"{name}Text"
+        # Siguiente sufijo libre por nombre base (label, label2, label3...)
+        suffix = self._prop_names.get(name, 0) + 1
+        candidate = name if suffix == 1 else f"{name}{suffix}"
+        while candidate in self._prop_names and suffix > 1:
+            suffix += 1
+            candidate = f"{name}{suffix}"
+        self._prop_names[name] = suffix
+        self._prop_names.setdefault(candidate, 1)
+        self.props.append({
+            "name": candidate,
+            "type": "string",
+            "default": characters,
+            "slot": _attribute(candidate),
+            "node_id": self.tree.ids[index],
+        })
+        return candidate
+
+    # --- Valores con tokens ----------------------------------------------------
+
+    def _color(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        variable = self._color_vars.get(value)
+        return f"var({variable}, {value})" if variable else value
+
+    def _space(self, value: Any) -> str:
+        literal = _px(value)
+        variable = self._space_vars.get(literal)
+        return f"var({variable}, {literal})" if variable else literal
+
+    # --- Reglas CSS ------------------------------------------------------------
+
+    @staticmethod
+    def _sizing(props: Dict[str, Any], node_type: Optional[str], axis: str, parent_mode: Optional[str]) -> str:
+        """FIXED, HUG o FILL en un eje ("h" o "v"), también para archivos sin layoutSizing*"""
+        explicit = props.get("layoutSizingHorizontal" if axis == "h" else "layoutSizingVertical")
+        if explicit:
+            return explicit
+        if parent_mode in ("HORIZONTAL", "VERTICAL"):
+            primary = (parent_mode == "HORIZONTAL") == (axis == "h")
+            if primary and props.get("layoutGrow"):
+                return "FILL"
+            if not primary and props.get("layoutAlign") == "STRETCH":
+                return "FILL"
+        mode = props.get("layoutMode")
+        if mode in ("HORIZONTAL", "VERTICAL"):
+            own_primary = (mode == "HORIZONTAL") == (axis == "h")
+            sizing_mode = props.get("primaryAxisSizingMode" if own_primary else "counterAxisSizingMode")
+            return "HUG" if sizing_mode == "AUTO" else "FIXED"
+        if node_type == "TEXT":
+            auto_resize = props.get("textAutoResize")
+            if auto_resize == "WIDTH_AND_HEIGHT" or (auto_resize == "HEIGHT" and axis == "v"):
+                return "HUG"
+        return "FIXED"
+
+    def _placement(self, index: int, props: Dict[str, Any], parent: Optional[int]) -> List[Tuple[str, str]]:
+        """Tamaño y posición del nodo dentro de su padre"""
+        declarations: List[Tuple[str, str]] = []
+        parent_mode = self.tree.get(parent, "layoutMode") if parent is not None else None
+        auto_layout = parent_mode in ("HORIZONTAL", "VERTICAL")
+        if parent is not None and (not auto_layout or props.get("layoutPositioning") == "ABSOLUTE"):
+            declarations.append(("position", "absolute"))
+            declarations.append(("left", _px((self._box(index, 0) or 0) - (self._box(parent, 0) or 0))))
+            declarations.append(("top", _px((self._box(index, 1) or 0) - (self._box(parent, 1) or 0))))
+        fills_primary_axis = False
+        node_type = self.tree.type_of(index)
+        for axis, prop, field in (("h", "width", 2), ("v", "height", 3)):
+            sizing = self._sizing(props, node_type, axis, parent_mode)
+            size = self._box(index, field)
+            if sizing == "FIXED" and size is not None:
+                declarations.append((prop, _px(size)))
+            elif sizing == "FILL":
+                if auto_layout and (parent_mode == "HORIZONTAL") == (axis == "h"):
+                    declarations.append(("flex", "1 1 0"))
+                    fills_primary_axis = True
+                elif auto_layout:
+                    declarations.append(("align-self", "stretch"))
+                else:
+                    declarations.append((prop, "100%"))
+        if auto_layout and not fills_primary_axis and props.get("layoutPositioning") != "ABSOLUTE":
+            declarations.append(("flex-shrink", "0"))
+        return declarations
+
+    def _layout(self, index: int, props: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """Auto-layout como flexbox; sin auto-layout los hijos se posicionan en absoluto"""
+        mode = props.get("layoutMode")
+        if mode not in ("HORIZONTAL", "VERTICAL"):
+            return [("position", "relative")] if self.tree.has_children(index) else []
+        declarations = [("display", "flex"), ("flex-direction", "row" if mode == "HORIZONTAL" else "column")]
+        if props.get("layoutWrap") == "WRAP":
+            declarations.append(("flex-wrap", "wrap"))
+        justify = _JUSTIFY.get(props.get("primaryAxisAlignItems", "MIN"))
+        if justify and justify != "flex-start":
+            declarations.append(("justify-content", justify))
+        align = _ALIGN.get(props.get("counterAxisAlignItems", "MIN"))
+        if align:
+            declarations.append(("align-items", align))
+        if props.get("itemSpacing") and props.get("primaryAxisAlignItems") != "SPACE_BETWEEN":
+            declarations.append(("gap", self._space(props["itemSpacing"])))
+        if props.get("layoutWrap") == "WRAP" and props.get("counterAxisSpacing"):
+            declarations.append(("row-gap" if mode == "HORIZONTAL" else "column-gap", self._space(props["counterAxisSpacing"])))
+        padding = [props.get(f"padding{side}") or 0 for side in ("Top", "Right", "Bottom", "Left")]
+        if any(padding):
+            if len(set(padding)) == 1:
+                declarations.append(("padding", self._space(padding[0])))
+            else:
+                declarations.append(("padding", " ".join(self._space(value) for value in padding)))
+        return declarations
+
+    def _appearance(self, index: int, props: Dict[str, Any]) -> List[Tuple[str, str]]:
+        """Rellenos, bordes, radios, efectos y opacidad"""
+        declarations: List[Tuple[str, str]] = []
+        node_type = self.tree.type_of(index)
+        fill = paint_token(props.get("fills"))
+        if fill and node_type == "TEXT":
+            if not fill.startswith(("linear-gradient", "radial-gradient")):
+                declarations.append(("color", self._color(fill)))
+        elif fill:
+            declarations.append(("background", self._color(fill)))
+        stroke = paint_token(props.get("strokes"))
+        if stroke and props.get("strokeWeight") and not stroke.startswith(("linear-gradient", "radial-gradient")):
+            side = "border-top" if node_type == "LINE" else "border"
+            declarations.append((side, f"{_px(props['strokeWeight'])} solid {self._color(stroke)}"))
+            if props.get("strokeAlign") == "OUTSIDE" and node_type != "LINE":
+                declarations.append(("box-sizing", "content-box"))
+        if node_type == "ELLIPSE":
+            declarations.append(("border-radius", "50%"))
+        elif props.get("rectangleCornerRadii") and len(set(props["rectangleCornerRadii"])) > 1:
+            declarations.append(("border-radius", " ".join(_px(radius) for radius in props["rectangleCornerRadii"])))
+        elif props.get("cornerRadius"):
+            declarations.append(("border-radius", _px(props["cornerRadius"])))
+        for prop, value in (effect_token(props.get("effects")) or {}).items():
+            if prop == "box-shadow" and value in self._shadow_vars:
+                value = f"var({self._shadow_vars[value]}, {value})"
+            declarations.append((prop, value))
+        if props.get("opacity") is not None and float(props["opacity"]) < 0.999:
+            declarations.append(("opacity", f"{round(float(props['opacity']), 3):g}"))
+        if props.get("clipsContent") and self.tree.has_children(index):
+            declarations.append(("overflow", "hidden"))
+        return declarations
+
+    @staticmethod
+    def _typography(props: Dict[str, Any]) -> List[Tuple[str, str]]:
+        style = props.get("style") or {}
+        declarations = []
+        for prop, value in (text_token(style) or {}).items():
+            if prop == "font-family":
+                value = f'"{value}", sans-serif'
+            declarations.append((prop, str(value)))
+        if style.get("textAlignHorizontal") in _TEXT_ALIGN:
+            declarations.append(("text-align", _TEXT_ALIGN[style["textAlignHorizontal"]]))
+        if style.get("textDecoration") in _TEXT_DECORATION:
+            declarations.append(("text-decoration", _TEXT_DECORATION[style["textDecoration"]]))
+        return declarations
+
+    # --- Recorrido -------------------------------------------------------------
+
+    def build(self, index: int = 0, parent: Optional[int] = None) -> Optional[_Element]:
+        tree = self.tree
+        if tree.hidden[index]:
+            return None
+        if self.nodes >= MAX_NODES:
+            self.skipped += 1
+            return None
+        self.nodes += 1
+        props = tree.props[index] or {}
+        node_type = tree.type_of(index)
+        placement = self._placement(index, props, parent)
+
+        if node_type == "INSTANCE" and parent is not None:
+            # Las instancias son otros componentes: sólo se colocan, su estilo es suyo
+            element = _Element(f"{TAG_PREFIX}-{token_name(tree.names[index] or '')}", None)
+            if placement:
+                element.css_class = self._class_for(index, placement)
+            for name, prop in sorted((props.get("componentProperties") or {}).items()):
+                value = prop.get("value")
+                if prop.get("type") == "BOOLEAN":
+                    if value:
+                        element.attributes.append((_property_attribute(name), ""))
+                elif prop.get("type") in ("VARIANT", "TEXT") and value is not None:
+                    attribute_value = token_name(str(value)) if prop.get("type") == "VARIANT" else str(value)
+                    element.attributes.append((_property_attribute(name), attribute_value))
+            return element
+
+        if node_type == "TEXT":
+            declarations = placement + self._typography(props) + self._appearance(index, props)
+            element = _Element("span", self._class_for(index, declarations))
+            element.text_prop = self._prop_for(index, props)
+            element.text = props.get("characters") or ""
+            return element
+
+        if parent is None:
+            declarations = self._layout(index, props) + self._appearance(index, props)
+            # El tamaño del raíz va en el propio elemento; :host sólo decide cómo fluye
+            declarations = [d for d in placement if d[0] in ("width", "height")] + declarations
+            self.rules[self.block] = declarations
+            element = _Element("div", self.block)
+        else:
+            declarations = placement + self._layout(index, props) + self._appearance(index, props)
+            tag = "span" if node_type in _SHAPE_TYPES else "div"
+            element = _Element(tag, self._class_for(index, declarations))
+            if node_type in _SHAPE_TYPES:
+                element.attributes.append(("aria-hidden", "true"))
+
+        if node_type not in _SHAPE_TYPES:
+            for child in tree.children(index):
+                child_element = self.build(child, index)
+                if child_element is not None:
+                    element.children.append(child_element)
+        if parent is None and self.skipped:
+            element.comment = f"{self.skipped} nodos omitidos (límite de {MAX_NODES})"
+        return element
+
+
+def _jsx(element: _Element, indent: int) -> List[str]:
+    pad = " " * indent
+    attributes = f' class="{element.css_class}"' if element.css_class else ""
+    for name, value in element.attributes:
+        attributes += f" {name}" if value == "" else f" {name}={json.dumps(value, ensure_ascii=False)}"
+    if element.text_prop:
+        slot = _attribute(element.text_prop)
+        return [f'{pad}<{element.tag}{attributes}><slot name="{slot}">{{this.{element.text_prop}}}</slot></{element.tag}>']
+    if not element.children and not element.comment:
+        return [f"{pad}<{element.tag}{attributes}></{element.tag}>"]
+    lines = [f"{pad}<{element.tag}{attributes}>"]
+    if element.comment:
+        lines.append(f"{pad}  {{/* {element.comment} */}}")
+    for child in element.children:
+        lines.extend(_jsx(child, indent + 2))
+    lines.append(f"{pad}</{element.tag}>")
+    return lines
+
+
+def _html(element: _Element, indent: int) -> List[str]:
+    pad = " " * indent
+    attributes = f' class="{element.css_class}"' if element.css_class else ""
+    for name, value in element.attributes:
+        attributes += f" {name}" if value == "" else f' {name}="{html.escape(value)}"'
+    if element.text_prop is not None:
+        return [f"{pad}<{element.tag}{attributes}>{html.escape(element.text or '')}</{element.tag}>"]
+    if not element.children and not element.comment:
+        return [f"{pad}<{element.tag}{attributes}></{element.tag}>"]
+    lines = [f"{pad}<{element.tag}{attributes}>"]
+    if element.comment:
+        lines.append(f"{pad}  <!-- {element.comment} -->")
+    for child in element.children:
+        lines.extend(_html(child, indent + 2))
+    lines.append(f"{pad}</{element.tag}>")
+    return lines
+
+
+def _css(builder: _Builder, host_display: str) -> str:
+    lines = [":host {", f"  display: {host_display};", "}", ""]
+    for selector, declarations in builder.rules.items():
+        lines.append(f".{selector} {{")
+        lines.append("  box-sizing: border-box;")
+        lines.extend(f"  {prop}: {value};" for prop, value in declarations)
+        lines.append("}")
+        lines.append("")
+    return "\n".join(lines).rstrip() + "\n"
+
+
+def _tsx(tag: str, class_name: str, props: List[Dict[str, Any]], root: _Element) -> str:
+    imports = "Component, Prop, h" if props else "Component, h"
+    lines = [
+        f"import {{ {imports} }} from '@stencil/core';",
+        "",
+        "@Component({",
+        f"  tag: '{tag}',",
+        f"  styleUrl: '{tag}.css',",
+        "  shadow: true,",
+        "})",
+        f"export class {class_name} {{",
+    ]
+    for prop in props:
+        lines.append(f"  /** Texto por defecto del slot \"{prop['slot']}\" */")
+        lines.append(f"  @Prop() {prop['name']}: string = {json.dumps(prop['default'], ensure_ascii=False)};")
+        lines.append("")
+    lines.append("  render() {")
+    lines.append("    return (")
+    lines.extend(_jsx(root, 6))
+    lines.append("    );")
+    lines.append("  }")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def _story(tag: str, title: str, props: List[Dict[str, Any]]) -> str:
+    attributes = "".join(f' {_attribute(prop["name"])}="${{args.{prop["name"]}}}"' for prop in props)
+    lines = ["export default {", f"  title: 'Components/{title}',", f"  component: '{tag}',"]
+    if props:
+        lines.append("  argTypes: {")
+        lines.extend(f"    {prop['name']}: {{ control: 'text' }}," for prop in props)
+        lines.append("  },")
+        lines.append("  args: {")
+        lines.extend(f"    {prop['name']}: {json.dumps(prop['default'], ensure_ascii=False)}," for prop in props)
+        lines.append("  },")
+    lines.append("};")
+    lines.append("")
+    lines.append(f"const Template = (args: Record<string, string>) => `<{tag}{attributes}></{tag}>`;")
+    lines.append("")
+    lines.append("export const Default = Template.bind({});")
+    return "\n".join(lines) + "\n"
+
+
+def _root_node(frame_data: Dict[str, Any]) -> Any:
+    # Los detalles de get_frame_details traen el nodo completo (JSON o NodeTree) en raw_data
+    raw = frame_data.get("raw_data")
+    if isinstance(raw, (dict, NodeTree)) and raw:
+        return raw
+    return frame_data
+
+
+def generate_stencil_component(
+    frame_data: Dict[str, Any],
+    tokens: Optional[Dict[str, Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """Generar TSX, CSS, HTML y Storybook de un frame con reglas fijas, sin LLM
+
+    - Auto-layout -> flexbox (dirección, gap, padding, alineación, wrap, FILL/HUG/FIXED)
+    - Frames sin auto-layout -> hijos en posición absoluta respecto al padre
+    - Rellenos, bordes, radios, efectos y opacidad -> CSS (con variables de los
+      design tokens del archivo cuando el valor coincide)
+    - Nodos TEXT -> @Prop con el texto por defecto dentro de un <slot> con nombre
+    - Instancias -> tags hijos (ds-<nombre>) con sus propiedades como atributos
+
+    Devuelve un diccionario con la misma forma que `generate_component_code`,
+    más `generator: "rules"` y las props deducidas.
+    """
+    started = time.perf_counter()
+    try:
+        tree = NodeTree.of(_root_node(frame_data))
+        component_name = frame_data.get("name") or tree.names[0] or "Component"
+        block = token_name(component_name)
+        tag = f"{TAG_PREFIX}-{block}"
+        builder = _Builder(tree, block, tokens)
+        root = builder.build()
+        if root is None:
+            return {"success": False, "error": "El frame está oculto o vacío"}
+
+        host_display = "block" if _Builder._sizing(tree.props[0] or {}, tree.type_of(0), "h", None) == "FILL" else "inline-block"
+        class_name = _pascal(f"{TAG_PREFIX} {component_name}")
+        if not class_name[:1].isalpha():
+            class_name = f"Ds{class_name}"
+        code = {
+            "html": "\n".join(_html(root, 0)) + "\n",
+            "css": _css(builder, host_display),
+            "tsx": _tsx(tag, class_name, builder.props, root),
+            "story": _story(tag, re.sub(r"\s+", " ", component_name).strip(), builder.props),
+        }
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+        logger.debug("🧩 Componente %s generado por reglas: %s nodos en %sms", component_name, builder.nodes, elapsed_ms)
+        return {
+            "success": True,
+            "generator": "rules",
+            "generator_version": GENERATOR_VERSION,
+            "component_name": component_name,
+            "tag": tag,
+            "html_code": code["html"],
+            "css_code": code["css"],
+            "stencil_code": code["tsx"],
+            "storybook_code": code["story"],
+            "props": [{key: prop[key] for key in ("name", "type", "default", "slot")} for prop in builder.props],
+            "stats": {"nodes": builder.nodes, "skipped_nodes": builder.skipped, "css_rules": len(builder.rules)},
+            "timings": {"generate_ms": elapsed_ms},
+        }
+    except Exception as e:
+        logger.error("❌ Error en el generador por reglas: %s", e)
+        return {"success": False, "error": str(e)}
+
+
+def skeleton_blocks(result: Dict[str, Any]) -> Dict[str, str]:
+    """Bloques html/css/tsx/story de un resultado del generador (formato de _extract_code_blocks)"""
+    return {
+        "html": result.get("html_code", ""),
+        "css": result.get("css_code", ""),
+        "tsx": result.get("stencil_code", ""),
+        "story": result.get("storybook_code", ""),
+    }
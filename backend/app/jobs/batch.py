@@ -0,0 +1,262 @@
+import asyncio
+import os
+import time
+from typing import Dict, List, Any, Optional, Set
+
+from app.claude.service import ClaudeAIService, PROMPT_CACHING_ENABLED, build_design_system_preamble
+from app.figma.client import FigmaClient
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class BatchGeneration:
+    """Pipeline de generación de varios componentes de un mismo archivo
+
+    Lo comparten `/figma/generate-multiple-components` (todo en una petición) y
+    los trabajos en segundo plano (un componente por tarea del pool):
+
+    1. `prepare`: detalles y renders de todos los nodos con pocas peticiones a
+       Figma, más el preámbulo de estilos común a todo el lote. Con
+       `since_version` se descartan antes los nodos sin cambios desde esa
+       versión del archivo (regeneración incremental).
+    2. `process`: generación de un componente con Claude.
+    3. `summary`: tiempos por etapa, tokens y recuento de éxitos/errores.
+    """
+
+    def __init__(
+        self,
+        figma_client: FigmaClient,
+        claude_service: ClaudeAIService,
+        file_key: str,
+        force_regenerate: bool = False,
+        figma_concurrency: Optional[int] = None,
+        llm_concurrency: Optional[int] = None,
+        since_version: Optional[str] = None
+    ):
+        self.figma_client = figma_client
+        self.claude_service = claude_service
+        self.file_key = file_key
+        self.force_regenerate = force_regenerate
+        # Límites de concurrencia por etapa (configurables por petición o entorno)
+        self.figma_concurrency = max(1, int(figma_concurrency or os.getenv("BATCH_FIGMA_CONCURRENCY", "8")))
+        self.llm_concurrency = max(1, int(llm_concurrency or os.getenv("BATCH_LLM_CONCURRENCY", "4")))
+        self._llm_semaphore = asyncio.Semaphore(self.llm_concurrency)
+        self._prefix_warmup = {"claimed": False, "done": asyncio.Event()}
+        self.since_version = str(since_version) if since_version else None
+        self.design_preamble: Optional[str] = None
+        self.file_version: Optional[str] = None
+        # Nodos idénticos a `since_version`: no se regeneran
+        self.unchanged_ids: Set[str] = set()
+        self.frames_by_id: Dict[str, Any] = {}
+        self.figma_batch_ms = 0.0
+        self.figma_requests = 0
+        self.started = time.perf_counter()
+
+    @classmethod
+    def from_request(cls, figma_client: FigmaClient, claude_service: ClaudeAIService, file_key: str, options: Dict[str, Any]) -> "BatchGeneration":
+        return cls(
+            figma_client,
+            claude_service,
+            file_key,
+            force_regenerate=bool(options.get("force_regenerate")),
+            figma_concurrency=options.get("figma_concurrency"),
+            llm_concurrency=options.get("llm_concurrency"),
+            since_version=options.get("since_version")
+        )
+
+    async def prepare(self, node_ids: List[str]) -> Dict[str, Any]:
+        """Etapa 1: detalles de todos los componentes y preámbulo de estilos del archivo"""
+        started = time.perf_counter()
+        if self.since_version:
+            # Hash de cada subárbol en ambas versiones: sólo se piden y generan los que cambiaron
+            comparison = await self.figma_client.unchanged_nodes(self.file_key, self.since_version, node_ids)
+            if not comparison.get("success"):
+                return {
+                    "success": False,
+                    "error": comparison.get("error", f"No se pudo comparar con la versión {self.since_version}")
+                }
+            self.unchanged_ids = set(comparison["unchanged"])
+            node_ids = [node_id for node_id in node_ids if node_id not in self.unchanged_ids]
+            logger.info("🔀 %s componentes sin cambios desde la versión %s", len(self.unchanged_ids), self.since_version)
+        # Los design tokens, estilos y componentes del archivo forman el preámbulo cacheable común a todo el lote
+        details_batch, design_system = await asyncio.gather(
+            self.figma_client.get_frames_details_batch(self.file_key, node_ids, concurrency=self.figma_concurrency),
+            self.figma_client.get_design_tokens(self.file_key)
+        )
+        self.design_preamble = build_design_system_preamble(design_system)
+        self.file_version = design_system.get("version")
+        self.figma_batch_ms = round((time.perf_counter() - started) * 1000, 1)
+        if not details_batch.get("success"):
+            return {
+                "success": False,
+                "error": details_batch.get("error", "Error obteniendo detalles de los componentes")
+            }
+        self.frames_by_id = details_batch.get("frames", {})
+        self.figma_requests = details_batch.get("requests", 0)
+        return {"success": True}
+
+    async def process(self, component: Dict[str, Any]) -> Dict[str, Any]:
+        """Etapa 2: generar un componente con Claude (sus detalles ya se obtuvieron por lotes)"""
+        node_id = component.get("node_id")
+        component_name = component.get("name", "Unknown Component")
+        timings = {}
+        started = time.perf_counter()
+
+        if not node_id:
+            return {
+                "node_id": node_id,
+                "name": component_name,
+                "success": False,
+                "error": "ID del nodo no proporcionado"
+            }
+
+        if node_id in self.unchanged_ids:
+            return {
+                "node_id": node_id,
+                "name": component_name,
+                "success": True,
+                "skipped": True,
+                "unchanged_since": self.since_version,
+                "timings": timings
+            }
+
+        try:
+            component_details = self.frames_by_id.get(node_id) or {
+                "success": False,
+                "error": "No se pudieron obtener los detalles del componente"
+            }
+
+            if not component_details.get("success", False):
+                return {
+                    "node_id": node_id,
+                    "name": component_name,
+                    "success": False,
+                    "error": component_details.get("error", "No se pudieron obtener los detalles del componente"),
+                    "timings": timings
+                }
+
+            queued = time.perf_counter()
+            # La primera llamada escribe el prefijo cacheable; el resto espera a que
+            # termine para leerlo de la caché en vez de volver a escribirlo en paralelo
+            warms_prefix = PROMPT_CACHING_ENABLED and not self._prefix_warmup["claimed"]
+            if warms_prefix:
+                self._prefix_warmup["claimed"] = True
+            elif PROMPT_CACHING_ENABLED:
+                await self._prefix_warmup["done"].wait()
+            try:
+                async with self._llm_semaphore:
+                    timings["llm_wait_ms"] = round((time.perf_counter() - queued) * 1000, 1)
+                    logger.info("🤖 Generando código para el componente %s...", component_name)
+                    stage_started = time.perf_counter()
+                    generation_result = await self.claude_service.generate_component_code(
+                        component_details.get("frame", {}),
+                        force_regenerate=self.force_regenerate,
+                        design_preamble=self.design_preamble
+                    )
+                    timings["llm_ms"] = round((time.perf_counter() - stage_started) * 1000, 1)
+            finally:
+                if warms_prefix:
+                    self._prefix_warmup["done"].set()
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+            if not generation_result.get("success", False):
+                return {
+                    "node_id": node_id,
+                    "name": component_name,
+                    "success": False,
+                    "error": generation_result.get("error", "Error generando el código del componente"),
+                    "rate_limited": generation_result.get("rate_limited", False),
+                    "timings": timings
+                }
+
+            # Verificar que todos los bloques de código se generaron
+            missing_blocks = []
+            if not generation_result.get("html_code"):
+                missing_blocks.append("HTML")
+            if not generation_result.get("css_code"):
+                missing_blocks.append("CSS")
+            if not generation_result.get("stencil_code"):
+                missing_blocks.append("Stencil Component (TSX)")
+
+            # Si falta algún bloque, agregarlo como advertencia pero continuar
+            warning = None
+            if missing_blocks:
+                warning = f"Los siguientes bloques de código no fueron generados: {', '.join(missing_blocks)}"
+
+            return {
+                "node_id": node_id,
+                "name": component_name,
+                "success": True,
+                "warning": warning,
+                "html_code": generation_result.get("html_code"),
+                "css_code": generation_result.get("css_code"),
+                "stencil_code": generation_result.get("stencil_code"),
+                "storybook_code": generation_result.get("storybook_code"),
+                "image_url": component_details.get("frame", {}).get("image_url"),
+                "image_proxy_url": component_details.get("frame", {}).get("image_proxy_url"),
+                "props": generation_result.get("props"),
+                "component_name": generation_result.get("component_name"),
+                "cache": generation_result.get("cache"),
+                "usage": generation_result.get("usage"),
+                "timings": timings
+            }
+
+        except Exception as component_error:
+            logger.error("❌ Error procesando componente %s: %s", component_name, component_error)
+            timings["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return {
+                "node_id": node_id,
+                "name": component_name,
+                "success": False,
+                "error": str(component_error),
+                "timings": timings
+            }
+
+    def summary(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Etapa 3: resumen de tiempos, tokens y resultados del lote"""
+        stage_timings = [r.get("timings", {}) for r in results]
+        timings = {
+            "wall_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "figma_batch_ms": self.figma_batch_ms,
+            "figma_requests": self.figma_requests,
+            "llm_ms_total": round(sum(t.get("llm_ms", 0) for t in stage_timings), 1),
+            "llm_wait_ms_total": round(sum(t.get("llm_wait_ms", 0) for t in stage_timings), 1),
+            "figma_concurrency": self.figma_concurrency,
+            "llm_concurrency": self.llm_concurrency
+        }
+
+        # Tokens del lote (sin contar las respuestas servidas desde la caché de generaciones)
+        usage = {
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0
+        }
+        for r in results:
+            if r.get("cache") == "hit" or not r.get("usage"):
+                continue
+            for field in usage:
+                usage[field] += r["usage"].get(field, 0)
+
+        success_count = len([r for r in results if r.get("success")])
+        return {
+            "total": len(results),
+            "success_count": success_count,
+            "error_count": len(results) - success_count,
+            "skipped_count": len([r for r in results if r.get("skipped")]),
+            "version": self.file_version,
+            "since_version": self.since_version,
+            "timings": timings,
+            "usage": usage
+        }
+
+
+def failed_component(component: Dict[str, Any], error: Any) -> Dict[str, Any]:
+    # Resultado de un componente cuya tarea terminó con una excepción no controlada
+    return {
+        "node_id": component.get("node_id"),
+        "name": component.get("name", "Unknown Component"),
+        "success": False,
+        "error": str(error)
+    }
@@ -0,0 +1,230 @@
+import asyncio
+import os
+import uuid
+from typing import Dict, List, Any, Optional
+
+from app.jobs.store import (
+    JobStore,
+    ITEM_DONE,
+    ITEM_ERROR,
+    ITEM_PENDING,
+    ITEM_RUNNING,
+    JOB_COMPLETED,
+    JOB_FAILED,
+    JOB_RUNNING,
+)
+from app.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class JobManager:
+    """Trabajos de generación en segundo plano con un pool acotado de workers
+
+    `submit` guarda el trabajo y devuelve su id al momento. Cada trabajo hace
+    la etapa de Figma del lote (`BatchGeneration.prepare`) y encola sus
+    componentes; `workers` tareas fijas los generan de uno en uno, sean del
+    trabajo que sean. Cada componente terminado se guarda en el `JobStore` y
+    se publica a los suscriptores del trabajo (SSE). Al arrancar se reanudan
+    los trabajos que quedaron a medias, repitiendo sólo los componentes sin
+    resultado.
+    """
+
+    def __init__(self, store: JobStore, workers: int):
+        self.store = store
+        self.workers = max(1, workers)
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._job_tasks: Dict[str, asyncio.Task] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        # job_id -> {"total", "completed"} de los trabajos en ejecución
+        self._progress: Dict[str, Dict[str, int]] = {}
+        self.stats = {
+            "submitted": 0,
+            "resumed": 0,
+            "completed": 0,
+            "failed": 0,
+            "items_processed": 0,
+            "purged": 0,
+        }
+
+    @classmethod
+    def from_env(cls) -> "JobManager":
+        return cls(
+            store=JobStore.from_env(),
+            workers=int(os.getenv("JOBS_WORKERS", os.getenv("BATCH_LLM_CONCURRENCY", "4"))),
+        )
+
+    async def start(self):
+        """Arrancar los workers y reanudar los trabajos pendientes (idempotente)"""
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self.stats["purged"] += await asyncio.to_thread(self.store.purge_expired)
+        for job_id in await asyncio.to_thread(self.store.unfinished):
+            logger.info("♻️ Reanudando trabajo de generación %s", job_id)
+            self.stats["resumed"] += 1
+            self._launch(job_id)
+
+    async def close(self):
+        # Los trabajos cancelados siguen "running" en el almacén y se reanudan en el próximo arranque
+        tasks = list(self._job_tasks.values()) + self._worker_tasks
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._job_tasks.clear()
+        self._worker_tasks = []
+        self._queue = None
+        await asyncio.to_thread(self.store.close)
+
+    async def submit(self, file_key: str, components: List[Dict[str, Any]], options: Dict[str, Any]) -> Dict[str, Any]:
+        await self.start()
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.create, job_id, file_key, components, options)
+        self.stats["submitted"] += 1
+        self._launch(job_id)
+        logger.info("📥 Trabajo de generación %s en cola (%s componentes)", job_id, len(components))
+        return await self.get(job_id, include_results=False)
+
+    async def get(self, job_id: str, include_results: bool = True) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id, include_results)
+
+    # --- Eventos de progreso -------------------------------------------------
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(job_id, [])
+        if queue in subscribers:
+            subscribers.remove(queue)
+        if not subscribers:
+            self._subscribers.pop(job_id, None)
+
+    def _publish(self, job_id: str, event: str, data: Dict[str, Any]):
+        for queue in self._subscribers.get(job_id, []):
+            queue.put_nowait((event, data))
+
+    # --- Ejecución -----------------------------------------------------------
+
+    def _launch(self, job_id: str):
+        task = asyncio.create_task(self._run_job(job_id))
+        self._job_tasks[job_id] = task
+        task.add_done_callback(lambda _: self._job_tasks.pop(job_id, None))
+
+    async def _run_job(self, job_id: str):
+        from app.claude.service import ClaudeAIService
+        from app.figma.client import get_figma_client
+        from app.jobs.batch import BatchGeneration, failed_component
+
+        job = await self.get(job_id, include_results=False)
+        if job is None:
+            return
+        self._progress[job_id] = {"total": job["total"], "completed": job["completed"]}
+        try:
+            figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
+            claude_key = os.getenv("CLAUDE_API_KEY")
+            if not figma_token or not claude_key:
+                raise RuntimeError("Se requieren FIGMA_ACCESS_TOKEN y CLAUDE_API_KEY")
+
+            claude_service = ClaudeAIService(claude_key)
+            if os.getenv("CLAUDE_MODEL"):
+                claude_service.model = os.getenv("CLAUDE_MODEL")
+            batch = BatchGeneration.from_request(get_figma_client(figma_token), claude_service, job["file_key"], job["options"])
+
+            await asyncio.to_thread(self.store.set_status, job_id, JOB_RUNNING)
+            self._publish(job_id, "job", {"job_id": job_id, "status": JOB_RUNNING, **self._progress[job_id]})
+
+            # Sólo se repiten los componentes sin resultado guardado
+            pending = [item for item in job["items"] if item["status"] in (ITEM_PENDING, ITEM_RUNNING)]
+            if pending:
+                prepared = await batch.prepare([item["node_id"] for item in pending if item["node_id"]])
+                if not prepared["success"]:
+                    raise RuntimeError(prepared["error"])
+                loop = asyncio.get_running_loop()
+                futures = []
+                for item in pending:
+                    future = loop.create_future()
+                    self._queue.put_nowait((job_id, batch, item, future))
+                    futures.append(future)
+                # Esperar a que todos los componentes terminen antes de cerrar el trabajo: si uno
+                # falla, los demás seguirían en la cola escribiendo en un trabajo ya cerrado
+                outcomes = await asyncio.gather(*futures, return_exceptions=True)
+                errors = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+                if errors:
+                    raise errors[0]
+
+            finished = await self.get(job_id)
+            results = [item.get("result") or failed_component(item, "Sin resultado") for item in finished["items"]]
+            summary = batch.summary(results)
+            await asyncio.to_thread(self.store.set_status, job_id, JOB_COMPLETED, summary)
+            self.stats["completed"] += 1
+            logger.info("✅ Trabajo %s completado: %s/%s componentes", job_id, summary['success_count'], summary['total'])
+            self._publish(job_id, "done", {"job_id": job_id, "status": JOB_COMPLETED, **summary})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("❌ Error en el trabajo de generación %s: %s", job_id, e)
+            await asyncio.to_thread(self.store.set_status, job_id, JOB_FAILED, None, str(e))
+            self.stats["failed"] += 1
+            self._publish(job_id, "done", {"job_id": job_id, "status": JOB_FAILED, "error": str(e)})
+        finally:
+            self._progress.pop(job_id, None)
+
+    async def _worker(self):
+        from app.jobs.batch import failed_component
+
+        while True:
+            job_id, batch, item, future = await self._queue.get()
+            try:
+                if future.done():
+                    # El trabajo se canceló mientras el componente esperaba en la cola
+                    continue
+                component = {"node_id": item["node_id"], "name": item["name"]}
+                event = {"job_id": job_id, "index": item["index"], "node_id": item["node_id"], "name": item["name"]}
+                await asyncio.to_thread(self.store.set_item, job_id, item["index"], ITEM_RUNNING)
+                self._publish(job_id, "item", dict(event, status=ITEM_RUNNING))
+
+                try:
+                    result = await batch.process(component)
+                except Exception as e:
+                    result = failed_component(component, e)
+                status = ITEM_DONE if result.get("success") else ITEM_ERROR
+                await asyncio.to_thread(self.store.set_item, job_id, item["index"], status, result)
+                self.stats["items_processed"] += 1
+
+                progress = self._progress.get(job_id)
+                if progress is not None:
+                    progress["completed"] += 1
+                    event.update(progress)
+                self._publish(job_id, "item", dict(event, status=status, result=result))
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                # Error del almacén: el trabajo falla en vez de quedarse esperando el componente
+                logger.error("❌ Error guardando el componente %s del trabajo %s: %s", item['name'], job_id, e)
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def queued_items(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def get_stats(self) -> Dict[str, Any]:
+        jobs_by_status = await asyncio.to_thread(self.store.counts)
+        return dict(
+            self.stats,
+            workers=self.workers,
+            queued_items=self.queued_items(),
+            active_jobs=len(self._job_tasks),
+            subscribers=sum(len(queues) for queues in self._subscribers.values()),
+            jobs_by_status=jobs_by_status,
+        )
+
+
+# Gestor único por proceso: se arranca y se detiene con la aplicación
+job_manager = JobManager.from_env()
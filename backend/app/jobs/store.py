@@ -0,0 +1,191 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Any, Optional
+
+# Estados de un trabajo y de cada uno de sus componentes
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+ITEM_PENDING = "pending"
+ITEM_RUNNING = "running"
+ITEM_DONE = "done"
+ITEM_ERROR = "error"
+
+FINISHED_JOB_STATES = (JOB_COMPLETED, JOB_FAILED)
+
+
+class JobStore:
+    """Almacén persistente (SQLite) de trabajos de generación y sus resultados
+
+    Cada componente se guarda en cuanto termina, así un reinicio del proceso
+    sólo repite los que quedaron pendientes y los resultados ya generados se
+    pueden consultar después sin volver a llamar a Claude. Los trabajos
+    terminados se borran a los `ttl_seconds`.
+
+    Las operaciones son bloqueantes: llamar con asyncio.to_thread.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "JobStore":
+        return cls(
+            path=os.getenv("JOBS_DB_PATH", os.path.join(".cache", "jobs", "jobs.sqlite3")),
+            ttl_seconds=float(os.getenv("JOBS_TTL_SECONDS", str(7 * 24 * 3600))),
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    file_key TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    summary TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    finished_at REAL
+                )"""
+            )
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS job_items (
+                    job_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    node_id TEXT,
+                    name TEXT,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, idx)
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def create(self, job_id: str, file_key: str, components: List[Dict[str, Any]], options: Dict[str, Any]):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT INTO jobs (id, file_key, status, options, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, file_key, JOB_QUEUED, json.dumps(options, ensure_ascii=False), now, now),
+            )
+            conn.executemany(
+                "INSERT INTO job_items (job_id, idx, node_id, name, status, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (job_id, idx, component.get("node_id"), component.get("name", "Unknown Component"), ITEM_PENDING, now)
+                    for idx, component in enumerate(components)
+                ],
+            )
+            conn.commit()
+
+    def set_status(self, job_id: str, status: str, summary: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        now = time.time()
+        finished_at = now if status in FINISHED_JOB_STATES else None
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "UPDATE jobs SET status = ?, summary = ?, error = ?, updated_at = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(summary, ensure_ascii=False) if summary is not None else None, error, now, finished_at, job_id),
+            )
+            conn.commit()
+
+    def set_item(self, job_id: str, idx: int, status: str, result: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "UPDATE job_items SET status = ?, result = ?, updated_at = ? WHERE job_id = ? AND idx = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, time.time(), job_id, idx),
+            )
+            conn.execute("UPDATE jobs SET updated_at = ? WHERE id = ?", (time.time(), job_id))
+            conn.commit()
+
+    def get(self, job_id: str, include_results: bool = True) -> Optional[Dict[str, Any]]:
+        """Trabajo con su progreso y, opcionalmente, los resultados de cada componente"""
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT id, file_key, status, options, summary, error, created_at, updated_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            items = conn.execute(
+                "SELECT idx, node_id, name, status, result FROM job_items WHERE job_id = ? ORDER BY idx",
+                (job_id,),
+            ).fetchall()
+
+        counts = {ITEM_PENDING: 0, ITEM_RUNNING: 0, ITEM_DONE: 0, ITEM_ERROR: 0}
+        job_items = []
+        for idx, node_id, name, status, result in items:
+            counts[status] = counts.get(status, 0) + 1
+            item = {"index": idx, "node_id": node_id, "name": name, "status": status}
+            if include_results and result is not None:
+                item["result"] = json.loads(result)
+            job_items.append(item)
+        return {
+            "job_id": row[0],
+            "file_key": row[1],
+            "status": row[2],
+            "options": json.loads(row[3]),
+            "summary": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+            "finished_at": row[8],
+            "total": len(job_items),
+            "completed": counts[ITEM_DONE] + counts[ITEM_ERROR],
+            "progress": counts,
+            "items": job_items,
+        }
+
+    def unfinished(self) -> List[str]:
+        """Trabajos que quedaron en cola o a medias (p. ej. tras un reinicio)"""
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (JOB_QUEUED, JOB_RUNNING)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            conn = self._connection()
+            expired = [row[0] for row in conn.execute(
+                "SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+            ).fetchall()]
+            for job_id in expired:
+                conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            conn.commit()
+        return len(expired)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            conn = self._connection()
+            rows = conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,158 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Any, Dict, Optional
+
+# Atributos propios de LogRecord: el resto son campos estructurados pasados con `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class Truncated:
+    """Valor que se recorta a `limit` caracteres sólo si el mensaje llega a formatearse
+
+    Para volcar payloads grandes (respuestas de la API, listas de ids) en debug:
+    con el nivel desactivado ni siquiera se convierte a texto.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        return _clip(self.value if isinstance(self.value, str) else str(self.value), self.limit)
+
+    __repr__ = __str__
+
+
+def _clip(text: str, limit: int) -> str:
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}… (+{len(text) - limit} caracteres)"
+
+
+class TruncatingQueueHandler(logging.handlers.QueueHandler):
+    """Encola los registros ya formateados y recortados; la escritura la hace el listener"""
+
+    def __init__(self, log_queue: queue.Queue, max_chars: int):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.msg = record.message = _clip(record.msg, self.max_chars)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Nunca bloquear la petición por el log: si la salida no da abasto se descarta
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro con nivel, logger, mensaje y los campos de `extra=`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LogSettings:
+    """Configuración del log de la aplicación (logger `app` y sus hijos)
+
+    Los mensajes pasan por una cola en memoria y un hilo (`QueueListener`) los
+    escribe en stdout, así la E/S nunca ocurre en el bucle de eventos. Con un
+    nivel desactivado el coste es sólo la comprobación del nivel: los
+    argumentos no se formatean.
+    """
+
+    def __init__(self, level: str, fmt: str, max_chars: int, queue_size: int):
+        self.level = level.upper()
+        self.fmt = fmt
+        self.max_chars = max_chars
+        self.queue_size = queue_size
+
+    @classmethod
+    def from_env(cls) -> "LogSettings":
+        return cls(
+            level=os.getenv("LOG_LEVEL", "INFO"),
+            fmt=os.getenv("LOG_FORMAT", "text"),
+            max_chars=int(os.getenv("LOG_MAX_CHARS", "2000")),
+            queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+        )
+
+
+_lock = threading.Lock()
+_handler: Optional[TruncatingQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+settings = LogSettings.from_env()
+
+
+def configure_logging():
+    """Instalar el handler con cola en el logger `app` (idempotente)"""
+    global _handler, _listener
+    with _lock:
+        if _handler is not None:
+            return
+        output = logging.StreamHandler(sys.stdout)
+        if settings.fmt == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+        log_queue: queue.Queue = queue.Queue(settings.queue_size)
+        _handler = TruncatingQueueHandler(log_queue, settings.max_chars)
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+        root = logging.getLogger("app")
+        root.setLevel(settings.level)
+        root.addHandler(_handler)
+        root.propagate = False
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    # Vaciar la cola antes de salir
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    configure_logging()
+    # Módulos ejecutados como script (`__main__`) también cuelgan del logger `app`
+    if name != "app" and not name.startswith("app."):
+        name = f"app.{name}"
+    return logging.getLogger(name)
+
+
+def truncate(value: Any, limit: Optional[int] = None) -> Truncated:
+    return Truncated(value, settings.max_chars if limit is None else limit)
+
+
+def get_stats() -> Dict[str, Any]:
+    return {
+        "level": logging.getLevelName(logging.getLogger("app").getEffectiveLevel()),
+        "format": settings.fmt,
+        "max_chars": settings.max_chars,
+        "queued": _handler.queue.qsize() if _handler is not None else 0,
+        "dropped": _handler.dropped if _handler is not None else 0,
+    }
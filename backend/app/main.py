@@ -1,9 +1,27 @@
-﻿from fastapi import FastAPI, HTTPException
+﻿from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Optional
+import asyncio
+import json
 import os
-import aiohttp  # Añadir esta importación
+
+from app.claude.cache import generation_cache
+from app.claude.pool import claude_pool
+from app.claude.scheduler import claude_scheduler
+from app.figma.cache import figma_file_cache
+from app.figma.index import index_stats
+from app.figma.renders import render_cache, RENDER_CONTENT_TYPES
+from app.figma.retry import figma_requests
+from app.figma.singleflight import figma_single_flight
+from app.figma.tokens import design_token_cache
+from app.figma.session import figma_pool
+from app.jobs.manager import job_manager
+from app.log import get_logger
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Counter, Gauge, MetricsMiddleware, metrics
+
+logger = get_logger(__name__)
 
 # Cargar variables de entorno
 # Por seguridad, las claves API ahora se cargan desde variables de entorno
@@ -14,11 +32,11 @@ os.environ['PORT'] = '8000'
 # os.environ['CLAUDE_MODEL'] = 'claude-3-sonnet-20240229'  # Alternativas: claude-3-haiku-20240307
 
 # DEBUG: Imprimir variables al inicio
-print("🔍 DEBUG - Variables configuradas:")
+logger.debug("🔍 Variables configuradas:")
 figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
 claude_key = os.getenv("CLAUDE_API_KEY")
-print(f"🎨 FIGMA_ACCESS_TOKEN: {figma_token[:20] if figma_token else 'None'}...")
-print(f"🤖 CLAUDE_API_KEY: {claude_key[:20] if claude_key else 'None'}...")
+logger.debug("🎨 FIGMA_ACCESS_TOKEN: %s...", figma_token[:20] if figma_token else 'None')
+logger.debug("🤖 CLAUDE_API_KEY: %s...", claude_key[:20] if claude_key else 'None')
 
 app = FastAPI(title="Figma to Stencil Generator", version="1.0.0")
 
@@ -30,6 +48,21 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Latencia y estado por ruta para /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Pools HTTP compartidos (Figma y Claude): se abren al arrancar y se cierran al apagar
+@app.on_event("startup")
+async def startup_http_pool():
+    await figma_pool.start()
+    # Workers de los trabajos de generación (reanuda los que quedaron a medias)
+    await job_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown_http_pool():
+    await job_manager.close()
+    await figma_pool.close()
+    await claude_pool.close()
 
 # Modelos de datos
 class HealthResponse(BaseModel):
@@ -64,6 +97,118 @@ async def debug_env():
         "timestamp": "2025-08-16 06:54:39"
     }
 
+@app.get("/debug/figma-pool")
+async def debug_figma_pool():
+    # Métricas del pool de conexiones compartido con la API de Figma
+    return {
+        "status": "success",
+        "data": figma_pool.get_stats(),
+        "timestamp": "2025-08-16 06:54:39"
+    }
+
+@app.get("/debug/figma-requests")
+async def debug_figma_requests():
+    # Reintentos, 429 recibidos, límite de concurrencia adaptativo por token de Figma
+    # y peticiones idénticas agrupadas en una sola descarga (single-flight)
+    return {
+        "status": "success",
+        "data": dict(figma_requests.get_stats(), single_flight=figma_single_flight.get_stats()),
+        "timestamp": "2025-08-16 06:54:39"
+    }
+
+@app.get("/debug/figma-cache")
+async def debug_figma_cache():
+    # Aciertos, fallos y bytes ahorrados por la caché de documentos de Figma
+    return {
+        "status": "success",
+        "data": dict(figma_file_cache.get_stats(), design_tokens=design_token_cache.get_stats(), document_index=index_stats),
+        "timestamp": "2025-08-16 06:54:39"
+    }
+
+@metrics.collector
+def service_metrics():
+    # Aciertos de las cachés y colas de los pools, leídos de sus contadores al pedir /metrics
+    cache_hits = Counter("cache_hits_total", "Aciertos por caché", ("cache",))
+    cache_misses = Counter("cache_misses_total", "Fallos por caché", ("cache",))
+    hit_ratio = Gauge("cache_hit_ratio", "Proporción de aciertos por caché desde el arranque", ("cache",))
+    figma_stats = figma_file_cache.stats
+    for name, hits, misses in (
+        ("figma_file", figma_stats["memory_hits"] + figma_stats["disk_hits"], figma_stats["misses"]),
+        ("generation", generation_cache.stats["hits"], generation_cache.stats["misses"]),
+        ("render", render_cache.stats["hits"], render_cache.stats["misses"]),
+        ("design_tokens", design_token_cache.stats["memory_hits"] + design_token_cache.stats["disk_hits"], design_token_cache.stats["misses"]),
+    ):
+        cache_hits.inc(name, amount=hits)
+        cache_misses.inc(name, amount=misses)
+        hit_ratio.set(round(hits / (hits + misses), 4) if hits + misses else 0.0, name)
+    coalesced = Counter("figma_coalesced_requests_total", "Peticiones a Figma resueltas esperando una idéntica en curso")
+    coalesced.inc(amount=figma_single_flight.stats["coalesced"])
+    claude_waiting = Gauge("claude_requests_waiting", "Llamadas a Claude esperando hueco en el pool")
+    claude_waiting.set(claude_pool.stats["waiting"])
+    jobs_queued = Gauge("generation_jobs_queued_items", "Componentes de trabajos en segundo plano esperando worker")
+    jobs_queued.set(job_manager.queued_items())
+    return [cache_hits, cache_misses, hit_ratio, coalesced, claude_waiting, jobs_queued]
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    # Formato de texto de Prometheus (no sigue el sobre status/data de la API)
+    return Response(content=metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/debug/logging")
+async def debug_logging():
+    # Nivel y formato del log, y registros en cola o descartados por saturación
+    from app.log import get_stats
+    return {
+        "status": "success",
+        "data": get_stats(),
+        "timestamp": "2025-08-16 06:54:39"
+    }
+
+@app.get("/debug/figma-renders")
+async def debug_figma_renders():
+    # Proxy local de renders: aciertos en disco, descargas y ocupación del presupuesto
+    return {
+        "status": "success",
+        "data": render_cache.get_stats(),
+        "timestamp": "2025-08-16 06:54:39"
+    }
+
+@app.get("/debug/claude-pool")
+async def debug_claude_pool():
+    # Llamadas a Claude en vuelo, en espera y límites del cliente compartido
+    return {
+        "status": "success",
+        "data": claude_pool.get_stats(),
+        "timestamp": "2025-08-16 06:54:39"
+    }
+
+@app.get("/debug/claude-rate-limits")
+async def debug_claude_rate_limits():
+    # Presupuestos restantes de la API de Claude, cola de espera y tiempos de espera
+    return {
+        "status": "success",
+        "data": claude_scheduler.get_stats(),
+        "timestamp": "2025-08-16 06:54:39"
+    }
+
+@app.get("/debug/claude-cache")
+async def debug_claude_cache():
+    # Aciertos y ocupación de la caché persistente de componentes generados
+    return {
+        "status": "success",
+        "data": await asyncio.to_thread(generation_cache.get_stats),
+        "timestamp": "2025-08-16 06:54:39"
+    }
+
+@app.get("/debug/jobs")
+async def debug_jobs():
+    # Trabajos de generación en segundo plano: workers, cola y trabajos por estado
+    return {
+        "status": "success",
+        "data": await job_manager.get_stats(),
+        "timestamp": "2025-08-16 06:54:39"
+    }
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     # Verificar estado de configuracion
@@ -82,15 +227,15 @@ async def health_check():
 async def test_figma():
     # Probar conexion con Figma
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
-        print(f"🔍 Token en endpoint: {figma_token[:20] if figma_token else 'None'}...")
+        logger.debug("🔍 Token en endpoint: %s...", figma_token[:20] if figma_token else 'None')
         
         if not figma_token or figma_token == "your_figma_token_here":
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
         
-        figma_client = FigmaClient(figma_token)
+        figma_client = get_figma_client(figma_token)
         result = await figma_client.test_connection()
         
         if result["success"]:
@@ -110,13 +255,13 @@ async def test_figma():
 async def get_figma_access():
     # Obtener acceso a archivos (archivos recientes + teams si existen)
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
         if not figma_token:
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
         
-        figma_client = FigmaClient(figma_token)
+        figma_client = get_figma_client(figma_token)
         access_items = await figma_client.get_teams()  # Ahora retorna archivos recientes + teams
         
         return {
@@ -133,13 +278,13 @@ async def get_figma_access():
 async def get_access_files(item_id: str, item_type: str = "recent_files"):
     # Obtener archivos de un elemento de acceso (archivos recientes o team)
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
         if not figma_token:
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
         
-        figma_client = FigmaClient(figma_token)
+        figma_client = get_figma_client(figma_token)
         files = await figma_client.get_files_from_access_item(item_id, item_type)
         
         return {
@@ -164,13 +309,13 @@ async def get_figma_teams():
 async def get_team_projects(team_id: str):
     # Obtener proyectos de un team especifico
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
         if not figma_token:
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
         
-        figma_client = FigmaClient(figma_token)
+        figma_client = get_figma_client(figma_token)
         projects = await figma_client.get_team_projects(team_id)
         
         return {
@@ -188,13 +333,13 @@ async def get_team_projects(team_id: str):
 async def get_project_files(project_id: str):
     # Obtener archivos de un proyecto especifico
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
         if not figma_token:
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
         
-        figma_client = FigmaClient(figma_token)
+        figma_client = get_figma_client(figma_token)
         files = await figma_client.get_project_files(project_id)
         
         return {
@@ -209,17 +354,22 @@ async def get_project_files(project_id: str):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.get("/figma/files/{file_key}/structure")
-async def get_file_structure(file_key: str):
+async def get_file_structure(file_key: str, full: bool = False, page_ids: Optional[str] = None):
     # Obtener estructura de un archivo (paginas y frames)
+    # Por defecto sólo se piden a Figma los dos primeros niveles; full=true descarga el documento completo
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
         if not figma_token:
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
         
-        figma_client = FigmaClient(figma_token)
-        structure = await figma_client.get_file_structure(file_key)
+        figma_client = get_figma_client(figma_token)
+        structure = await figma_client.get_file_structure(
+            file_key,
+            shallow=not full,
+            page_ids=page_ids.split(",") if page_ids else None
+        )
         
         if structure["success"]:
             return {
@@ -227,9 +377,48 @@ async def get_file_structure(file_key: str):
                 "data": structure,
                 "timestamp": "2025-08-16 06:54:39"
             }
+        elif structure.get("rate_limited"):
+            raise HTTPException(status_code=429, detail="Figma está limitando las solicitudes. Por favor, espera unos segundos e inténtalo de nuevo.")
         else:
             raise HTTPException(status_code=500, detail=structure["error"])
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+@app.get("/figma/files/{file_key}/tokens")
+async def get_file_design_tokens(file_key: str, output_format: str = Query("json", alias="format")):
+    """Design tokens del archivo (colores, tipografía, efectos y espaciado)
+
+    Se calculan una vez por versión del archivo. Con `format=css` se devuelven
+    directamente como variables CSS en `:root`.
+    """
+    try:
+        from app.figma.client import get_figma_client
+        
+        figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
+        if not figma_token:
+            raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
+        if output_format not in ("json", "css"):
+            raise HTTPException(status_code=400, detail="Formato no soportado (usar json o css)")
+        
+        figma_client = get_figma_client(figma_token)
+        result = await figma_client.get_design_tokens(file_key)
+        
+        if not result.get("success"):
+            raise HTTPException(status_code=500, detail=result.get("error", "Error desconocido"))
+        if output_format == "css":
+            return Response(content=result["css"] + "\n", media_type="text/css", headers={"X-Figma-Version": str(result["version"])})
+        
+        return {
+            "status": "success",
+            "data": {key: value for key, value in result.items() if key not in ("styles", "components")},
+            "timestamp": "2025-08-16 06:54:39"
+        }
+        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
@@ -237,13 +426,13 @@ async def get_file_structure(file_key: str):
 async def get_file_components_and_styles(file_key: str):
     # Obtener componentes y estilos de un archivo
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
         if not figma_token:
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
         
-        figma_client = FigmaClient(figma_token)
+        figma_client = get_figma_client(figma_token)
         result = await figma_client.get_file_components_and_styles(file_key)
         
         if result.get("success", False):
@@ -259,17 +448,31 @@ async def get_file_components_and_styles(file_key: str):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
         
 @app.get("/figma/files/{file_key}/components-with-thumbnails")
-async def get_components_with_thumbnails(file_key: str):
+async def get_components_with_thumbnails(
+    file_key: str,
+    scale: Optional[float] = None,
+    image_format: Optional[str] = Query(None, alias="format")
+):
     # Obtener componentes con imágenes de vista previa
+    # (las vistas en rejilla pueden pedir p. ej. ?scale=1&format=jpg, más ligeras)
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client, RENDER_FORMATS, RENDER_SCALE_RANGE
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
         if not figma_token:
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
         
-        figma_client = FigmaClient(figma_token)
-        result = await figma_client.get_components_with_thumbnails(file_key)
+        if image_format is not None and image_format.lower() not in RENDER_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Formato no soportado: {image_format} (usar {', '.join(RENDER_FORMATS)})")
+        if scale is not None and not RENDER_SCALE_RANGE[0] <= scale <= RENDER_SCALE_RANGE[1]:
+            raise HTTPException(status_code=400, detail=f"La escala debe estar entre {RENDER_SCALE_RANGE[0]} y {RENDER_SCALE_RANGE[1]}")
+        
+        figma_client = get_figma_client(figma_token)
+        result = await figma_client.get_components_with_thumbnails(
+            file_key,
+            scale=scale,
+            image_format=image_format.lower() if image_format else None
+        )
         
         if result.get("success", False):
             return {
@@ -283,16 +486,180 @@ async def get_components_with_thumbnails(file_key: str):
         else:
             raise HTTPException(status_code=500, detail=result.get("error", "Error desconocido"))
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+@app.get("/figma/files/{file_key}/nodes")
+async def find_file_nodes(
+    file_key: str,
+    node_type: Optional[str] = Query(None, alias="type"),
+    name: Optional[str] = None,
+    page_id: Optional[str] = None,
+    component_id: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """Buscar nodos del archivo por tipo, prefijo de nombre, página o componente
+
+    Se responde desde el índice del documento (uno por versión del archivo); p. ej.
+    `?type=INSTANCE&component_id=1:2` lista las instancias de un componente y
+    `?type=FRAME&name=Card` los frames cuyo nombre empieza por "Card".
+    """
+    try:
+        from app.figma.client import get_figma_client
+        
+        figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
+        if not figma_token:
+            raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
+        
+        figma_client = get_figma_client(figma_token)
+        result = await figma_client.find_document_nodes(
+            file_key,
+            node_type=node_type.upper() if node_type else None,
+            name_prefix=name,
+            page_id=page_id,
+            component_id=component_id,
+            limit=limit
+        )
+        
+        if result.get("success"):
+            return {
+                "status": "success",
+                "data": result,
+                "timestamp": "2025-08-16 06:54:39"
+            }
+        elif result.get("rate_limited"):
+            raise HTTPException(status_code=429, detail="Figma está limitando las solicitudes. Por favor, espera unos segundos e inténtalo de nuevo.")
+        else:
+            raise HTTPException(status_code=500, detail=result.get("error", "Error desconocido"))
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+@app.get("/figma/files/{file_key}/nodes/{node_id}")
+async def get_file_node(file_key: str, node_id: str):
+    # Datos de un nodo (página, ruta, hijos e instancias si es un componente) desde el índice del documento
+    try:
+        from app.figma.client import get_figma_client
+        
+        figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
+        if not figma_token:
+            raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
+        
+        figma_client = get_figma_client(figma_token)
+        result = await figma_client.get_document_node(file_key, node_id)
+        
+        if result.get("success"):
+            return {
+                "status": "success",
+                "data": result,
+                "timestamp": "2025-08-16 06:54:39"
+            }
+        elif result.get("rate_limited"):
+            raise HTTPException(status_code=429, detail="Figma está limitando las solicitudes. Por favor, espera unos segundos e inténtalo de nuevo.")
+        else:
+            raise HTTPException(status_code=404 if result.get("not_found") else 500, detail=result.get("error", "Error desconocido"))
+        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+@app.get("/figma/files/{file_key}/changes")
+async def get_file_changes(file_key: str, since: str, until: Optional[str] = None):
+    """Frames y componentes añadidos, eliminados o modificados entre dos versiones del archivo
+
+    `since` y `until` son ids de versión de Figma (sin `until`, la versión
+    actual). Se comparan los hashes de los subárboles, así que mover un frame
+    en el lienzo no cuenta como cambio.
+    """
+    try:
+        from app.figma.client import get_figma_client
+        
+        figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
+        if not figma_token:
+            raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
+        
+        figma_client = get_figma_client(figma_token)
+        result = await figma_client.diff_file_versions(file_key, since, until)
+        
+        if result.get("success"):
+            return {
+                "status": "success",
+                "data": result,
+                "timestamp": "2025-08-16 06:54:39"
+            }
+        elif result.get("rate_limited"):
+            raise HTTPException(status_code=429, detail="Figma está limitando las solicitudes. Por favor, espera unos segundos e inténtalo de nuevo.")
+        else:
+            raise HTTPException(status_code=500, detail=result.get("error", "Error desconocido"))
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+# Segundos que el navegador puede reutilizar un render pedido sin versión (`v`);
+# con versión la URL identifica un render inmutable
+RENDER_PROXY_MAX_AGE = int(os.getenv("FIGMA_RENDER_PROXY_MAX_AGE", "300"))
+
+@app.get("/figma/files/{file_key}/renders/{node_id}")
+async def get_node_render(
+    file_key: str,
+    node_id: str,
+    request: Request,
+    scale: float = 2,
+    image_format: str = Query("png", alias="format"),
+    v: Optional[str] = None
+):
+    """Proxy local de renders de Figma con caché en disco
+
+    Cada render se descarga de Figma una sola vez por (archivo, nodo, versión,
+    escala, formato) y se sirve desde disco con ETag y Cache-Control. Las rutas
+    `thumbnail_proxy_url` / `image_proxy_url` de otras respuestas apuntan aquí.
+    """
+    from app.figma.client import get_figma_client, RENDER_FORMATS, RENDER_SCALE_RANGE
+    
+    figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
+    if not figma_token:
+        raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
+    
+    image_format = image_format.lower()
+    if image_format not in RENDER_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Formato no soportado: {image_format} (usar {', '.join(RENDER_FORMATS)})")
+    if not RENDER_SCALE_RANGE[0] <= scale <= RENDER_SCALE_RANGE[1]:
+        raise HTTPException(status_code=400, detail=f"La escala debe estar entre {RENDER_SCALE_RANGE[0]} y {RENDER_SCALE_RANGE[1]}")
+    
+    figma_client = get_figma_client(figma_token)
+    render = await figma_client.get_cached_render(file_key, node_id, scale=scale, image_format=image_format, version=v)
+    if not render.get("success"):
+        if render.get("rate_limited"):
+            raise HTTPException(status_code=429, detail="Figma está limitando las solicitudes. Por favor, inténtalo de nuevo en unos minutos.")
+        status_code = 404 if render.get("not_found") else 502
+        raise HTTPException(status_code=status_code, detail=render.get("error", "No se pudo obtener el render"))
+    
+    etag = f'"{render["key"]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable" if v else f"public, max-age={RENDER_PROXY_MAX_AGE}",
+        "X-Render-Cache": render["cache"],
+        "X-Figma-Version": str(render["version"]),
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return FileResponse(render["path"], media_type=RENDER_CONTENT_TYPES[image_format], headers=headers)
+
 @app.post("/figma/analyze")
 async def analyze_figma_file(file_data: dict):
     # Analizar archivo de Figma
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         
-        figma_client = FigmaClient(os.getenv("FIGMA_ACCESS_TOKEN"))
+        figma_client = get_figma_client(os.getenv("FIGMA_ACCESS_TOKEN"))
         file_key = file_data.get("file_key")
         
         if not file_key:
@@ -322,19 +689,19 @@ async def info():
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    print("🚀 Iniciando Figma to Stencil Generator...")
-    print(f"📱 Servidor: http://localhost:{port}")
-    print(f"📚 Documentación: http://localhost:{port}/docs")
-    print(f"👤 Usuario: cleodisenobg")
-    print(f"📅 Fecha: 2025-08-16 06:54:39")
-    print("🔄 Manteniendo servidor activo... (Ctrl+C para salir)")
+    logger.info("🚀 Iniciando Figma to Stencil Generator...")
+    logger.info("📱 Servidor: http://localhost:%s", port)
+    logger.info("📚 Documentación: http://localhost:%s/docs", port)
+    logger.info("👤 Usuario: cleodisenobg")
+    logger.info("📅 Fecha: 2025-08-16 06:54:39")
+    logger.info("🔄 Manteniendo servidor activo... (Ctrl+C para salir)")
     uvicorn.run(app, host="0.0.0.0", port=port, reload=False)
 
 @app.post("/figma/file-direct")
 async def analyze_file_direct(request_data: dict):
     # Analizar archivo usando file_key directo
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
         if not figma_token:
@@ -345,7 +712,7 @@ async def analyze_file_direct(request_data: dict):
         
         # Si se proporciona URL, extraer file_key
         if file_url and not file_key:
-            print(f"📝 Intentando extraer file_key de URL: {file_url}")
+            logger.info("📝 Intentando extraer file_key de URL: %s", file_url)
             
             # Intentar diferentes patrones de URL de Figma
             import re
@@ -361,22 +728,26 @@ async def analyze_file_direct(request_data: dict):
             
             if match_file:
                 file_key = match_file.group(1)
-                print(f"✅ file_key extraído del patrón /file/: {file_key}")
+                logger.info("✅ file_key extraído del patrón /file/: %s", file_key)
             elif match_design:
                 file_key = match_design.group(1)
-                print(f"✅ file_key extraído del patrón /design/: {file_key}")
+                logger.info("✅ file_key extraído del patrón /design/: %s", file_key)
             elif match_node:
                 file_key = match_node.group(1)
-                print(f"✅ file_key extraído del patrón de ID largo: {file_key}")
+                logger.info("✅ file_key extraído del patrón de ID largo: %s", file_key)
             else:
                 raise HTTPException(status_code=400, detail=f"URL de Figma inválida: No se pudo extraer el file_key de '{file_url}'")
         
         if not file_key:
             raise HTTPException(status_code=400, detail="file_key o file_url requerido")
         
-        print(f"🔍 Analizando archivo con file_key: {file_key}")
-        figma_client = FigmaClient(figma_token)
-        structure = await figma_client.get_file_structure(file_key)
+        logger.debug("🔍 Analizando archivo con file_key: %s", file_key)
+        figma_client = get_figma_client(figma_token)
+        structure = await figma_client.get_file_structure(
+            file_key,
+            shallow=not request_data.get("full", False),
+            page_ids=request_data.get("page_ids")
+        )
         
         if structure["success"]:
             return {
@@ -385,30 +756,30 @@ async def analyze_file_direct(request_data: dict):
                 "timestamp": "2025-08-16 07:12:42"
             }
         else:
-            print(f"❌ Error al obtener estructura: {structure['error']}")
+            logger.error("❌ Error al obtener estructura: %s", structure['error'])
             raise HTTPException(status_code=500, detail=structure["error"])
         
     except Exception as e:
-        print(f"❌ Error en analyze_file_direct: {str(e)}")
+        logger.error("❌ Error en analyze_file_direct: %s", e)
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.get("/test/teams")
 async def test_teams():
     """Endpoint para probar la obtención de equipos y mostrar información detallada en consola"""
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
-        print("\n🔍 DEBUG - Probando obtención de equipos...")
-        print(f"🎨 Token: {figma_token[:20] if figma_token else 'None'}...")
+        logger.debug("🔍 Probando obtención de equipos...")
+        logger.debug("🎨 Token: %s...", figma_token[:20] if figma_token else 'None')
         
         if not figma_token or figma_token == "your_figma_token_here":
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
         
-        figma_client = FigmaClient(figma_token)
+        figma_client = get_figma_client(figma_token)
         teams = await figma_client.get_teams()
         
-        print("\n✅ Información de equipos obtenida con éxito")
+        logger.info("✅ Información de equipos obtenida con éxito")
         
         return {
             "status": "success", 
@@ -419,22 +790,22 @@ async def test_teams():
         }
             
     except Exception as e:
-        print(f"❌ Error obteniendo equipos: {e}")
+        logger.error("❌ Error obteniendo equipos: %s", e)
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.get("/test/specific-team/{team_id}")
 async def test_specific_team(team_id: str):
     """Endpoint para probar la obtención de un equipo específico por su ID"""
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
-        print(f"\n🔍 DEBUG - Probando obtención del equipo específico: {team_id}")
+        logger.debug("🔍 Probando obtención del equipo específico: %s", team_id)
         
         if not figma_token or figma_token == "your_figma_token_here":
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
         
-        figma_client = FigmaClient(figma_token)
+        figma_client = get_figma_client(figma_token)
         team_info = await figma_client.get_team_by_id(team_id)
         
         if team_info["success"]:
@@ -448,19 +819,19 @@ async def test_specific_team(team_id: str):
             raise HTTPException(status_code=500, detail=team_info["error"])
             
     except Exception as e:
-        print(f"❌ Error obteniendo equipo específico: {e}")
+        logger.error("❌ Error obteniendo equipo específico: %s", e)
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.get("/test/all-teams")
 async def test_all_teams():
     """Endpoint para obtener TODOS los equipos a los que tiene acceso el usuario"""
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         import json
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
-        print("\n🔍 DEBUG - Obteniendo TODOS los equipos disponibles...")
-        print(f"🎨 Token: {figma_token[:20] if figma_token else 'None'}...")
+        logger.debug("🔍 Obteniendo TODOS los equipos disponibles...")
+        logger.debug("🎨 Token: %s...", figma_token[:20] if figma_token else 'None')
         
         if not figma_token or figma_token == "your_figma_token_here":
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
@@ -476,15 +847,15 @@ async def test_all_teams():
         ]
         
         # Verificar cuáles de estos equipos son accesibles
-        figma_client = FigmaClient(figma_token)
+        figma_client = get_figma_client(figma_token)
         accessible_teams = []
         
-        print("\n🔍 DEBUG - Verificando acceso a equipos conocidos...")
+        logger.debug("🔍 Verificando acceso a equipos conocidos...")
         for team in known_team_ids:
             try:
                 team_info = await figma_client.check_team_access(team["id"])
                 if team_info["accessible"]:
-                    print(f"✅ Acceso confirmado a equipo: {team['name']} (ID: {team['id']})")
+                    logger.info("✅ Acceso confirmado a equipo: %s (ID: %s)", team['name'], team['id'])
                     accessible_teams.append({
                         "id": team["id"],
                         "name": team_info.get("name", team["name"]),
@@ -492,15 +863,15 @@ async def test_all_teams():
                         "description": f"Equipo verificado de Figma ({team['id']})"
                     })
                 else:
-                    print(f"❌ Sin acceso a equipo: {team['name']} (ID: {team['id']})")
+                    logger.error("❌ Sin acceso a equipo: %s (ID: %s)", team['name'], team['id'])
             except Exception as e:
-                print(f"❌ Error verificando equipo {team['id']}: {str(e)}")
+                logger.error("❌ Error verificando equipo %s: %s", team['id'], e)
         
         # Si no se encontró ningún equipo accesible, devolvemos al menos el equipo Website
         if not accessible_teams:
-            print("❌ No se encontró ningún equipo accesible")
+            logger.error("❌ No se encontró ningún equipo accesible")
             specific_team_id = "1507023165279092081"
-            print(f"📌 Devolviendo equipo manual ID: {specific_team_id}")
+            logger.debug("📌 Devolviendo equipo manual ID: %s", specific_team_id)
             return {
                 "status": "success",
                 "message": "Se encontró 1 equipo añadido manualmente",
@@ -514,7 +885,7 @@ async def test_all_teams():
                 "timestamp": "2025-08-16 06:54:39"
             }
         
-        print(f"\n✅ Se encontraron {len(accessible_teams)} equipos accesibles")
+        logger.info("✅ Se encontraron %s equipos accesibles", len(accessible_teams))
         
         return {
             "status": "success", 
@@ -525,7 +896,7 @@ async def test_all_teams():
         }
             
     except Exception as e:
-        print(f"❌ Error obteniendo todos los equipos: {e}")
+        logger.error("❌ Error obteniendo todos los equipos: %s", e)
         return {
             "status": "error",
             "message": f"Error: {str(e)}",
@@ -543,13 +914,13 @@ async def test_all_teams():
 async def get_file_details(file_key: str):
     """Obtener detalles completos de un archivo de Figma"""
     try:
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
         if not figma_token:
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
         
-        figma_client = FigmaClient(figma_token)
+        figma_client = get_figma_client(figma_token)
         
         # Obtener la estructura completa del archivo
         structure = await figma_client.get_file_structure(file_key)
@@ -570,24 +941,12 @@ async def get_file_details(file_key: str):
         
         # Obtener información adicional sobre componentes y estilos
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"{figma_client.base_url}/files/{file_key}/components",
-                    headers=figma_client.headers
-                ) as response:
-                    if response.status == 200:
-                        components_data = await response.json()
-                        details["components"] = components_data.get("meta", {}).get("components", [])
-                
-                async with session.get(
-                    f"{figma_client.base_url}/files/{file_key}/styles",
-                    headers=figma_client.headers
-                ) as response:
-                    if response.status == 200:
-                        styles_data = await response.json()
-                        details["styles"] = styles_data.get("meta", {}).get("styles", [])
+            comp_styles = await figma_client.get_file_components_and_styles(file_key)
+            if comp_styles.get("success"):
+                details["components"] = comp_styles.get("components", [])
+                details["styles"] = comp_styles.get("styles", [])
         except Exception as e:
-            print(f"⚠️ Error obteniendo detalles adicionales: {str(e)}")
+            logger.warning("⚠️ Error obteniendo detalles adicionales: %s", e)
         
         return {
             "status": "success",
@@ -596,23 +955,34 @@ async def get_file_details(file_key: str):
         }
         
     except Exception as e:
-        print(f"❌ Error en get_file_details: {str(e)}")
+        logger.error("❌ Error en get_file_details: %s", e)
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.post("/figma/generate-component")
 async def generate_component(frame_data: dict):
-    """Generar componente Stencil usando Claude AI a partir de datos de frame"""
+    """Generar componente Stencil usando Claude AI a partir de datos de frame
+
+    `generator` elige cómo (por defecto GENERATOR_MODE o "llm"):
+    - "llm": Claude genera los cuatro bloques
+    - "rules": generador por reglas de app/generators, sin LLM (milisegundos)
+    - "skeleton": el resultado de las reglas va a Claude como base a completar
+    """
     try:
-        from app.figma.client import FigmaClient
-        from app.claude.service import ClaudeAIService
+        from app.figma.client import get_figma_client
+        from app.claude.service import ClaudeAIService, build_design_system_preamble
+        from app.generators.stencil import generate_stencil_component, skeleton_blocks
         
         figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
         claude_key = os.getenv("CLAUDE_API_KEY")
+        generator_mode = frame_data.get("generator") or os.getenv("GENERATOR_MODE", "llm")
+        
+        if generator_mode not in ("llm", "rules", "skeleton"):
+            raise HTTPException(status_code=400, detail="generator debe ser 'llm', 'rules' o 'skeleton'")
         
         if not figma_token:
             raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
         
-        if not claude_key:
+        if not claude_key and generator_mode != "rules":
             raise HTTPException(status_code=500, detail="❌ API Key de Claude requerido")
         
         file_key = frame_data.get("file_key")
@@ -621,45 +991,71 @@ async def generate_component(frame_data: dict):
         if not file_key or not frame_id:
             raise HTTPException(status_code=400, detail="file_key y frame_id son requeridos")
         
-        # 1. Obtener detalles completos del frame
-        figma_client = FigmaClient(figma_token)
-        frame_details = await figma_client.get_frame_details(file_key, frame_id)
+        # 1. Obtener detalles completos del frame y los design tokens del archivo
+        # (calculados una vez por versión: normalmente salen de la caché)
+        figma_client = get_figma_client(figma_token)
+        frame_details, design_system = await asyncio.gather(
+            figma_client.get_frame_details(file_key, frame_id),
+            figma_client.get_design_tokens(file_key)
+        )
         
         if not frame_details.get("success"):
+            if frame_details.get("rate_limited"):
+                raise HTTPException(status_code=429, detail="Figma está limitando las solicitudes. Por favor, espera unos segundos e inténtalo de nuevo.")
             raise HTTPException(status_code=500, detail=frame_details.get("error", "Error obteniendo detalles del frame"))
         
-        print(f"✅ Detalles del frame obtenidos correctamente: {frame_details.get('frame', {}).get('name')}")
-        
-        # 2. Obtener componentes y estilos para design tokens
-        comp_styles = await figma_client.get_file_components_and_styles(file_key)
+        logger.info("✅ Detalles del frame obtenidos correctamente: %s", frame_details.get('frame', {}).get('name'))
+        
+        skeleton = None
+        if generator_mode in ("rules", "skeleton"):
+            rules_result = generate_stencil_component(frame_details.get("frame", {}), (design_system or {}).get("tokens"))
+            if not rules_result.get("success"):
+                raise HTTPException(status_code=500, detail=rules_result.get("error", "Error en el generador por reglas"))
+            if generator_mode == "rules":
+                frame = frame_details.get("frame", {})
+                rules_result["image_url"] = frame.get("image_url")
+                rules_result["image_proxy_url"] = figma_client.render_proxy_url(file_key, frame_id, frame.get("image_url"))
+                return {
+                    "status": "success",
+                    "data": rules_result,
+                    "frame_name": frame.get("name"),
+                    "metadata": frame_details.get("metadata", {}),
+                    "timestamp": "2025-08-16 08:30:45"
+                }
+            skeleton = skeleton_blocks(rules_result)
         
         # Verificar versión de la librería anthropic
         try:
             import anthropic
-            print(f"📦 Versión de anthropic: {anthropic.__version__}")
+            logger.info("📦 Versión de anthropic: %s", anthropic.__version__)
         except Exception as version_error:
-            print(f"⚠️ No se pudo obtener la versión de anthropic: {str(version_error)}")
+            logger.warning("⚠️ No se pudo obtener la versión de anthropic: %s", version_error)
         
-        # 3. Enviar a Claude para generar el componente
+        # 2. Enviar a Claude para generar el componente
         try:
-            print(f"🤖 Inicializando servicio Claude con API Key: {claude_key[:10]}...")
+            logger.debug("🤖 Inicializando servicio Claude con API Key: %s...", claude_key[:10])
             claude_service = ClaudeAIService(claude_key)
-            print(f"✅ Servicio Claude inicializado correctamente")
+            logger.info("✅ Servicio Claude inicializado correctamente")
             
             # Verificar si hay un modelo específico a usar (opcional)
             if os.getenv("CLAUDE_MODEL"):
                 claude_service.model = os.getenv("CLAUDE_MODEL")
-                print(f"🔧 Usando modelo configurado manualmente: {claude_service.model}")
+                logger.info("🔧 Usando modelo configurado manualmente: %s", claude_service.model)
             
-            print(f"🚀 Generando componente con Claude...")
-            generation_result = await claude_service.generate_component_code(frame_details.get("frame"))
+            logger.info("🚀 Generando componente con Claude...")
+            generation_result = await claude_service.generate_component_code(
+                frame_details.get("frame"),
+                force_regenerate=bool(frame_data.get("force_regenerate")),
+                design_preamble=build_design_system_preamble(design_system),
+                skeleton=skeleton
+            )
             
             if not generation_result.get("success"):
                 error_msg = generation_result.get("error", "Error generando el código del componente")
                 
                 # Manejo especial para errores de límite de tasa
                 if generation_result.get("rate_limited"):
-                    print(f"⚠️ Límite de tasa de la API de Claude alcanzado: {error_msg}")
+                    logger.warning("⚠️ Límite de tasa de la API de Claude alcanzado: %s", error_msg)
                     raise HTTPException(
                         status_code=429, 
                         detail="Se ha alcanzado el límite de solicitudes a la API de Claude. Por favor, espera unos minutos e inténtalo de nuevo."
@@ -667,6 +1063,8 @@ async def generate_component(frame_data: dict):
                 
                 raise HTTPException(status_code=500, detail=error_msg)
             
+            generation_result["generator"] = generator_mode
+            
             # Validar que al menos algunos bloques de código se generaron correctamente
             missing_blocks = []
             if not generation_result.get("html_code"):
@@ -678,18 +1076,26 @@ async def generate_component(frame_data: dict):
             
             if missing_blocks:
                 warning_msg = f"⚠️ Atención: Los siguientes bloques de código no fueron generados: {', '.join(missing_blocks)}"
-                print(warning_msg)
+                logger.warning(warning_msg)
                 # Añadir mensaje de advertencia, pero seguir procesando
                 generation_result["warning"] = warning_msg
             
-            # Asegurarnos de que la URL de la imagen esté incluida en la respuesta
+            # Asegurarnos de que la URL de la imagen esté incluida en la respuesta;
+            # si el render quedó pendiente, normalmente ya terminó durante la generación
+            metadata = frame_details.get("metadata", {})
             if "image_url" not in generation_result:
-                generation_result["image_url"] = frame_details.get("frame", {}).get("image_url")
+                image_url = frame_details.get("frame", {}).get("image_url")
+                if not image_url and metadata.get("image_status") == "pending":
+                    image_url = await figma_client.resolve_frame_render(file_key, frame_id, timeout=5)
+                    metadata["image_status"] = "ready" if image_url else "pending"
+                generation_result["image_url"] = image_url
+                generation_result["image_proxy_url"] = figma_client.render_proxy_url(file_key, frame_id, image_url)
                 
             return {
                 "status": "success",
                 "data": generation_result,
                 "frame_name": frame_details.get("frame", {}).get("name"),
+                "metadata": metadata,
                 "timestamp": "2025-08-16 08:30:45"
             }
         except HTTPException as http_err:
@@ -697,7 +1103,7 @@ async def generate_component(frame_data: dict):
             raise http_err
         except Exception as claude_error:
             error_message = str(claude_error)
-            print(f"❌ Error específico en el servicio Claude: {error_message}")
+            logger.error("❌ Error específico en el servicio Claude: %s", error_message)
             
             # Manejo específico para diferentes tipos de errores
             if "rate_limit" in error_message.lower() or "429" in error_message:
@@ -709,18 +1115,119 @@ async def generate_component(frame_data: dict):
                 raise HTTPException(status_code=401, detail="Error de autenticación con la API de Claude. Verifica tu API key.")
             else:
                 raise HTTPException(status_code=500, detail=f"Error al generar el componente: {error_message}")
+    except HTTPException:
+        # Conservar el código de estado (400, 429...) en lugar de convertirlo en 500
+        raise
     except Exception as e:
-        print(f"❌ Error general en generate-component: {str(e)}")
+        logger.error("❌ Error general en generate-component: %s", e)
         raise HTTPException(status_code=500, detail=f"Error general: {str(e)}")
 
 
+def _sse(event: str, data: dict) -> str:
+    # Formato Server-Sent Events: un evento con nombre y datos JSON
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/figma/generate-component/stream")
+async def generate_component_stream(frame_data: dict):
+    """Generar un componente en streaming (Server-Sent Events)
+
+    Eventos: `frame` (detalles obtenidos de Figma), `delta` (texto del modelo),
+    `block` (bloque html/css/tsx/story completo en cuanto se cierra), y al final
+    `result` con la misma respuesta que /figma/generate-component o `error`.
+    """
+    from app.figma.client import get_figma_client
+    from app.claude.service import ClaudeAIService, build_design_system_preamble
+    
+    figma_token = os.getenv("FIGMA_ACCESS_TOKEN")
+    claude_key = os.getenv("CLAUDE_API_KEY")
+    
+    if not figma_token:
+        raise HTTPException(status_code=500, detail="❌ Token de Figma requerido")
+    
+    if not claude_key:
+        raise HTTPException(status_code=500, detail="❌ API Key de Claude requerido")
+    
+    file_key = frame_data.get("file_key")
+    frame_id = frame_data.get("frame_id")
+    
+    if not file_key or not frame_id:
+        raise HTTPException(status_code=400, detail="file_key y frame_id son requeridos")
+    
+    async def events():
+        try:
+            figma_client = get_figma_client(figma_token)
+            frame_details, design_system = await asyncio.gather(
+                figma_client.get_frame_details(file_key, frame_id),
+                figma_client.get_design_tokens(file_key)
+            )
+            if not frame_details.get("success"):
+                yield _sse("error", {"detail": frame_details.get("error", "Error obteniendo detalles del frame")})
+                return
+            
+            frame = frame_details.get("frame", {})
+            metadata = frame_details.get("metadata", {})
+            yield _sse("frame", {"frame_name": frame.get("name"), "metadata": metadata})
+            
+            claude_service = ClaudeAIService(claude_key)
+            if os.getenv("CLAUDE_MODEL"):
+                claude_service.model = os.getenv("CLAUDE_MODEL")
+            
+            async for event in claude_service.stream_component_code(
+                frame,
+                force_regenerate=bool(frame_data.get("force_regenerate")),
+                design_preamble=build_design_system_preamble(design_system)
+            ):
+                if event["event"] != "result":
+                    yield _sse(event["event"], {k: v for k, v in event.items() if k != "event"})
+                    continue
+                
+                generation_result = event["data"]
+                if not generation_result.get("success"):
+                    yield _sse("error", {
+                        "detail": generation_result.get("error", "Error generando el código del componente"),
+                        "rate_limited": generation_result.get("rate_limited", False)
+                    })
+                    return
+                
+                # Mismo formato final que /figma/generate-component
+                image_url = frame.get("image_url")
+                if not image_url and metadata.get("image_status") == "pending":
+                    image_url = await figma_client.resolve_frame_render(file_key, frame_id, timeout=5)
+                    metadata["image_status"] = "ready" if image_url else "pending"
+                generation_result["image_url"] = image_url
+                generation_result["image_proxy_url"] = figma_client.render_proxy_url(file_key, frame_id, image_url)
+                yield _sse("result", {
+                    "status": "success",
+                    "data": generation_result,
+                    "frame_name": frame.get("name"),
+                    "metadata": metadata,
+                    "timestamp": "2025-08-16 08:30:45"
+                })
+        except Exception as e:
+            logger.error("❌ Error en generate-component/stream: %s", e)
+            yield _sse("error", {"detail": f"Error general: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/figma/generate-multiple-components")
 async def generate_multiple_components(request_data: dict):
-    """Endpoint para generar múltiples componentes a partir de sus node_ids"""
+    """Endpoint para generar múltiples componentes a partir de sus node_ids
+
+    Mantiene abierta la petición durante todo el lote; para lotes grandes usar
+    los trabajos en segundo plano (POST /figma/jobs). Con `since_version` (la
+    `version` devuelta por un lote anterior) sólo se regeneran los componentes
+    que cambiaron desde esa versión; el resto vuelve con `skipped: true`.
+    """
     try:
         # Importar clientes
-        from app.figma.client import FigmaClient
+        from app.figma.client import get_figma_client
         from app.claude.service import ClaudeAIService
+        from app.jobs.batch import BatchGeneration, failed_component
         
         # Validar datos de entrada
         file_key = request_data.get("file_key")
@@ -733,107 +1240,45 @@ async def generate_multiple_components(request_data: dict):
             raise HTTPException(status_code=400, detail="Se requiere una lista de componentes para generar")
             
         # Inicializar clientes
-        figma_client = FigmaClient(os.getenv("FIGMA_ACCESS_TOKEN"))
+        figma_client = get_figma_client(os.getenv("FIGMA_ACCESS_TOKEN"))
         claude_service = ClaudeAIService(os.getenv("CLAUDE_API_KEY"))
         
         # Verificar si hay un modelo específico a usar (opcional)
         if os.getenv("CLAUDE_MODEL"):
             claude_service.model = os.getenv("CLAUDE_MODEL")
-            print(f"🔧 Usando modelo configurado manualmente: {claude_service.model}")
-        
-        results = []
-        
-        # Procesar cada componente
-        for component in components:
-            node_id = component.get("node_id")
-            component_name = component.get("name", "Unknown Component")
-            
-            if not node_id:
-                results.append({
-                    "node_id": node_id,
-                    "name": component_name,
-                    "success": False,
-                    "error": "ID del nodo no proporcionado"
-                })
-                continue
-                
-            try:
-                print(f"\n🔍 Obteniendo detalles del componente {node_id} ({component_name})...")
-                
-                # Obtener detalles del componente usando la API de Figma
-                component_details = await figma_client.get_frame_details(file_key, node_id)
-                
-                if not component_details.get("success", False):
-                    results.append({
-                        "node_id": node_id,
-                        "name": component_name,
-                        "success": False,
-                        "error": component_details.get("error", "No se pudieron obtener los detalles del componente")
-                    })
-                    continue
-                    
-                # Generar el código con Claude AI
-                print(f"🤖 Generando código para el componente {component_name}...")
-                generation_result = await claude_service.generate_component_code(component_details.get("frame", {}))
-                
-                if not generation_result.get("success", False):
-                    results.append({
-                        "node_id": node_id,
-                        "name": component_name,
-                        "success": False,
-                        "error": generation_result.get("error", "Error generando el código del componente"),
-                        "rate_limited": generation_result.get("rate_limited", False)
-                    })
-                    continue
-                
-                # Verificar que todos los bloques de código se generaron
-                missing_blocks = []
-                if not generation_result.get("html_code"):
-                    missing_blocks.append("HTML")
-                if not generation_result.get("css_code"):
-                    missing_blocks.append("CSS")
-                if not generation_result.get("stencil_code"):
-                    missing_blocks.append("Stencil Component (TSX)")
-                
-                # Si falta algún bloque, agregarlo como advertencia pero continuar
-                warning = None
-                if missing_blocks:
-                    warning = f"Los siguientes bloques de código no fueron generados: {', '.join(missing_blocks)}"
-                
-                # Agregar resultado exitoso
-                results.append({
-                    "node_id": node_id,
-                    "name": component_name,
-                    "success": True,
-                    "warning": warning,
-                    "html_code": generation_result.get("html_code"),
-                    "css_code": generation_result.get("css_code"),
-                    "stencil_code": generation_result.get("stencil_code"),
-                    "storybook_code": generation_result.get("storybook_code"),
-                    "image_url": component_details.get("frame", {}).get("image_url"),
-                    "props": generation_result.get("props"),
-                    "component_name": generation_result.get("component_name")
-                })
-                
-            except Exception as component_error:
-                print(f"❌ Error procesando componente {component_name}: {str(component_error)}")
-                results.append({
-                    "node_id": node_id,
-                    "name": component_name,
-                    "success": False,
-                    "error": str(component_error)
-                })
+            logger.info("🔧 Usando modelo configurado manualmente: %s", claude_service.model)
+        
+        batch = BatchGeneration.from_request(figma_client, claude_service, file_key, request_data)
+        
+        # Etapa 1: detalles y renders de todos los componentes con pocas peticiones a Figma
+        node_ids = [component.get("node_id") for component in components if component.get("node_id")]
+        prepared = await batch.prepare(node_ids)
+        if not prepared["success"]:
+            raise HTTPException(status_code=500, detail=prepared["error"])
+        
+        # Etapa 2: procesar todos los componentes en paralelo; gather conserva el orden de entrada
+        outcomes = await asyncio.gather(
+            *(batch.process(component) for component in components),
+            return_exceptions=True
+        )
+        results = [
+            failed_component(component, outcome) if isinstance(outcome, BaseException) else outcome
+            for component, outcome in zip(components, outcomes)
+        ]
         
-        # Contar éxitos y errores
-        success_count = len([r for r in results if r.get("success")])
-        error_count = len(results) - success_count
+        summary = batch.summary(results)
+        logger.info("⏱️ Lote de %s componentes completado en %s ms", len(results), summary['timings']['wall_ms'])
         
         return {
             "status": "success",
-            "total": len(results),
-            "success_count": success_count,
-            "error_count": error_count,
+            "total": summary["total"],
+            "success_count": summary["success_count"],
+            "error_count": summary["error_count"],
+            "skipped_count": summary["skipped_count"],
+            "version": summary["version"],
             "results": results,
+            "timings": summary["timings"],
+            "usage": summary["usage"],
             "timestamp": "2025-08-21 10:45:30"
         }
             
@@ -841,10 +1286,112 @@ async def generate_multiple_components(request_data: dict):
         # Propagar errores HTTP ya formateados
         raise http_err
     except Exception as e:
-        print(f"❌ Error en generate-multiple-components: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("❌ Error en generate-multiple-components: %s", e)
         
         # Proporcionar mensaje de error más amigable
         user_message = "Ha ocurrido un error al procesar tu solicitud. Por favor, intenta con un componente más simple o contacta al administrador."
         raise HTTPException(status_code=500, detail=f"Error al generar los componentes: {str(e)}")
+
+
+# Segundos sin eventos tras los que el stream de un trabajo envía un comentario
+# para que proxies y navegadores no den la conexión por muerta
+JOB_EVENTS_HEARTBEAT_SECONDS = float(os.getenv("JOBS_SSE_HEARTBEAT_SECONDS", "15"))
+
+@app.post("/figma/jobs")
+async def create_generation_job(request_data: dict):
+    """Encolar la generación de varios componentes como trabajo en segundo plano
+
+    Mismo cuerpo que /figma/generate-multiple-components; responde al momento
+    con el id del trabajo. El progreso se sigue en /figma/jobs/{job_id}/events
+    (SSE) o consultando /figma/jobs/{job_id}.
+    """
+    try:
+        file_key = request_data.get("file_key")
+        components = request_data.get("components", [])
+        
+        if not file_key:
+            raise HTTPException(status_code=400, detail="Se requiere el file_key del archivo de Figma")
+        
+        if not components or not isinstance(components, list) or len(components) == 0:
+            raise HTTPException(status_code=400, detail="Se requiere una lista de componentes para generar")
+        
+        if not os.getenv("FIGMA_ACCESS_TOKEN") or not os.getenv("CLAUDE_API_KEY"):
+            raise HTTPException(status_code=500, detail="❌ Tokens de Figma y Claude requeridos")
+        
+        options = {
+            key: request_data[key]
+            for key in ("force_regenerate", "figma_concurrency", "llm_concurrency", "since_version")
+            if request_data.get(key) is not None
+        }
+        components = [{"node_id": c.get("node_id"), "name": c.get("name", "Unknown Component")} for c in components]
+        job = await job_manager.submit(file_key, components, options)
+        job_id = job["job_id"]
+        
+        return {
+            "status": "success",
+            "data": dict(
+                job,
+                poll_url=f"/figma/jobs/{job_id}",
+                events_url=f"/figma/jobs/{job_id}/events"
+            ),
+            "timestamp": "2025-08-21 10:45:30"
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("❌ Error creando el trabajo de generación: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error al crear el trabajo: {str(e)}")
+
+@app.get("/figma/jobs/{job_id}")
+async def get_generation_job(job_id: str, include_results: bool = True):
+    """Estado, progreso y resultados (ya generados) de un trabajo"""
+    job = await job_manager.get(job_id, include_results=include_results)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado")
+    return {
+        "status": "success",
+        "data": job,
+        "timestamp": "2025-08-21 10:45:30"
+    }
+
+@app.get("/figma/jobs/{job_id}/events")
+async def generation_job_events(job_id: str):
+    """Progreso de un trabajo en Server-Sent Events
+
+    Eventos: `job` (estado completo al conectar, con los resultados ya
+    generados), `item` (un componente empieza o termina) y `done` (fin del
+    trabajo con su resumen). Al reconectar se vuelve a recibir el estado
+    completo, así que no se pierden componentes.
+    """
+    from app.jobs.store import FINISHED_JOB_STATES
+    
+    # Suscribirse antes de leer el estado para no perder eventos entre medias
+    queue = job_manager.subscribe(job_id)
+    job = await job_manager.get(job_id)
+    if job is None:
+        job_manager.unsubscribe(job_id, queue)
+        raise HTTPException(status_code=404, detail=f"Trabajo {job_id} no encontrado")
+    
+    async def events():
+        try:
+            yield _sse("job", job)
+            if job["status"] in FINISHED_JOB_STATES:
+                yield _sse("done", dict(job.get("summary") or {}, job_id=job_id, status=job["status"], error=job.get("error")))
+                return
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=JOB_EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(event, data)
+                if event == "done":
+                    return
+        finally:
+            job_manager.unsubscribe(job_id, queue)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
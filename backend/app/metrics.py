@@ -0,0 +1,223 @@
+import bisect
+import re
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Límites (segundos) de los histogramas de latencia: de respuestas en caché a llamadas largas al LLM
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Starlette añade "; charset=utf-8"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> [cuenta por bucket (no acumulada, último = +Inf), suma]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Métricas del proceso en formato de texto de Prometheus
+
+    Registrar una observación es una búsqueda en un diccionario y una suma
+    (todo ocurre en el bucle de eventos, sin bloqueos). Lo que ya se cuenta
+    en otros módulos (cachés, pools) no se duplica: se lee de sus
+    `get_stats()` con colectores que sólo se ejecutan al pedir /metrics.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[_Metric]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, collect: Callable[[], Iterable[_Metric]]):
+        self._collectors.append(collect)
+        return collect
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collect in self._collectors:
+            try:
+                for metric in collect():
+                    lines.extend(metric.render())
+            except Exception:
+                # Un colector roto no debe dejar sin métricas al resto
+                continue
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+http_requests = metrics.counter("http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status"))
+http_latency = metrics.histogram("http_request_duration_seconds", "Duración de las peticiones HTTP (incluye el cuerpo en streaming)", ("method", "route"))
+http_in_flight = metrics.gauge("http_requests_in_flight", "Peticiones HTTP en curso")
+
+figma_calls = metrics.counter("figma_requests_total", "Peticiones a la API de Figma por endpoint y estado (cada intento cuenta)", ("endpoint", "status"))
+figma_latency = metrics.histogram("figma_request_duration_seconds", "Duración de las peticiones a Figma hasta leer la respuesta", ("endpoint",))
+figma_in_flight = metrics.gauge("figma_requests_in_flight", "Peticiones a Figma en curso")
+
+claude_calls = metrics.counter("claude_requests_total", "Llamadas a la API de Claude por modelo y resultado", ("model", "status"))
+claude_latency = metrics.histogram("claude_request_duration_seconds", "Duración de las llamadas a Claude (sin la espera de admisión)", ("model",))
+claude_in_flight = metrics.gauge("claude_requests_in_flight", "Llamadas a Claude en curso")
+claude_tokens = metrics.counter("claude_tokens_total", "Tokens de Claude según response.usage", ("model", "type"))
+
+# Segmentos variables de las rutas de Figma (claves de archivo, ids de equipo o proyecto)
+_FIGMA_ID_SEGMENT = re.compile(r"/(files|images|teams|projects|components|styles)/[^/]+")
+
+
+def figma_endpoint(url: str) -> str:
+    """Ruta de Figma sin identificadores, p. ej. /v1/files/:id/nodes"""
+    return _FIGMA_ID_SEGMENT.sub(r"/\1/:id", urlsplit(url).path)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latencia, estado y peticiones en curso por ruta de FastAPI
+
+    La etiqueta `route` es la plantilla de la ruta (`/figma/jobs/{job_id}`), no
+    la URL, para que los ids no disparen la cardinalidad.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._routes: Optional[Dict[Callable, str]] = None
+
+    def _route_for(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._routes is None or endpoint not in self._routes:
+            app = scope.get("app")
+            self._routes = {
+                getattr(route, "endpoint", None): route.path
+                for route in getattr(app, "routes", [])
+                if hasattr(route, "path")
+            }
+        return self._routes.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = ["500"]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        started = time.perf_counter()
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_flight.dec()
+            route = self._route_for(scope)
+            http_latency.observe(time.perf_counter() - started, scope["method"], route)
+            http_requests.inc(scope["method"], route, status[0])
@@ -0,0 +1,286 @@
+import math
+import threading
+from array import array
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+# Códigos de tipo de nodo; los tipos nuevos que devuelva la API se añaden al vuelo
+NODE_TYPES: List[Optional[str]] = [
+    "DOCUMENT", "CANVAS", "FRAME", "GROUP", "SECTION", "COMPONENT", "COMPONENT_SET", "INSTANCE",
+    "TEXT", "RECTANGLE", "ELLIPSE", "LINE", "VECTOR", "BOOLEAN_OPERATION", "STAR", "REGULAR_POLYGON",
+    "SLICE", "STICKY", "SHAPE_WITH_TEXT", "CONNECTOR", "TABLE", "TABLE_CELL", "WIDGET", "EMBED",
+]
+_TYPE_CODES: Dict[Optional[str], int] = {name: code for code, name in enumerate(NODE_TYPES)}
+# Los árboles se construyen en el event loop y en hilos (índices del documento)
+_TYPE_CODES_LOCK = threading.Lock()
+
+# Campos que no se copian a `props`: la estructura va en columnas y la geometría
+# (trazados, transformaciones) y los datos de prototipo/plugins no se usan al generar código
+_COLUMN_FIELDS = {"id", "name", "type", "children", "absoluteBoundingBox"}
+_DROPPED_FIELDS = {
+    "absoluteRenderBounds", "relativeTransform", "size", "fillGeometry", "strokeGeometry",
+    "vectorNetwork", "vectorPaths", "pluginData", "sharedPluginData", "exportSettings",
+    "interactions", "reactions", "transitionNodeID", "transitionDuration", "transitionEasing",
+    "prototypeDevice", "flowStartingPoints", "prototypeStartNodeID", "characterStyleOverrides",
+    "styleOverrideTable", "lineTypes", "lineIndentations",
+}
+_SKIPPED_FIELDS = _COLUMN_FIELDS | _DROPPED_FIELDS
+
+_NAN = float("nan")
+_MISSING = object()
+
+
+def type_code(name: Optional[str]) -> int:
+    code = _TYPE_CODES.get(name)
+    if code is None:
+        with _TYPE_CODES_LOCK:
+            # Otro hilo puede haber registrado el tipo mientras se esperaba el lock
+            code = _TYPE_CODES.get(name)
+            if code is None:
+                NODE_TYPES.append(name)
+                code = _TYPE_CODES[name] = len(NODE_TYPES) - 1
+    return code
+
+
+class NodeTree:
+    """Árbol de nodos de Figma en columnas, en preorden
+
+    Cada nodo es un índice: el subárbol de `i` ocupa los índices `[i, ends[i])`,
+    así contar descendientes, saltar un subárbol oculto o calcular profundidades
+    no requiere recursión. Las columnas numéricas son `array` (tipo, padre, fin
+    del subárbol, profundidad, visibilidad y bounding boxes en floats) y el
+    resto de propiedades de cada nodo se guarda en un diccionario plano sin
+    hijos ni geometría (`props`, None si no queda nada).
+
+    Se construye desde el JSON de la API en una pasada (`from_json`) y no crea
+    un objeto por nodo: `Node` es una vista que se crea sólo al pedirla.
+    """
+
+    __slots__ = ("ids", "names", "types", "parents", "ends", "depths", "hidden", "boxes", "props", "truncated", "_index")
+
+    def __init__(self):
+        self.ids: List[Optional[str]] = []
+        self.names: List[Optional[str]] = []
+        self.types = array("H")
+        self.parents = array("i")
+        self.ends = array("i")
+        self.depths = array("H")
+        self.hidden = array("b")
+        self.boxes = array("d")
+        self.props: List[Optional[Dict[str, Any]]] = []
+        # Índices de nodos cuyos hijos no se cargaron por `max_depth`
+        self.truncated: List[int] = []
+        self._index: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_json(cls, root: Dict[str, Any], max_depth: Optional[int] = None, fields: Optional[Iterable[str]] = None) -> "NodeTree":
+        """Construir el árbol desde un nodo del JSON de Figma
+
+        Con `max_depth` sólo se cargan esos niveles por debajo de la raíz (p. ej.
+        2 para páginas y frames de un documento). Con `fields` sólo se copian
+        esos campos a `props` (p. ej. un índice que sólo necesita la estructura).
+        """
+        kept = None if fields is None else tuple(fields)
+        tree = cls()
+        ids, names, types, parents, depths, hidden, boxes, props = (
+            tree.ids, tree.names, tree.types, tree.parents, tree.depths, tree.hidden, tree.boxes, tree.props
+        )
+        stack: List[Tuple[Any, int, int]] = [(root, -1, 0)]
+        while stack:
+            node, parent, depth = stack.pop()
+            if not isinstance(node, dict):
+                continue
+            index = len(ids)
+            ids.append(node.get("id"))
+            names.append(node.get("name"))
+            types.append(type_code(node.get("type")))
+            parents.append(parent)
+            depths.append(depth)
+            hidden.append(1 if node.get("visible") is False else 0)
+            box = node.get("absoluteBoundingBox") or {}
+            for field in ("x", "y", "width", "height"):
+                value = box.get(field)
+                boxes.append(_NAN if value is None else value)
+            if kept is None:
+                own = {key: value for key, value in node.items() if key not in _SKIPPED_FIELDS}
+            else:
+                own = {key: node[key] for key in kept if key in node}
+            props.append(own or None)
+            children = node.get("children")
+            if children:
+                if max_depth is not None and depth >= max_depth:
+                    tree.truncated.append(index)
+                    continue
+                stack.extend((child, index, depth + 1) for child in reversed(children))
+
+        # Tamaño de cada subárbol sumando de las hojas hacia la raíz (preorden: hijos después del padre)
+        sizes = array("i", [1]) * len(ids)
+        for index in range(len(ids) - 1, 0, -1):
+            sizes[parents[index]] += sizes[index]
+        tree.ends = array("i", (index + size for index, size in enumerate(sizes)))
+        return tree
+
+    @classmethod
+    def of(cls, value: Any) -> "NodeTree":
+        # Aceptar un árbol ya construido o un nodo del JSON
+        return value if isinstance(value, NodeTree) else cls.from_json(value or {})
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # --- Acceso ----------------------------------------------------------------
+
+    @property
+    def root(self) -> "Node":
+        return Node(self, 0)
+
+    def node(self, index: int) -> "Node":
+        return Node(self, index)
+
+    def type_of(self, index: int) -> Optional[str]:
+        return NODE_TYPES[self.types[index]]
+
+    def box(self, index: int) -> Optional[Dict[str, float]]:
+        """absoluteBoundingBox como diccionario (sólo los campos presentes en el JSON)"""
+        values = self.boxes[index * 4:index * 4 + 4]
+        box = {field: value for field, value in zip(("x", "y", "width", "height"), values) if not math.isnan(value)}
+        return box or None
+
+    def get(self, index: int, field: str, default: Any = None) -> Any:
+        props = self.props[index]
+        if props is None:
+            return default
+        return props.get(field, default)
+
+    def find(self, node_id: str) -> Optional[int]:
+        """Índice de un nodo por id (el índice por id se crea la primera vez)"""
+        if self._index is None:
+            self._index = {node_id: index for index, node_id in enumerate(self.ids)}
+        return self._index.get(node_id)
+
+    # --- Recorridos --------------------------------------------------------------
+
+    def children(self, index: int = 0) -> Iterator[int]:
+        """Hijos directos: el primero es index + 1 y cada hermano empieza donde acaba el anterior"""
+        child, end, ends = index + 1, self.ends[index], self.ends
+        while child < end:
+            yield child
+            child = ends[child]
+
+    def has_children(self, index: int) -> bool:
+        return self.ends[index] > index + 1
+
+    def subtree_size(self, index: int = 0) -> int:
+        return self.ends[index] - index
+
+    def max_depth(self, index: int = 0) -> int:
+        """Niveles del subárbol (1 para una hoja)"""
+        return max(self.depths[index:self.ends[index]]) - self.depths[index] + 1
+
+    def walk(self, index: int = 0, max_depth: Optional[int] = None, skip_hidden: bool = False) -> Iterator[int]:
+        """Índices del subárbol en preorden, saltando subárboles ocultos o demasiado profundos"""
+        end, ends, depths, hidden = self.ends[index], self.ends, self.depths, self.hidden
+        limit = None if max_depth is None else depths[index] + max_depth
+        current = index
+        while current < end:
+            if skip_hidden and hidden[current]:
+                current = ends[current]
+                continue
+            yield current
+            if limit is not None and depths[current] >= limit:
+                current = ends[current]
+            else:
+                current += 1
+
+    def of_type(self, *type_names: str, index: int = 0) -> Iterator[int]:
+        codes = {type_code(name) for name in type_names}
+        types = self.types
+        return (current for current in range(index, self.ends[index]) if types[current] in codes)
+
+    def ancestors(self, index: int) -> Iterator[int]:
+        parent = self.parents[index]
+        while parent >= 0:
+            yield parent
+            parent = self.parents[parent]
+
+    def to_dict(self, index: int = 0, max_depth: Optional[int] = None) -> Dict[str, Any]:
+        """Reconstruir el nodo como JSON de Figma (sin los campos descartados)"""
+        node: Dict[str, Any] = {"id": self.ids[index], "name": self.names[index], "type": self.type_of(index)}
+        box = self.box(index)
+        if box is not None:
+            node["absoluteBoundingBox"] = box
+        if self.props[index]:
+            node.update(self.props[index])
+        if self.has_children(index) and (max_depth is None or max_depth > 0):
+            child_depth = None if max_depth is None else max_depth - 1
+            node["children"] = [self.to_dict(child, child_depth) for child in self.children(index)]
+        return node
+
+
+class Node:
+    """Vista de un nodo de un NodeTree con la misma interfaz de lectura que el dict del JSON
+
+    `node.get("fills")`, `node.get("absoluteBoundingBox")` o `node.get("children")`
+    devuelven lo mismo que en el JSON, así el código que lee nodos sirve para ambos.
+    """
+
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree: NodeTree, index: int):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def id(self) -> Optional[str]:
+        return self.tree.ids[self.index]
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.tree.names[self.index]
+
+    @property
+    def type(self) -> Optional[str]:
+        return NODE_TYPES[self.tree.types[self.index]]
+
+    @property
+    def visible(self) -> bool:
+        return not self.tree.hidden[self.index]
+
+    @property
+    def children(self) -> List["Node"]:
+        return [Node(self.tree, child) for child in self.tree.children(self.index)]
+
+    @property
+    def parent(self) -> Optional["Node"]:
+        parent = self.tree.parents[self.index]
+        return Node(self.tree, parent) if parent >= 0 else None
+
+    def get(self, field: str, default: Any = None) -> Any:
+        props = self.tree.props[self.index]
+        if props is not None:
+            value = props.get(field, _MISSING)
+            if value is not _MISSING:
+                return value
+        column = _COLUMN_GETTERS.get(field)
+        if column is None:
+            return default
+        value = column(self)
+        return default if value is None else value
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, Node) and other.tree is self.tree and other.index == self.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.tree), self.index))
+
+    def __repr__(self) -> str:
+        return f"Node({self.id!r}, {self.type}, {self.name!r})"
+
+
+# Campos del JSON que viven en columnas y no en `props`
+_COLUMN_GETTERS = {
+    "id": lambda node: node.id,
+    "name": lambda node: node.name,
+    "type": lambda node: node.type,
+    "absoluteBoundingBox": lambda node: node.tree.box(node.index),
+    "children": lambda node: node.children if node.tree.has_children(node.index) else None,
+}
@@ -0,0 +1,253 @@
+"""Benchmark: árbol de nodos como dicts del JSON vs NodeTree (app/models/nodes.py)
+
+Genera un frame sintético del tamaño de una página real de un sistema de
+diseño (~40k nodos por defecto: auto-layout, textos, instancias, vectores con
+geometría, transformaciones y ajustes de exportación) y mide:
+
+- memoria retenida por el árbol (tracemalloc) y tiempo de construcción
+- recorridos habituales: contar nodos, profundidad, buscar por id, nodos por
+  tipo, recorrido saltando subárboles ocultos y tamaño de todos los subárboles
+- los consumidores reales: distill_frame (prompt) y el generador por reglas
+
+Uso:
+    python bench_nodes.py
+    python bench_nodes.py --nodes 100000
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.abspath("."))
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+
+def build_fixture(target_nodes: int, seed: int = 7) -> dict:
+    """Frame con secciones de tarjetas y listas como las de un archivo real"""
+    rng = random.Random(seed)
+    counter = [0]
+
+    def next_id() -> str:
+        counter[0] += 1
+        return f"{counter[0] // 1000}:{counter[0] % 1000}"
+
+    def color() -> dict:
+        return {"r": rng.random(), "g": rng.random(), "b": rng.random(), "a": 1}
+
+    def base(node_type: str, name: str, x: float, y: float, w: float, h: float) -> dict:
+        return {
+            "id": next_id(),
+            "name": name,
+            "type": node_type,
+            "scrollBehavior": "SCROLLS",
+            "blendMode": "PASS_THROUGH",
+            "absoluteBoundingBox": {"x": x, "y": y, "width": w, "height": h},
+            "absoluteRenderBounds": {"x": x, "y": y, "width": w, "height": h},
+            "relativeTransform": [[1, 0, x], [0, 1, y]],
+            "size": {"x": w, "y": h},
+            "constraints": {"vertical": "TOP", "horizontal": "LEFT"},
+            "effects": [],
+            "interactions": [],
+        }
+
+    def text(name: str, characters: str, x: float, y: float) -> dict:
+        node = base("TEXT", name, x, y, 8.0 * len(characters), 20.0)
+        node.update({
+            "characters": characters,
+            "fills": [{"blendMode": "NORMAL", "type": "SOLID", "color": color()}],
+            "strokes": [],
+            "strokeWeight": 1,
+            "strokeAlign": "OUTSIDE",
+            "style": {
+                "fontFamily": "Inter", "fontPostScriptName": "Inter-Medium", "fontWeight": 500,
+                "textAutoResize": "WIDTH_AND_HEIGHT", "fontSize": 14, "textAlignHorizontal": "LEFT",
+                "textAlignVertical": "TOP", "letterSpacing": 0, "lineHeightPx": 20, "lineHeightPercent": 100,
+                "lineHeightUnit": "INTRINSIC_%",
+            },
+            "characterStyleOverrides": [0] * len(characters),
+            "styleOverrideTable": {},
+            "lineTypes": ["NONE"],
+            "lineIndentations": [0],
+            "layoutAlign": "INHERIT",
+            "layoutGrow": 0,
+        })
+        return node
+
+    def vector(x: float, y: float) -> dict:
+        node = base("VECTOR", "Vector", x, y, 16.0, 16.0)
+        node.update({
+            "fills": [{"blendMode": "NORMAL", "type": "SOLID", "color": color()}],
+            "fillGeometry": [{"path": "M2 8L6 12L14 4L12.6 2.6L6 9.2L3.4 6.6L2 8Z", "windingRule": "NONZERO"}],
+            "strokeGeometry": [],
+            "strokes": [],
+            "strokeWeight": 1.5,
+            "strokeAlign": "CENTER",
+        })
+        return node
+
+    def instance(name: str, x: float, y: float) -> dict:
+        node = base("INSTANCE", name, x, y, 16.0, 16.0)
+        node.update({
+            "componentId": f"{rng.randint(1, 400)}:{rng.randint(1, 999)}",
+            "componentProperties": {"Size": {"type": "VARIANT", "value": "Small"}},
+            "overrides": [],
+            "fills": [],
+            "children": [vector(x, y)],
+        })
+        return node
+
+    def card(x: float, y: float) -> dict:
+        node = base("FRAME", "Card", x, y, 320.0, 180.0)
+        node.update({
+            "layoutMode": "VERTICAL", "itemSpacing": 8, "paddingLeft": 16, "paddingRight": 16,
+            "paddingTop": 16, "paddingBottom": 16, "primaryAxisSizingMode": "AUTO", "counterAxisSizingMode": "FIXED",
+            "fills": [{"blendMode": "NORMAL", "type": "SOLID", "color": {"r": 1, "g": 1, "b": 1, "a": 1}}],
+            "strokes": [{"blendMode": "NORMAL", "type": "SOLID", "color": color()}],
+            "strokeWeight": 1, "strokeAlign": "INSIDE", "cornerRadius": 12, "clipsContent": True,
+            "effects": [{"type": "DROP_SHADOW", "visible": True, "color": {"r": 0, "g": 0, "b": 0, "a": 0.12},
+                         "blendMode": "NORMAL", "offset": {"x": 0, "y": 2}, "radius": 8, "spread": 0}],
+            "exportSettings": [{"suffix": "", "format": "PNG", "constraint": {"type": "SCALE", "value": 2}}],
+        })
+        header = base("FRAME", "Header", x + 16, y + 16, 288.0, 24.0)
+        header.update({"layoutMode": "HORIZONTAL", "itemSpacing": 8, "counterAxisAlignItems": "CENTER", "fills": [],
+                       "children": [instance("Icon", x + 16, y + 20), text("Title", "Saldo disponible", x + 40, y + 16)]})
+        rows = []
+        for row in range(rng.randint(2, 5)):
+            row_node = base("FRAME", "Row", x + 16, y + 48 + row * 28, 288.0, 24.0)
+            row_node.update({
+                "layoutMode": "HORIZONTAL", "primaryAxisAlignItems": "SPACE_BETWEEN", "fills": [],
+                "visible": rng.random() > 0.1,
+                "children": [text("Label", "Movimiento", x + 16, y + 48), text("Amount", "-12,50 €", x + 240, y + 48)],
+            })
+            rows.append(row_node)
+        node["children"] = [header] + rows
+        return node
+
+    frame = base("FRAME", "Design system page", 0.0, 0.0, 1440.0, 0.0)
+    frame.update({"layoutMode": "VERTICAL", "itemSpacing": 32, "fills": [], "children": []})
+    y = 0.0
+    while counter[0] < target_nodes:
+        section = base("FRAME", "Section", 0.0, y, 1440.0, 400.0)
+        section.update({"layoutMode": "HORIZONTAL", "layoutWrap": "WRAP", "itemSpacing": 24, "counterAxisSpacing": 24,
+                        "fills": [], "children": [card(24 + i * 344, y) for i in range(12)]})
+        frame["children"].append(section)
+        y += 432
+    frame["absoluteBoundingBox"]["height"] = y
+    return frame
+
+
+def _retained(build) -> tuple:
+    """(resultado, bytes retenidos, segundos) de construir un objeto"""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, elapsed
+
+
+def _best(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+# --- Recorridos sobre dicts (como se hacía hasta ahora) ------------------------
+
+def _dict_count(node: dict) -> int:
+    return 1 + sum(_dict_count(child) for child in node.get("children", []) or [])
+
+
+def _dict_depth(node: dict) -> int:
+    return 1 + max((_dict_depth(child) for child in node.get("children", []) or []), default=0)
+
+
+def _dict_find(node: dict, node_id: str):
+    if node.get("id") == node_id:
+        return node
+    for child in node.get("children", []) or []:
+        found = _dict_find(child, node_id)
+        if found is not None:
+            return found
+    return None
+
+
+def _dict_of_type(node: dict, node_type: str, found: list):
+    if node.get("type") == node_type:
+        found.append(node)
+    for child in node.get("children", []) or []:
+        _dict_of_type(child, node_type, found)
+    return found
+
+
+def _dict_visible(node: dict) -> int:
+    if node.get("visible") is False:
+        return 0
+    return 1 + sum(_dict_visible(child) for child in node.get("children", []) or [])
+
+
+def _dict_subtree_sizes(node: dict) -> int:
+    # Tamaño del subárbol de cada nodo (p. ej. "omitted_descendants" al recortar)
+    return _dict_count(node) + sum(_dict_subtree_sizes(child) for child in node.get("children", []) or [])
+
+
+def main(target_nodes: int):
+    from app.claude.distiller import distill_frame
+    from app.generators.stencil import generate_stencil_component
+    from app.models.nodes import NodeTree
+
+    sys.setrecursionlimit(10000)
+    raw = json.dumps(build_fixture(target_nodes))
+    print(f"🧪 Fixture: {len(raw) / 1024 / 1024:.1f} MB de JSON")
+
+    frame, dict_bytes, dict_seconds = _retained(lambda: json.loads(raw))
+    tree, tree_bytes, tree_seconds = _retained(lambda: NodeTree.from_json(json.loads(raw)))
+    nodes = len(tree)
+    last_id = tree.ids[-1]
+
+    print(f"\n📦 Memoria retenida ({nodes} nodos):")
+    print(f"   dict JSON : {dict_bytes / 1024 / 1024:7.1f} MB | json.loads {dict_seconds * 1000:7.1f} ms")
+    print(f"   NodeTree  : {tree_bytes / 1024 / 1024:7.1f} MB | json.loads + from_json {tree_seconds * 1000:7.1f} ms "
+          f"({tree_bytes / dict_bytes:.0%} del dict)")
+
+    checks = [
+        ("contar nodos", lambda: _dict_count(frame), lambda: len(tree)),
+        ("profundidad", lambda: _dict_depth(frame), lambda: tree.max_depth()),
+        ("buscar id (índice ya creado)", lambda: _dict_find(frame, last_id)["id"], lambda: tree.ids[tree.find(last_id)]),
+        ("nodos TEXT", lambda: len(_dict_of_type(frame, "TEXT", [])), lambda: sum(1 for _ in tree.of_type("TEXT"))),
+        ("visibles", lambda: _dict_visible(frame), lambda: sum(1 for _ in tree.walk(skip_hidden=True))),
+        ("tamaño de subárboles", lambda: _dict_subtree_sizes(frame), lambda: sum(tree.subtree_size(i) for i in range(len(tree)))),
+    ]
+    print("\n🚶 Recorridos (mejor de 5):")
+    for label, with_dicts, with_tree in checks:
+        assert with_dicts() == with_tree(), f"{label}: resultados distintos"
+        dict_ms, tree_ms = _best(with_dicts) * 1000, _best(with_tree) * 1000
+        print(f"   {label:<28} dict {dict_ms:9.2f} ms | NodeTree {tree_ms:9.2f} ms | x{dict_ms / max(tree_ms, 1e-6):.1f}")
+
+    # Un frame de tamaño de componente para los consumidores (el preámbulo va aparte)
+    section = frame["children"][0]
+    section_tree = NodeTree.from_json(section)
+    print("\n⚙️  Consumidores sobre una sección ({} nodos):".format(len(section_tree)))
+    distill_dict_ms = _best(lambda: distill_frame({"raw_data": section}, 2000)) * 1000
+    generate_dict_ms = _best(lambda: generate_stencil_component({"name": "Section", "raw_data": section})) * 1000
+    generate_tree_ms = _best(lambda: generate_stencil_component({"name": "Section", "raw_data": section_tree})) * 1000
+    print(f"   distill_frame (construye el árbol)     {distill_dict_ms:8.2f} ms")
+    print(f"   generador por reglas desde JSON        {generate_dict_ms:8.2f} ms")
+    print(f"   generador por reglas desde NodeTree    {generate_tree_ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=40000)
+    args = parser.parse_args()
+    main(args.nodes)
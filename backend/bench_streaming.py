@@ -0,0 +1,155 @@
+"""Benchmark: parseo completo (response.text + json.loads) vs parseo en streaming
+
+Genera un documento sintético de Figma (~50 MB por defecto), lo sirve desde un
+servidor aiohttp local y mide, en un subproceso limpio por modo, el tiempo total
+y el pico de memoria residente (RSS) al extraer páginas y frames.
+
+Uso:
+    python bench_streaming.py            # 50 MB
+    python bench_streaming.py --mb 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath("."))
+
+
+def write_synthetic_document(path: str, target_mb: float):
+    """Escribir un documento con muchas páginas y frames profundos hasta alcanzar el tamaño pedido"""
+    target = int(target_mb * 1024 * 1024)
+
+    def vector(node_id: str) -> dict:
+        return {
+            "id": node_id,
+            "name": f"Vector {node_id}",
+            "type": "VECTOR",
+            "absoluteBoundingBox": {"x": 10.123456, "y": 20.654321, "width": 24.0, "height": 24.0},
+            "relativeTransform": [[1, 0, 10.123456], [0, 1, 20.654321]],
+            "fills": [{"type": "SOLID", "color": {"r": 0.12, "g": 0.34, "b": 0.56, "a": 1}}],
+            "fillGeometry": [{"path": "M0 0L24 0L24 24L0 24Z " * 8, "windingRule": "NONZERO"}],
+        }
+
+    def group(node_id: str, depth: int) -> dict:
+        if depth == 0:
+            return vector(node_id)
+        return {
+            "id": node_id,
+            "name": f"Group {node_id}",
+            "type": "GROUP",
+            "absoluteBoundingBox": {"x": 0, "y": 0, "width": 320, "height": 200},
+            "children": [group(f"{node_id}-{i}", depth - 1) for i in range(4)],
+        }
+
+    written = 0
+    with open(path, "w") as fh:
+        fh.write('{"name": "Synthetic DS", "version": "123456", "lastModified": "2025-08-16T06:54:39Z", '
+                 '"document": {"id": "0:0", "name": "Document", "type": "DOCUMENT", "children": [')
+        page = 0
+        while written < target:
+            frames = []
+            for f in range(20):
+                frame = group(f"{page}:{f}", 4)
+                frame.update({"type": "FRAME", "name": f"Frame {page}-{f}", "backgroundColor": {"r": 1, "g": 1, "b": 1, "a": 1}})
+                frames.append(frame)
+            chunk = json.dumps({"id": f"{page}:0", "name": f"Page {page}", "type": "CANVAS", "children": frames})
+            fh.write(("," if page else "") + chunk)
+            written += len(chunk)
+            page += 1
+        fh.write("]}}")
+
+
+def _rss_mb() -> float:
+    # ru_maxrss está en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _run_client(mode: str, url: str) -> dict:
+    import aiohttp
+    from app.figma.client import FigmaClient
+    from app.figma.streaming import parse_structure_stream
+
+    baseline = _rss_mb()
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            if mode == "full":
+                # Camino original de get_file_structure
+                text = await response.text()
+                data = json.loads(text)
+                pages = FigmaClient._extract_pages(data.get("document", {}))
+            else:
+                structure = await parse_structure_stream(response.content)
+                pages = structure["pages"]
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "seconds": round(elapsed, 3),
+        "peak_rss_mb": round(_rss_mb(), 1),
+        "peak_rss_delta_mb": round(_rss_mb() - baseline, 1),
+        "pages": len(pages),
+        "frames": sum(len(p["frames"]) for p in pages),
+    }
+
+
+async def _serve(path: str):
+    from aiohttp import web
+
+    async def handler(request):
+        return web.FileResponse(path)
+
+    app = web.Application()
+    app.router.add_get("/v1/files/bench", handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/v1/files/bench"
+
+
+async def _main(target_mb: float):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "document.json")
+        print(f"🧪 Generando documento sintético de ~{target_mb} MB...")
+        write_synthetic_document(path, target_mb)
+        print(f"📄 Tamaño real: {os.path.getsize(path) / 1024 / 1024:.1f} MB")
+
+        runner, url = await _serve(path)
+        try:
+            results = []
+            for mode in ("full", "stream"):
+                # Un subproceso por modo para que el pico de RSS no se contamine
+                proc = await asyncio.create_subprocess_exec(
+                    sys.executable, __file__, "--client", mode, "--url", url,
+                    stdout=subprocess.PIPE,
+                )
+                out, _ = await proc.communicate()
+                results.append(json.loads(out.decode().strip().splitlines()[-1]))
+        finally:
+            await runner.cleanup()
+
+    print("\n📊 Resultados:")
+    for r in results:
+        print(f"   {r['mode']:>6}: {r['seconds']:>7.3f}s | RSS pico {r['peak_rss_mb']:>7.1f} MB "
+              f"(+{r['peak_rss_delta_mb']} MB) | {r['pages']} páginas, {r['frames']} frames")
+    assert results[0]["frames"] == results[1]["frames"], "Los dos modos deben extraer los mismos frames"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=float, default=50)
+    parser.add_argument("--client", choices=["full", "stream"])
+    parser.add_argument("--url")
+    args = parser.parse_args()
+
+    if args.client:
+        print(json.dumps(asyncio.run(_run_client(args.client, args.url))))
+    else:
+        asyncio.run(_main(args.mb))
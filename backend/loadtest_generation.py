@@ -0,0 +1,191 @@
+"""Prueba de carga: ¿sigue respondiendo la API mientras Claude genera componentes?
+
+Levanta la app real con uvicorn junto a dos servidores falsos (Anthropic y
+Figma) en el mismo proceso. Lanza varias generaciones en paralelo contra
+/figma/generate-component y, mientras tanto, mide la latencia de /health.
+
+Con --mode sync se reproduce el comportamiento anterior (llamada bloqueante
+al SDK síncrono dentro del event loop) para comparar.
+
+Uso:
+    python loadtest_generation.py                 # cliente asíncrono
+    python loadtest_generation.py --mode sync     # comportamiento anterior
+    python loadtest_generation.py --requests 8 --llm-delay 2
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath("."))
+
+from aiohttp import web
+import aiohttp
+
+MODEL_TEXT = "```html\n<div class=\"card\"></div>\n```\n\n```css\n.card {}\n```\n\n```tsx\n// componente\n```\n"
+
+
+def _start_fakes_in_thread(llm_delay: float):
+    # Los servidores falsos corren en su propio hilo/event loop para que una llamada
+    # bloqueante en el loop de la app (modo sync) no los congele también
+    ready = threading.Event()
+    ports = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        async def start(name: str, app: web.Application):
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            ports[name] = site._server.sockets[0].getsockname()[1]
+
+        loop.run_until_complete(start("anthropic", _fake_anthropic(llm_delay)))
+        loop.run_until_complete(start("figma", _fake_figma()))
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return ports["anthropic"], ports["figma"]
+
+
+def _fake_anthropic(delay: float) -> web.Application:
+    async def messages(request):
+        body = await request.json()
+        await asyncio.sleep(delay)
+        return web.json_response({
+            "id": "msg_loadtest",
+            "type": "message",
+            "role": "assistant",
+            "model": body.get("model"),
+            "content": [{"type": "text", "text": MODEL_TEXT}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 1000, "output_tokens": 200},
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1/messages", messages)
+    return app
+
+
+def _fake_figma() -> web.Application:
+    async def nodes(request):
+        ids = request.query["ids"].split(",")
+        return web.json_response({"nodes": {
+            node_id: {"document": {"id": node_id, "name": f"Card {node_id}", "type": "FRAME",
+                                   "absoluteBoundingBox": {"width": 320, "height": 200}, "children": []}}
+            for node_id in ids
+        }})
+
+    async def images(request):
+        ids = request.query["ids"].split(",")
+        return web.json_response({"images": {node_id: f"https://example.invalid/{node_id}.png" for node_id in ids}})
+
+    app = web.Application()
+    app.router.add_get("/v1/files/{key}/nodes", nodes)
+    app.router.add_get("/v1/images/{key}", images)
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _use_blocking_sdk():
+    # Reproduce el comportamiento anterior: SDK síncrono llamado directamente en el event loop
+    import anthropic
+    from app.claude.pool import claude_pool
+
+    class BlockingMessages:
+        def __init__(self, client):
+            self._client = client
+
+        async def create(self, **kwargs):
+            return self._client.messages.create(**kwargs)
+
+    class BlockingClient:
+        def __init__(self, api_key):
+            self.messages = BlockingMessages(anthropic.Anthropic(api_key=api_key, max_retries=0))
+
+        async def close(self):
+            pass
+
+    claude_pool.get_client = lambda api_key: BlockingClient(api_key)
+
+
+async def _main(args):
+    anthropic_port, figma_port = _start_fakes_in_thread(args.llm_delay)
+    os.environ["ANTHROPIC_BASE_URL"] = f"http://127.0.0.1:{anthropic_port}"
+    os.environ["FIGMA_ACCESS_TOKEN"] = "loadtest-token"
+    os.environ["CLAUDE_API_KEY"] = "loadtest-key"
+
+    import uvicorn
+    from app.main import app
+    from app.figma.client import get_figma_client
+
+    if args.mode == "sync":
+        _use_blocking_sdk()
+    get_figma_client("loadtest-token").base_url = f"http://127.0.0.1:{figma_port}/v1"
+
+    port = args.port or _free_port()
+    config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    base = f"http://127.0.0.1:{port}"
+
+    health_latencies = []
+    generating = True
+
+    async with aiohttp.ClientSession() as session:
+        async def probe_health():
+            while generating:
+                started = time.perf_counter()
+                async with session.get(f"{base}/health") as response:
+                    await response.read()
+                health_latencies.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(0.05)
+
+        async def generate(i: int):
+            async with session.post(f"{base}/figma/generate-component",
+                                    json={"file_key": "LOADTEST", "frame_id": f"1:{i}"}) as response:
+                return response.status
+
+        probe = asyncio.create_task(probe_health())
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(generate(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+        generating = False
+        await probe
+
+    server.should_exit = True
+    await server_task
+
+    latencies = sorted(health_latencies)
+    print(f"\n📊 Modo: {args.mode} | {args.requests} generaciones en paralelo (latencia del modelo {args.llm_delay}s)")
+    print(f"   Estados HTTP de generación: {sorted(set(statuses))}")
+    print(f"   Tiempo total del lote: {elapsed:.2f}s")
+    print(f"   /health durante la generación: {len(latencies)} sondeos | "
+          f"p50 {statistics.median(latencies):.1f} ms | "
+          f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.1f} ms | "
+          f"máx {latencies[-1]:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=["async", "sync"], default="async")
+    parser.add_argument("--requests", type=int, default=6)
+    parser.add_argument("--llm-delay", type=float, default=1.5)
+    parser.add_argument("--port", type=int, default=0, help="0 = puerto libre")
+    asyncio.run(_main(parser.parse_args()))
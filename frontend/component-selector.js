@@ -26,7 +26,8 @@ async function fetchComponents() {
     componentGrid.style.display = 'none';
     
     try {
-        const response = await fetch(`${API_BASE}/figma/files/${currentFile.key}/components-with-thumbnails`);
+        // Miniaturas ligeras para la rejilla (escala 1 en jpg)
+        const response = await fetch(`${API_BASE}/figma/files/${currentFile.key}/components-with-thumbnails?scale=1&format=jpg`);
         if (!response.ok) {
             const errorText = await response.text();
             throw new Error(`Error ${response.status}: ${errorText}`);
@@ -113,7 +114,8 @@ function displayComponents(components) {
         
         // Agregar componentes individuales
         groupComponents.forEach(component => {
-            const hasImage = component.thumbnail_url ? true : false;
+            const thumbnailUrl = renderUrl(component.thumbnail_proxy_url, component.thumbnail_url);
+            const hasImage = thumbnailUrl ? true : false;
             const id = component.node_id;
             const isSelected = selectedComponents.includes(id);
             
@@ -125,7 +127,7 @@ function displayComponents(components) {
                     </div>
                     <div class="component-preview" onclick="toggleComponentSelection('${id}')">
                         ${hasImage 
-                            ? `<img src="${component.thumbnail_url}" alt="${component.name}" loading="lazy">` 
+                            ? `<img src="${thumbnailUrl}" alt="${component.name}" loading="lazy">` 
                             : `<div class="no-preview">Sin Vista Previa</div>`
                         }
                     </div>
@@ -279,8 +281,8 @@ async function generateSelectedComponents() {
             progressFill.style.width = `10%`; // Indicar que el proceso ha comenzado
             
             try {
-                // Llamar a la API para generar todos los componentes
-                const response = await fetch(`${API_BASE}/figma/generate-multiple-components`, {
+                // Crear un trabajo de generación: responde al momento y el progreso llega por SSE
+                const response = await fetch(`${API_BASE}/figma/jobs`, {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
@@ -291,41 +293,33 @@ async function generateSelectedComponents() {
                     })
                 });
                 
-                // Actualizar progreso a 80%
-                progressLabel.textContent = `Procesando respuesta...`;
-                progressFill.style.width = `80%`;
+                const jobResponse = await response.json();
+                if (jobResponse.status !== 'success') {
+                    throw new Error(jobResponse.detail || 'Error desconocido al crear el trabajo de generación');
+                }
                 
-                const batchResult = await response.json();
+                const job = await followGenerationJob(jobResponse.data, progressLabel, progressFill);
+                if (job.status === 'failed') {
+                    throw new Error(job.error || 'Error desconocido en la generación por lotes');
+                }
                 
                 // Actualizar progreso a 100%
                 progressLabel.textContent = `Completado!`;
                 progressFill.style.width = `100%`;
                 
-                if (batchResult.status === 'success') {
-                    // Mapear los resultados y mostrarlos
-                    const mappedResults = batchResult.results.map(result => ({
-                        name: result.name,
-                        node_id: result.node_id,
-                        success: result.success,
-                        error: result.error || (result.warning ? `Advertencia: ${result.warning}` : null),
-                        html_code: result.html_code,
-                        css_code: result.css_code,
-                        stencil_code: result.stencil_code,
-                        storybook_code: result.storybook_code,
-                        image_url: result.image_url,
-                        component_name: result.component_name,
-                        props: result.props,
-                        data: result
-                    }));
-                    
-                    // Mostrar resultados después de un breve retraso para que se vea la barra al 100%
-                    setTimeout(() => {
-                        showGenerationResults(mappedResults);
-                    }, 500);
-                    return;
-                } else {
-                    throw new Error(batchResult.detail || 'Error desconocido en la generación por lotes');
-                }
+                // Mapear los resultados (en el orden de la selección) y mostrarlos
+                const mappedResults = job.items.map(item => mapGenerationResult(item.result || {
+                    node_id: item.node_id,
+                    name: item.name,
+                    success: false,
+                    error: 'El componente no llegó a generarse'
+                }));
+                
+                // Mostrar resultados después de un breve retraso para que se vea la barra al 100%
+                setTimeout(() => {
+                    showGenerationResults(mappedResults);
+                }, 500);
+                return;
             } catch (error) {
                 console.error('Error en la generación por lotes:', error);
                 throw error; // Propagar el error para que se muestre en la UI
@@ -346,6 +340,105 @@ async function generateSelectedComponents() {
     }
 }
 
+// Preferir el proxy local de renders (cacheado en disco) a la URL de S3, que caduca
+function renderUrl(proxyUrl, fallbackUrl) {
+    return proxyUrl ? `${API_BASE}${proxyUrl}` : fallbackUrl;
+}
+
+// Convertir el resultado de un componente al formato que usa la vista de resultados
+function mapGenerationResult(result) {
+    return {
+        name: result.name,
+        node_id: result.node_id,
+        success: result.success,
+        error: result.error || (result.warning ? `Advertencia: ${result.warning}` : null),
+        html_code: result.html_code,
+        css_code: result.css_code,
+        stencil_code: result.stencil_code,
+        storybook_code: result.storybook_code,
+        image_url: renderUrl(result.image_proxy_url, result.image_url),
+        component_name: result.component_name,
+        props: result.props,
+        data: result
+    };
+}
+
+// Seguir el progreso de un trabajo de generación hasta que termine.
+// Usa el stream SSE del trabajo y, si no está disponible, consulta su estado cada pocos segundos.
+// Devuelve el trabajo final con los resultados de todos los componentes.
+function followGenerationJob(job, progressLabel, progressFill) {
+    const pollUrl = `${API_BASE}${job.poll_url}`;
+    
+    const updateProgress = (completed, total, text) => {
+        const percent = total ? Math.round((completed / total) * 100) : 0;
+        progressFill.style.width = `${Math.max(5, percent)}%`;
+        progressLabel.textContent = text || `Generados ${completed} de ${total} componentes...`;
+    };
+    
+    const fetchFinalJob = async () => {
+        const response = await fetch(pollUrl);
+        const result = await response.json();
+        if (result.status !== 'success') {
+            throw new Error(result.detail || 'No se pudo obtener el resultado del trabajo');
+        }
+        return result.data;
+    };
+    
+    const poll = async () => {
+        while (true) {
+            const current = await fetchFinalJob();
+            updateProgress(current.completed, current.total);
+            if (current.status === 'completed' || current.status === 'failed') {
+                return current;
+            }
+            await new Promise(resolve => setTimeout(resolve, 2000));
+        }
+    };
+    
+    updateProgress(0, job.total, `Trabajo en cola: 0 de ${job.total} componentes...`);
+    
+    if (typeof EventSource === 'undefined') {
+        return poll();
+    }
+    
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`${API_BASE}${job.events_url}`);
+        let finished = false;
+        
+        // Estado completo del trabajo (también al reconectar)
+        source.addEventListener('job', event => {
+            const data = JSON.parse(event.data);
+            updateProgress(data.completed || 0, data.total || job.total);
+        });
+        
+        // Un componente empieza o termina
+        source.addEventListener('item', event => {
+            const data = JSON.parse(event.data);
+            if (data.status === 'running') {
+                progressLabel.textContent = `Generando ${data.name}...`;
+            } else {
+                const icon = data.status === 'done' ? '✅' : '❌';
+                updateProgress(data.completed || 0, data.total || job.total, `${icon} ${data.name} (${data.completed} de ${data.total || job.total})`);
+            }
+        });
+        
+        source.addEventListener('done', () => {
+            finished = true;
+            source.close();
+            fetchFinalJob().then(resolve, reject);
+        });
+        
+        // Sin conexión con el stream: seguir consultando el estado del trabajo
+        source.onerror = () => {
+            if (finished) return;
+            console.warn('Stream de progreso no disponible, consultando el estado del trabajo');
+            finished = true;
+            source.close();
+            poll().then(resolve, reject);
+        };
+    });
+}
+
 // Función para mostrar los resultados de la generación
 function showGenerationResults(results) {
     const contentArea = document.getElementById('component-selector-content');